@@ -91,6 +91,28 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Cache
+# The analytics cache versions (touch_analytics), single-flight locks and cached
+# report versions are only invalidated across processes with a shared cache.
+# LocMemCache works out of the box but is per process (check gstbillingapp.W001
+# warns about it). For several workers, use Redis, or the DatabaseCache after
+# running: python manage.py createcachetable
+# The DatabaseCache writes to the same SQLite file as every model save, so it
+# adds write contention; prefer Redis when that matters.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        # Shared between processes, needs: python manage.py createcachetable
+        # 'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        # 'LOCATION': 'gstbilling_cache',
+        # 'OPTIONS': {
+        #     'MAX_ENTRIES': 100000,
+        # },
+        # For production, use Redis:
+        # 'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        # 'LOCATION': 'redis://127.0.0.1:6379/1',
+    },
+}
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
@@ -149,6 +171,13 @@ SOCIAL_AUTH_LOGIN_REDIRECT_URL = "/invoices/new"
 PRODUCT = "GSTSYNC"
 PRODUCT_PREFIX = "GS"
 
+# Invoice PDF cache (rendered PDFs keyed by invoice id + content hash)
+INVOICE_PDF_CACHE_DIR = os.path.join(BASE_DIR, 'invoice_pdf_cache')
+# Render invoice PDFs in a background thread right after creation
+INVOICE_PDF_PRERENDER = False
+# Upper bound for parallel PDF rendering in the invoice ZIP export
+INVOICE_EXPORT_MAX_WORKERS = 4
+
 # SOCIAL APP
 SOCIAL_AUTH_URL_NAMESPACE = 'social'
 AUTHENTICATION_BACKENDS = (
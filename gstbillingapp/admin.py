@@ -6,7 +6,7 @@ from .models import (
     BillingProfile, Inventory, InventoryLog, 
     BookLog, Book, PurchaseLog, VendorPurchase,
     ExpenseTracker, BankDetails, Notification,
-    ProductCategory, Quotation
+    ProductCategory, Quotation, DocumentSequence
 )
 
 # User and Billing Profile
@@ -22,6 +22,7 @@ admin.site.register(Customer)
 admin.site.register(Inventory)
 admin.site.register(PurchaseLog)
 admin.site.register(BankDetails)
+admin.site.register(DocumentSequence)
 
 # Quotation with custom admin
 @admin.register(Quotation)
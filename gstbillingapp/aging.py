@@ -0,0 +1,166 @@
+# Django imports
+from django.db import connection
+from django.db.models import Sum, Q, F, Case, When, Value, FloatField, Window, RowRange
+from django.db.models.functions import Abs
+from django.utils import timezone
+
+# Model imports
+from .models import BookLog, PurchaseLog
+
+
+AGING_BUCKETS = [
+    ('0-30', 0, 30),
+    ('31-60', 31, 60),
+    ('61-90', 61, 90),
+    ('90+', 91, None),
+]
+
+# Running totals within this of the credit count as fully settled
+AGING_TOLERANCE = 0.001
+
+
+# ================ FIFO Aging Methods ===========================
+def ledger_credits(queryset, partition=None):
+    """
+    Credit available to settle purchases: |paid| + |returned| + |others|
+    (change types 0, 2 and 3). One number, or a dict per partition field value.
+    """
+    sums = dict(
+        total_paid=Sum('change', filter=Q(change_type=0)),
+        total_returned=Sum('change', filter=Q(change_type=2)),
+        total_others=Sum('change', filter=Q(change_type=3)),
+    )
+
+    def credit(row):
+        return abs(row['total_paid'] or 0) + abs(row['total_returned'] or 0) + abs(row['total_others'] or 0)
+
+    if partition is None:
+        return credit(queryset.aggregate(**sums))
+    return {row[partition]: credit(row) for row in queryset.values(partition).annotate(**sums).order_by()}
+
+
+def _credit_for(credits, key):
+    return credits.get(key, 0) if isinstance(credits, dict) else credits
+
+
+def _running_debits_sql(debits, credits, partition, pending_only):
+    running_total = Window(
+        expression=Sum(Abs('change')),
+        partition_by=[F(partition)] if partition else None,
+        order_by=[F('date').asc(), F('id').asc()],
+        frame=RowRange(start=None, end=0),
+    )
+    debits = debits.annotate(running_total=running_total)
+    if pending_only:
+        if isinstance(credits, dict):
+            credit = Case(*[When(**{partition: key}, then=Value(float(value))) for key, value in credits.items()],
+                          default=Value(0.0), output_field=FloatField())
+        else:
+            credit = Value(float(credits), output_field=FloatField())
+        # Filtering on a window annotation: Django wraps the query, so only unpaid rows come back
+        debits = debits.annotate(credit=credit).filter(running_total__gt=F('credit') + AGING_TOLERANCE)
+    return list(debits.order_by(*([partition] if partition else []), 'date', 'id'))
+
+
+def _running_debits_python(debits, credits, partition, pending_only):
+    """Fallback for databases without window functions (SQLite < 3.25)"""
+    rows = []
+    running = {}
+    for row in debits.order_by(*([partition] if partition else []), 'date', 'id'):
+        key = getattr(row, partition) if partition else None
+        running[key] = running.get(key, 0) + row.amount_positive
+        row.running_total = running[key]
+        if not pending_only or row.running_total > _credit_for(credits, key) + AGING_TOLERANCE:
+            rows.append(row)
+    return rows
+
+
+def fifo_debits(queryset, credits, partition=None, pending_only=True, now=None):
+    """
+    Apply credits to the purchases (change_type=1) of queryset oldest first and return
+    the purchases, oldest first, each annotated with:
+      amount_positive, running_total, payment_pending, outstanding, overdue_days,
+      remaining_amount (credit left when the first unpaid purchase was reached)
+      and balance_after.
+    Running totals come from an SQL window, so with pending_only only the unpaid
+    rows are read. partition (e.g. 'parent_book_id') runs one FIFO per value, with
+    credits then a dict keyed by that value.
+    """
+    now = now or timezone.now()
+    debits = queryset.filter(change_type=1).annotate(amount_positive=Abs('change'))
+    if connection.features.supports_over_clause:
+        rows = _running_debits_sql(debits, credits, partition, pending_only)
+    else:
+        rows = _running_debits_python(debits, credits, partition, pending_only)
+
+    leftover = {}
+    for row in rows:
+        key = getattr(row, partition) if partition else None
+        credit = _credit_for(credits, key)
+        row.overdue_days = (now - row.date).days if row.date else 0
+        row.payment_pending = row.running_total > credit + AGING_TOLERANCE
+        if not row.payment_pending:
+            row.outstanding = 0
+            continue
+        # Credit left over once the covered purchases are paid, fixed at the first unpaid one
+        if key not in leftover:
+            leftover[key] = max(credit - (row.running_total - row.amount_positive), 0)
+        row.remaining_amount = leftover[key]
+        row.balance_after = abs(row.remaining_amount - row.amount_positive)
+        row.outstanding = min(row.amount_positive, row.running_total - credit)
+    return rows
+
+
+def aging_buckets(rows):
+    """Outstanding amount and count per 0-30 / 31-60 / 61-90 / 90+ day bucket"""
+    buckets = [{'bucket': label, 'amount': 0.0, 'count': 0} for label, _, _ in AGING_BUCKETS]
+    for row in rows:
+        if not getattr(row, 'payment_pending', False):
+            continue
+        for bucket, (_, low, high) in zip(buckets, AGING_BUCKETS):
+            if row.overdue_days >= low and (high is None or row.overdue_days <= high):
+                bucket['amount'] += row.outstanding
+                bucket['count'] += 1
+                break
+    for bucket in buckets:
+        bucket['amount'] = round(bucket['amount'], 2)
+    return buckets
+
+
+def _aging_report(queryset, partition=None):
+    credits = ledger_credits(queryset, partition)
+    rows = fifo_debits(queryset, credits, partition)
+    report = {
+        'outstanding': round(sum(row.outstanding for row in rows), 2),
+        'buckets': aging_buckets(rows),
+    }
+    if partition:
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(getattr(row, partition), []).append(row)
+        report['partitions'] = {
+            key: {'outstanding': round(sum(row.outstanding for row in group), 2), 'buckets': aging_buckets(group)}
+            for key, group in grouped.items()
+        }
+    return report
+
+
+# ================ Aging Report Methods ===========================
+def customer_aging(user, customer):
+    """Receivables aging of one customer's book"""
+    return _aging_report(BookLog.objects.filter(parent_book__user=user, parent_book__customer=customer, is_active=True))
+
+
+def vendor_aging(user, vendor):
+    """Payables aging of one vendor"""
+    return _aging_report(PurchaseLog.objects.filter(user=user, vendor=vendor))
+
+
+def receivables_aging(user):
+    """Receivables aging of every customer of a tenant, one FIFO per book"""
+    return _aging_report(BookLog.objects.filter(parent_book__user=user, is_active=True), 'parent_book_id')
+
+
+def payables_aging(user):
+    """Payables aging of every vendor of a tenant, one FIFO per vendor"""
+    return _aging_report(PurchaseLog.objects.filter(user=user), 'vendor_id')
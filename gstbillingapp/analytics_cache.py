@@ -0,0 +1,185 @@
+# Django imports
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+# Python imports
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+
+# Model imports
+from .models import analytics_version_key
+
+
+logger = logging.getLogger(__name__)
+
+# Cached analytics are keyed by data version, so this only bounds memory use
+ANALYTICS_CACHE_TIMEOUT = 60 * 60 * 24
+
+# How long a background refresh may hold its lock before another one may start
+ANALYTICS_REFRESH_LOCK_TIMEOUT = 60
+
+# Longest computation a single-flight leader is trusted with; followers wait this long
+SINGLE_FLIGHT_LOCK_TIMEOUT = 60
+# How long a leader's result stays readable for followers in other processes
+SINGLE_FLIGHT_RESULT_TIMEOUT = 10
+SINGLE_FLIGHT_POLL_INTERVAL = 0.05
+
+
+# ================ Analytics Version Methods ===========================
+def analytics_versions(user_id, domains):
+    """
+    Current data version of each domain of a user, seeded on first use with the
+    current time, so a version evicted from the cache never matches older results
+    """
+    keys = {domain: analytics_version_key(user_id, domain) for domain in domains}
+    versions = cache.get_many(list(keys.values()))
+    for domain, key in keys.items():
+        if key not in versions:
+            # add() so a concurrent touch_analytics() is not overwritten
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key, 0)
+    return [versions[keys[domain]] for domain in sorted(domains)]
+
+
+def request_params(request):
+    """GET parameters of a request as sorted (name, values) pairs, without jQuery's '_' cache buster"""
+    return sorted((name, values) for name, values in request.GET.lists() if name != '_')
+
+
+def analytics_cache_key(user_id, name, params=None):
+    """Base cache key of one analytics result of a user for the given parameters"""
+    digest = hashlib.sha1(json.dumps(params or [], sort_keys=True, default=str).encode()).hexdigest()
+    return f"analytics:{user_id}:{name}:{digest}"
+
+
+# ================ Single Flight Methods ===========================
+class _Flight:
+    """One in-process computation and the threads waiting for it"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def _single_flight_across_processes(key, compute, wait):
+    lock_key, result_key = f"single-flight:{key}:lock", f"single-flight:{key}:result"
+    token = uuid.uuid4().hex
+    if cache.add(lock_key, token, SINGLE_FLIGHT_LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(result_key, (token, value), SINGLE_FLIGHT_RESULT_TIMEOUT)
+            return value
+        finally:
+            cache.delete(lock_key)
+
+    # Another process leads: wait for the result tagged with its token, so an
+    # older flight's leftover result is never taken
+    leader = cache.get(lock_key)
+    deadline = time.monotonic() + wait
+    while leader is not None and time.monotonic() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        found = cache.get_many([result_key, lock_key])
+        if found.get(result_key, (None,))[0] == leader:
+            return found[result_key][1]
+        if found.get(lock_key) != leader:
+            # The leader failed, or finished and its result expired
+            break
+    return compute()
+
+
+def single_flight(key, compute, wait=SINGLE_FLIGHT_LOCK_TIMEOUT):
+    """
+    Run compute() once for all concurrent callers with the same key and hand each
+    of them its result. Threads of one process wait on the leading thread (and
+    get its exception if it fails); processes sharing the cache elect one leader
+    with cache.add() and the others poll for its result. Callers that waited
+    longer than wait seconds compute on their own. Async views call it through
+    sync_to_async. compute() must return a picklable value.
+
+    Coalescing across processes needs a default cache shared by them (see CACHES
+    and the gstbillingapp.W001 check); with a per-process cache like LocMemCache
+    only the threads of one process are coalesced.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leading = flight is None
+        if leading:
+            flight = _flights[key] = _Flight()
+
+    if not leading:
+        if not flight.done.wait(wait):
+            return compute()
+        if flight.error is not None:
+            raise flight.error
+        return flight.value
+
+    try:
+        flight.value = _single_flight_across_processes(key, compute, wait)
+        return flight.value
+    except Exception as error:
+        flight.error = error
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
+
+
+# ================ Analytics Cache Methods ===========================
+def _store(base_key, fresh_key, value, timeout):
+    cache.set_many({fresh_key: value, base_key + ':last': value}, timeout)
+
+
+def _refresh(base_key, fresh_key, compute, timeout):
+    """Recompute a stale entry outside the request; runs on its own DB connection"""
+    try:
+        close_old_connections()
+        _store(base_key, fresh_key, compute(), timeout)
+    except Exception:
+        logger.exception("Analytics refresh failed for %s", base_key)
+    finally:
+        cache.delete(base_key + ':refresh')
+        connection.close()
+
+
+def cached_analytics(user_id, name, domains, compute, params=None, timeout=ANALYTICS_CACHE_TIMEOUT):
+    """
+    Result of compute() for one tenant, cached until the tenant's data of the given
+    domains changes (see models.touch_analytics) or the local day rolls over.
+
+    Stale-while-revalidate: when the data changed but an earlier result exists, that
+    result is returned at once and a single background thread recomputes it, guarded
+    by a cache.add() lock. Without an earlier result, compute() runs in the request,
+    once for all concurrent identical requests (see single_flight).
+    Set ANALYTICS_CACHE_BACKGROUND_REFRESH = False to always recompute in the request.
+    """
+    base_key = analytics_cache_key(user_id, name, params)
+    versions = analytics_versions(user_id, domains)
+    fresh_key = f"{base_key}:{timezone.localdate().isoformat()}:{':'.join(str(version) for version in versions)}"
+
+    cached = cache.get_many([fresh_key, base_key + ':last'])
+    if fresh_key in cached:
+        return cached[fresh_key]
+
+    stale = cached.get(base_key + ':last')
+    if stale is not None and getattr(settings, 'ANALYTICS_CACHE_BACKGROUND_REFRESH', True):
+        if cache.add(base_key + ':refresh', True, ANALYTICS_REFRESH_LOCK_TIMEOUT):
+            threading.Thread(target=_refresh, args=(base_key, fresh_key, compute, timeout), daemon=True).start()
+        return stale
+
+    def compute_and_store():
+        value = compute()
+        _store(base_key, fresh_key, value, timeout)
+        return value
+
+    return single_flight(fresh_key, compute_and_store)
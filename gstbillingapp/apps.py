@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class GstbillingappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'gstbillingapp'
\ No newline at end of file
+    name = 'gstbillingapp'
+
+    def ready(self):
+        from . import checks
\ No newline at end of file
@@ -0,0 +1,42 @@
+# Django imports
+from django.conf import settings
+from django.db import connections
+from django.db.models import CharField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+# Third-party libraries
+import numpy as np
+
+# Python imports
+import datetime
+
+
+UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+SECONDS_PER_DAY = 86400.0
+
+
+# ================ Array Loading Methods ===========================
+def datetime_column(queryset, field):
+    """
+    (queryset, name) to read a DateTimeField through values_list for epoch_seconds().
+    On SQLite the stored text is read instead: parsing a million datetimes in
+    Python takes longer than the rest of an analytics job.
+    """
+    if connections[queryset.db].vendor == 'sqlite':
+        name = f'{field}_text'
+        return queryset.annotate(**{name: Cast(field, CharField())}), name
+    return queryset, field
+
+
+def epoch_seconds(values):
+    """Epoch seconds of datetime_column() values: SQLite text or datetimes (naive ones are UTC under USE_TZ)"""
+    if not len(values):
+        return np.zeros(0)
+    if isinstance(values[0], str):
+        if settings.USE_TZ:
+            return np.array(values, dtype='datetime64[us]').astype(np.int64) / 1e6
+        values = [datetime.datetime.fromisoformat(value) for value in values]
+    if timezone.is_aware(values[0]) or not settings.USE_TZ:
+        return np.fromiter(map(datetime.datetime.timestamp, values), dtype=np.float64, count=len(values))
+    return np.fromiter(((value - UNIX_EPOCH).total_seconds() for value in values), dtype=np.float64, count=len(values))
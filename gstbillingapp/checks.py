@@ -0,0 +1,25 @@
+# Django imports
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+# Cache backends that are not shared between processes
+PROCESS_LOCAL_CACHE_BACKENDS = [
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+]
+
+
+@register()
+def shared_cache_check(app_configs, **kwargs):
+    """The analytics versions and single-flight locks only work across processes with a shared cache"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend in PROCESS_LOCAL_CACHE_BACKENDS:
+        return [Warning(
+            f"The default cache ({backend}) is not shared between processes.",
+            hint="Writes from other workers and management commands will not invalidate cached "
+                 "analytics, and single_flight() only coalesces within one process. Configure "
+                 "a DatabaseCache or RedisCache as the default cache.",
+            id='gstbillingapp.W001',
+        )]
+    return []
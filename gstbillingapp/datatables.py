@@ -0,0 +1,170 @@
+# Django imports
+from django.core.cache import cache
+from django.db.models import F, Q
+
+# Python imports
+import json
+import base64
+import hashlib
+
+
+# recordsTotal is allowed to lag behind writes by this long
+DATATABLES_COUNT_CACHE_TIMEOUT = 60
+DATATABLES_CURSOR_CACHE_TIMEOUT = 60 * 10
+
+
+# ================ DataTables Count Methods ===========================
+def query_signature(queryset):
+    """Stable hash of the SQL of a queryset (filters, ordering and params)"""
+    return hashlib.sha1(str(queryset.query).encode('utf-8')).hexdigest()
+
+
+def cached_count(queryset, timeout=DATATABLES_COUNT_CACHE_TIMEOUT):
+    """
+    count() of queryset cached for a short time, used as an approximate
+    recordsTotal so scrolling does not recount the whole table on every page.
+    """
+    cache_key = f"datatables_count:{query_signature(queryset.order_by())}"
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, timeout)
+    return count
+
+
+def filtered_count(queryset, base_queryset, total_records):
+    """recordsFiltered: reuses recordsTotal when no filter narrowed base_queryset"""
+    if query_signature(queryset.order_by()) == query_signature(base_queryset.order_by()):
+        return total_records
+    return queryset.count()
+
+
+# ================ DataTables Keyset Pagination Methods ===========================
+def _keyset_fields(ordering):
+    """Field names of a keyset-able ordering, or None: local fields ending with the unique id"""
+    fields = [field.lstrip('-') for field in ordering]
+    if not fields or fields[-1] != 'id' or any('__' in field for field in fields):
+        return None
+    return fields
+
+
+def nullable_fields(model, ordering):
+    """Names of the ordering fields that may hold NULL"""
+    return {field.lstrip('-') for field in ordering if model._meta.get_field(field.lstrip('-')).null}
+
+
+def keyset_ordering(ordering, nullable=()):
+    """
+    order_by() arguments of ordering with the NULLs of nullable fields placed explicitly:
+    last when descending, first when ascending (SQLite's own placement), so
+    keyset_filter knows on which side of a cursor they are on every backend.
+    """
+    expressions = []
+    for field in ordering:
+        name = field.lstrip('-')
+        if name not in nullable:
+            expressions.append(field)
+        elif field.startswith('-'):
+            expressions.append(F(name).desc(nulls_last=True))
+        else:
+            expressions.append(F(name).asc(nulls_first=True))
+    return expressions
+
+
+def encode_cursor(obj, ordering):
+    """Opaque cursor holding the ordering key values of obj (NULLs kept as null)"""
+    values = [getattr(obj, field.lstrip('-')) for field in ordering]
+    data = json.dumps([None if value is None else str(value) for value in values])
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(model, ordering, cursor):
+    """Key values of a cursor converted back to python, or None if it does not fit ordering"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        if len(values) != len(ordering):
+            return None
+        return [None if value is None else model._meta.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(ordering, values)]
+    except Exception:
+        return None
+
+
+def _equal(name, value):
+    return Q(**{f"{name}__isnull": True}) if value is None else Q(**{name: value})
+
+
+def _beyond(field, value, nullable):
+    """Q for values of one ordering field strictly after value, None when there are none"""
+    name = field.lstrip('-')
+    descending = field.startswith('-')
+    if value is None:
+        # NULLs are last when descending, first when ascending (see keyset_ordering)
+        return None if descending else Q(**{f"{name}__isnull": False})
+    condition = Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+    if descending and name in nullable:
+        condition |= Q(**{f"{name}__isnull": True})
+    return condition
+
+
+def keyset_filter(ordering, values, nullable=()):
+    """
+    Rows strictly after values in ordering, e.g. for ['-invoice_date', '-id']:
+    invoice_date <= d AND (invoice_date < d OR (invoice_date = d AND id < i)).
+    NULLs of nullable fields are placed as keyset_ordering() orders them.
+    """
+    after = Q()
+    for i, field in enumerate(ordering):
+        condition = _beyond(field, values[i], nullable)
+        if condition is None:
+            continue
+        for previous_field, previous_value in zip(ordering[:i], values[:i]):
+            condition &= _equal(previous_field.lstrip('-'), previous_value)
+        after |= condition
+    # The leading range condition lets the (user, date) style indexes bound the scan
+    first, value = ordering[0].lstrip('-'), values[0]
+    if value is None:
+        return (_equal(first, value) if ordering[0].startswith('-') else Q()) & after
+    leading = Q(**{f"{first}__{'lte' if ordering[0].startswith('-') else 'gte'}": value})
+    if ordering[0].startswith('-') and first in nullable:
+        leading |= Q(**{f"{first}__isnull": True})
+    return leading & after
+
+
+def _cursor_cache_key(signature, start):
+    return f"datatables_cursor:{signature}:{start}"
+
+
+def datatables_page(request, queryset, ordering, start, length):
+    """
+    Rows of one DataTables page of queryset ordered by ordering, and the cursor of the next page.
+
+    When ordering is keyset-able (local fields ending with id) the page is read with
+    WHERE key < cursor instead of OFFSET start, so deep pages cost the same as the first.
+    The cursor comes from the 'cursor' GET parameter or, for plain DataTables clients,
+    from the position cache filled when the previous page was served. Without either
+    (or for other orderings) it falls back to OFFSET paging.
+    """
+    if not _keyset_fields(ordering) or length <= 0:
+        queryset = queryset.order_by(*ordering)
+        return list(queryset[start:start + length] if length > 0 else queryset[start:]), None
+    nullable = nullable_fields(queryset.model, ordering)
+    queryset = queryset.order_by(*keyset_ordering(ordering, nullable))
+
+    signature = query_signature(queryset)
+    values = None
+    if start > 0:
+        cursor = request.GET.get('cursor') or cache.get(_cursor_cache_key(signature, start))
+        if cursor:
+            values = decode_cursor(queryset.model, ordering, cursor)
+
+    if values is not None:
+        rows = list(queryset.filter(keyset_filter(ordering, values, nullable))[:length])
+    else:
+        rows = list(queryset[start:start + length])
+
+    next_cursor = None
+    if len(rows) == length:
+        next_cursor = encode_cursor(rows[-1], ordering)
+        cache.set(_cursor_cache_key(signature, start + length), next_cursor, DATATABLES_CURSOR_CACHE_TIMEOUT)
+    return rows, next_cursor
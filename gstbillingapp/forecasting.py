@@ -0,0 +1,164 @@
+# Django imports
+from django.contrib.auth.models import User
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Third-party libraries
+import numpy as np
+
+# Python imports
+import datetime
+
+# Model imports
+from .models import Inventory, InventoryLog
+from .arrays import datetime_column, epoch_seconds, SECONDS_PER_DAY
+from .utils import check_low_stock
+
+
+# Days of sales history the forecast looks at
+FORECAST_LOOKBACK_DAYS = 90
+FORECAST_MOVING_AVERAGE_DAYS = 28
+# Weight of the newest day in the exponentially smoothed demand
+FORECAST_SMOOTHING = 0.2
+FORECAST_LEAD_TIME_DAYS = 7
+# Safety stock in standard deviations of lead time demand (1.65 is ~95% service level)
+FORECAST_SAFETY_FACTOR = 1.65
+
+FORECAST_FIELDS = ['suggested_alert_level', 'daily_demand', 'days_of_cover', 'forecast_log_id', 'forecast_updated_at']
+
+SALES_CHANGE_TYPE = 4
+
+
+# ================ Demand Data Methods ===========================
+def forecast_inventories(user_ids=None, full=False):
+    """
+    Inventories to forecast, annotated with newest_log (id of the newest inventory log):
+    only those with any stock logged since their last forecast, as restocks and
+    adjustments change the days of cover too, or all with full.
+    """
+    newest_log = InventoryLog.objects.filter(
+        user_id=OuterRef('user_id'), product_id=OuterRef('product_id'),
+    ).order_by('-id').values('id')[:1]
+    inventories = Inventory.objects.filter(user__isnull=False, product__isnull=False).annotate(
+        newest_log=Subquery(newest_log))
+    if user_ids:
+        inventories = inventories.filter(user_id__in=user_ids)
+    if not full:
+        inventories = inventories.filter(newest_log__gt=Coalesce('forecast_log_id', 0))
+    return inventories
+
+
+def demand_matrix(keys, user_ids, now, lookback=FORECAST_LOOKBACK_DAYS):
+    """
+    Units sold per (user, product) key and local day over the lookback days up to
+    today, from one values_list of the sales logs: a keys x days array, oldest day first.
+    keys must be sorted, as built by update_demand_forecasts.
+    """
+    local_now = timezone.localtime(now)
+    first_day = local_now.date() - datetime.timedelta(days=lookback - 1)
+    start = timezone.make_aware(datetime.datetime.combine(first_day, datetime.time.min))
+    matrix = np.zeros((len(keys), lookback))
+    if not len(keys):
+        return matrix
+
+    sales = InventoryLog.objects.filter(
+        user_id__in=user_ids, change_type=SALES_CHANGE_TYPE, product__isnull=False, date__gte=start, date__lte=now,
+    ).order_by()
+    sales, date_field = datetime_column(sales, 'date')
+    rows = list(sales.values_list('user_id', 'product_id', date_field, 'change'))
+    if not rows:
+        return matrix
+
+    log_users, log_products, dates, changes = zip(*rows)
+    log_keys = _inventory_keys(np.fromiter(log_users, dtype=np.int64, count=len(rows)),
+                               np.fromiter(log_products, dtype=np.int64, count=len(rows)))
+    offset = local_now.utcoffset().total_seconds()
+    days = np.floor((epoch_seconds(dates) + offset) / SECONDS_PER_DAY).astype(np.int64)
+    days -= (first_day - datetime.date(1970, 1, 1)).days
+
+    position = np.minimum(np.searchsorted(keys, log_keys), len(keys) - 1)
+    wanted = (keys[position] == log_keys) & (days >= 0) & (days < lookback)
+    # Sales are logged as negative changes
+    np.add.at(matrix, (position[wanted], days[wanted]), -np.fromiter(changes, dtype=np.float64, count=len(rows))[wanted])
+    return np.clip(matrix, 0, None)
+
+
+def _inventory_keys(user_ids, product_ids):
+    return user_ids * (1 << 32) + product_ids
+
+
+# ================ Demand Forecast Methods ===========================
+def forecast_demand(matrix, stock, lead_time=FORECAST_LEAD_TIME_DAYS, safety_factor=FORECAST_SAFETY_FACTOR,
+                    smoothing=FORECAST_SMOOTHING, moving_average_days=FORECAST_MOVING_AVERAGE_DAYS):
+    """
+    Forecast of every row of a daily demand matrix at once. Returns a dict of arrays:
+      moving_average (mean of the last moving_average_days), daily_demand (simple
+      exponential smoothing, seeded with the mean of the first week), reorder_point
+      (lead time demand plus safety stock from the daily standard deviation) and
+      days_of_cover (stock / daily_demand, NaN without demand).
+    """
+    moving_average = matrix[:, -moving_average_days:].mean(axis=1)
+    level = matrix[:, :7].mean(axis=1)
+    for day in range(matrix.shape[1]):
+        level = smoothing * matrix[:, day] + (1 - smoothing) * level
+    deviation = matrix.std(axis=1)
+    reorder_point = level * lead_time + safety_factor * deviation * np.sqrt(lead_time)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_of_cover = np.where(level > 0, np.maximum(stock, 0) / level, np.nan)
+    return {
+        'moving_average': moving_average,
+        'daily_demand': level,
+        'reorder_point': reorder_point,
+        'days_of_cover': days_of_cover,
+    }
+
+
+def update_demand_forecasts(user_ids=None, full=False, apply=False, lead_time=FORECAST_LEAD_TIME_DAYS,
+                            safety_factor=FORECAST_SAFETY_FACTOR, now=None, allow_lower=False):
+    """
+    Forecast the sales of the inventories with new inventory logs (every inventory
+    with full) and store the suggested alert level (reorder point), daily demand and
+    days of cover. With apply the suggestion also replaces alert_level where there
+    was demand in the lookback window; a hand-set level is only lowered with
+    allow_lower. Products it puts into low stock are alerted.
+    Returns the number of inventories updated.
+    """
+    now = now or timezone.now()
+    inventories = list(forecast_inventories(user_ids, full))
+    if not inventories:
+        return 0
+
+    inventory_keys = _inventory_keys(np.array([inventory.user_id for inventory in inventories], dtype=np.int64),
+                                     np.array([inventory.product_id for inventory in inventories], dtype=np.int64))
+    keys, rows = np.unique(inventory_keys, return_inverse=True)
+    matrix = demand_matrix(keys, {inventory.user_id for inventory in inventories}, now)
+    stock = np.zeros(len(keys))
+    stock[rows] = [inventory.current_stock for inventory in inventories]
+    forecast = forecast_demand(matrix, stock, lead_time, safety_factor)
+
+    suggested = np.ceil(forecast['reorder_point']).astype(np.int64).tolist()
+    daily_demand = np.round(forecast['daily_demand'], 3).tolist()
+    days_of_cover = np.round(forecast['days_of_cover'], 1).tolist()
+    has_demand = (matrix.sum(axis=1) > 0).tolist()
+    fields = FORECAST_FIELDS + (['alert_level'] if apply else [])
+    for inventory, row in zip(inventories, rows.tolist()):
+        inventory.suggested_alert_level = suggested[row]
+        inventory.daily_demand = daily_demand[row]
+        inventory.days_of_cover = None if np.isnan(days_of_cover[row]) else days_of_cover[row]
+        inventory.forecast_log_id = inventory.newest_log or inventory.forecast_log_id
+        inventory.forecast_updated_at = now
+        # Slow movers without sales in the window keep their alert level
+        if apply and has_demand[row] and (allow_lower or suggested[row] > inventory.alert_level):
+            inventory.alert_level = suggested[row]
+    # An upsert on the primary key writes only the forecast fields: unlike bulk_update
+    # it builds no CASE expression per row, and stock moved meanwhile is left alone
+    Inventory.objects.bulk_create(inventories, batch_size=500, update_conflicts=True,
+                                  unique_fields=['id'], update_fields=fields)
+    if apply:
+        products = {}
+        for inventory in inventories:
+            products.setdefault(inventory.user_id, []).append(inventory.product_id)
+        for user in User.objects.filter(id__in=products):
+            check_low_stock(user, products[user.id])
+    return len(inventories)
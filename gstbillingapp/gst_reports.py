@@ -0,0 +1,118 @@
+# Django imports
+from django.core.cache import cache
+from django.db.models import Sum, Count, Q, F
+from django.db.models.functions import Round
+
+# Python imports
+import io
+import csv
+import time
+import calendar
+import datetime
+
+# Model imports
+from .models import InvoiceLineItem
+from .models import invoice_period_version_key
+
+
+GST_REPORT_CACHE_TIMEOUT = 60 * 60 * 24
+
+GSTR1_SECTIONS = ['b2b', 'b2c', 'hsn', 'rate_wise']
+
+GSTR1_CSV_COLUMNS = {
+    'b2b': ['customer_gst', 'customer_name', 'invoice_number', 'invoice_date', 'invoice_value',
+            'gst_percentage', 'taxable_value', 'igst', 'cgst', 'sgst'],
+    'b2c': ['gst_percentage', 'taxable_value', 'igst', 'cgst', 'sgst', 'total_value'],
+    'hsn': ['hsn', 'gst_percentage', 'total_qty', 'taxable_value', 'igst', 'cgst', 'sgst', 'total_value'],
+    'rate_wise': ['gst_percentage', 'invoice_count', 'taxable_value', 'igst', 'cgst', 'sgst', 'total_value'],
+}
+
+
+# ================ GSTR-1 Report Methods ===========================
+def _tax_sums():
+    return dict(
+        taxable_value=Round(Sum('amt_without_gst'), 2),
+        igst=Round(Sum('amt_igst'), 2),
+        cgst=Round(Sum('amt_cgst'), 2),
+        sgst=Round(Sum('amt_sgst'), 2),
+        total_value=Round(Sum('amt_with_gst'), 2),
+    )
+
+
+def gstr1_line_items(user, year, month):
+    """Line items of the GST invoices of one month"""
+    first_day = datetime.date(year, month, 1)
+    last_day = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return InvoiceLineItem.objects.filter(user=user, is_gst=True,
+                                          invoice_date__gte=first_day, invoice_date__lte=last_day)
+
+
+def build_gstr1_report(user, year, month):
+    """
+    GSTR-1 sections for one month, each computed with a grouped query over
+    InvoiceLineItem. B2B = invoices issued with a GSTIN (as stored on the invoice,
+    not the customer's current one), B2C = everyone else.
+    """
+    line_items = gstr1_line_items(user, year, month).annotate(customer_gst=F('invoice__invoice_customer_gst'))
+    b2b_filter = ~Q(customer_gst='')
+
+    b2b = list(line_items.filter(b2b_filter).values(
+        'customer_gst', 'invoice_id', 'invoice_date', 'gst_percentage',
+        customer_name=F('invoice__invoice_customer_name'),
+        invoice_number=F('invoice__invoice_number'),
+        invoice_value=F('invoice__invoice_total_amt_with_gst'),
+    ).annotate(**_tax_sums()).order_by('customer_gst', 'invoice_date', 'invoice_number', 'gst_percentage'))
+    for row in b2b:
+        row['invoice_date'] = str(row['invoice_date'])
+
+    b2c = list(line_items.exclude(b2b_filter).values('gst_percentage')
+               .annotate(**_tax_sums()).order_by('gst_percentage'))
+
+    hsn = list(line_items.values('hsn', 'gst_percentage')
+               .annotate(total_qty=Sum('qty'), **_tax_sums()).order_by('hsn', 'gst_percentage'))
+
+    rate_wise = list(line_items.values('gst_percentage')
+                     .annotate(invoice_count=Count('invoice_id', distinct=True), **_tax_sums())
+                     .order_by('gst_percentage'))
+
+    totals = line_items.aggregate(invoice_count=Count('invoice_id', distinct=True), **_tax_sums())
+    for key, value in totals.items():
+        totals[key] = value or 0
+
+    return {
+        'period': f"{year}-{month:02d}",
+        'generated_at': datetime.datetime.now().isoformat(),
+        'b2b': b2b,
+        'b2c': b2c,
+        'hsn': hsn,
+        'rate_wise': rate_wise,
+        'totals': totals,
+    }
+
+
+def gstr1_report(user, year, month):
+    """
+    Cached GSTR-1 report. The cache key includes the (user, month) invoice
+    version that Invoice.save()/delete() bump, so edits invalidate it.
+    """
+    version_key = invoice_period_version_key(user.id, year, month)
+    version = cache.get(version_key)
+    if version is None:
+        # Never start from a version an evicted counter may have had before
+        cache.add(version_key, time.time_ns(), None)
+        version = cache.get(version_key)
+    cache_key = f"gstr1:v2:{user.id}:{year}-{month:02d}:{version}"
+    report = cache.get(cache_key)
+    if report is None:
+        report = build_gstr1_report(user, year, month)
+        cache.set(cache_key, report, GST_REPORT_CACHE_TIMEOUT)
+    return report
+
+
+def gstr1_section_csv(report, section):
+    """One GSTR-1 section as CSV text"""
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=GSTR1_CSV_COLUMNS[section], extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(report[section])
+    return output.getvalue()
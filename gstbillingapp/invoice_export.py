@@ -0,0 +1,132 @@
+# Django imports
+import django
+from django.conf import settings
+
+# Python imports
+import json
+import zipfile
+import datetime
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+# Model imports
+from .models import Invoice, UserProfile
+from .invoice_pdf import get_invoice_pdf
+
+
+INVOICE_EXPORT_CHUNK_SIZE = 200
+INVOICE_EXPORT_MAX_WORKERS = getattr(settings, 'INVOICE_EXPORT_MAX_WORKERS', 4)
+
+
+class _ZipStream:
+    """
+    Write-only, unseekable file object for zipfile. Written bytes are kept
+    until drained, so the archive is streamed out piece by piece.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _invoice_file_name(invoice, extension):
+    prefix = 'INV' if invoice.is_gst else 'INV-NG'
+    return f"{invoice.invoice_date.strftime('%Y-%m-%d')}_{prefix}-{invoice.invoice_number}_{invoice.id}.{extension}"
+
+
+def _render_pdf_bytes(args):
+    """Process pool worker: render (or read from the cache) one invoice PDF"""
+    invoice, user_profile = args
+    with open(get_invoice_pdf(invoice, user_profile), 'rb') as f:
+        return f.read()
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for obj in iterable:
+        chunk.append(obj)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def invoice_export_queryset(user, start_date, end_date, invoice_type='all'):
+    queryset = Invoice.objects.filter(user=user, invoice_date__gte=start_date, invoice_date__lte=end_date)
+    if invoice_type == 'gst':
+        queryset = queryset.filter(is_gst=True)
+    elif invoice_type == 'non_gst':
+        queryset = queryset.filter(is_gst=False)
+    return queryset.order_by('invoice_date', 'id')
+
+
+def stream_invoice_export(user, queryset, export_format='pdf', workers=0):
+    """
+    Generator yielding a ZIP archive of the invoices in queryset, one PDF or JSON
+    file per invoice. Invoices are read with .iterator() and every finished
+    entry is yielded right away, so memory stays flat regardless of the count.
+    workers > 1 renders PDFs in a process pool, one chunk at a time.
+    """
+    stream = _ZipStream()
+    archive = zipfile.ZipFile(stream, mode='w', compression=zipfile.ZIP_DEFLATED)
+    user_profile = UserProfile.objects.select_related('bankdetails').get(user=user)
+    invoices = queryset.select_related('invoice_customer').iterator(chunk_size=INVOICE_EXPORT_CHUNK_SIZE)
+
+    executor = None
+    if export_format == 'pdf' and workers > 1:
+        # Spawned (not forked) workers so no database connection is shared with them;
+        # they only render, everything they need is passed in
+        executor = ProcessPoolExecutor(max_workers=min(workers, INVOICE_EXPORT_MAX_WORKERS),
+                                       mp_context=multiprocessing.get_context('spawn'),
+                                       initializer=django.setup)
+
+    count = 0
+    total_amt_with_gst = 0.0
+    try:
+        for chunk in _chunks(invoices, INVOICE_EXPORT_CHUNK_SIZE if executor else 1):
+            if export_format == 'json':
+                contents = [json.dumps({
+                    'invoice_number': invoice.invoice_number,
+                    'invoice_date': str(invoice.invoice_date),
+                    'is_gst': invoice.is_gst,
+                    'customer': invoice.invoice_customer.customer_name if invoice.invoice_customer else None,
+                    'invoice': json.loads(invoice.invoice_json),
+                }, indent=2).encode('utf-8') for invoice in chunk]
+            elif executor:
+                contents = executor.map(_render_pdf_bytes, [(invoice, user_profile) for invoice in chunk])
+            else:
+                contents = [_render_pdf_bytes((invoice, user_profile)) for invoice in chunk]
+
+            for invoice, content in zip(chunk, contents):
+                archive.writestr(_invoice_file_name(invoice, export_format), content)
+                count += 1
+                total_amt_with_gst += invoice.invoice_total_amt_with_gst
+                yield stream.drain()
+
+        archive.writestr('summary.json', json.dumps({
+            'business': user_profile.business_title,
+            'exported_at': datetime.datetime.now().isoformat(),
+            'count': count,
+            'total_amt_with_gst': round(total_amt_with_gst, 2),
+        }, indent=2))
+        archive.close()
+        yield stream.drain()
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
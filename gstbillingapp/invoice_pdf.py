@@ -0,0 +1,235 @@
+# Django imports
+from django.conf import settings
+from django.db import transaction
+from django.utils.html import escape
+
+# Third-party libraries
+from reportlab.lib.pagesizes import A4
+from reportlab.lib import colors
+from reportlab.lib.units import mm
+from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
+from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+# Python imports
+import io
+import os
+import glob
+import json
+import hashlib
+import threading
+import num2words
+
+# Model imports
+from .models import Invoice, UserProfile
+
+
+INVOICE_PDF_CACHE_DIR = getattr(settings, 'INVOICE_PDF_CACHE_DIR',
+                                os.path.join(settings.BASE_DIR, 'invoice_pdf_cache'))
+
+# Bump to invalidate every cached PDF after a layout change
+INVOICE_PDF_LAYOUT_VERSION = 1
+
+
+# ================ Invoice PDF Cache Methods ===========================
+def invoice_pdf_content_hash(invoice, user_profile):
+    """Hash of everything printed on the invoice PDF"""
+    bank = user_profile.bankdetails
+    printed = [
+        INVOICE_PDF_LAYOUT_VERSION,
+        invoice.invoice_number, str(invoice.invoice_date), invoice.is_gst, invoice.invoice_json,
+        user_profile.business_title, user_profile.business_address, user_profile.business_email,
+        user_profile.business_phone, user_profile.business_gst,
+    ]
+    if bank:
+        printed += [bank.account_name, bank.account_number, bank.bank_name,
+                    bank.branch_name, bank.ifsc_code, bank.upi_id]
+    return hashlib.sha256(json.dumps(printed, default=str).encode('utf-8')).hexdigest()[:16]
+
+
+def invoice_pdf_path(invoice, user_profile):
+    return os.path.join(INVOICE_PDF_CACHE_DIR, str(invoice.user_id),
+                        f"{invoice.id}-{invoice_pdf_content_hash(invoice, user_profile)}.pdf")
+
+
+def remove_invoice_pdfs(invoice, keep=None):
+    """Delete cached PDFs of an invoice (all of them, or all but keep)"""
+    pattern = os.path.join(INVOICE_PDF_CACHE_DIR, str(invoice.user_id), f"{invoice.id}-*.pdf")
+    for path in glob.glob(pattern):
+        if path != keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def get_invoice_pdf(invoice, user_profile):
+    """
+    Path of the invoice PDF, rendering it only when no file exists for the
+    current content hash. Edited invoices get a new hash and stale files are removed.
+    """
+    path = invoice_pdf_path(invoice, user_profile)
+    if os.path.exists(path):
+        return path
+
+    pdf = render_invoice_pdf(invoice, user_profile)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf)
+    os.replace(tmp_path, path)
+    remove_invoice_pdfs(invoice, keep=path)
+    return path
+
+
+def prerender_invoice_pdf(invoice):
+    """
+    Render the invoice PDF in a background thread once the current transaction
+    commits. Enabled with settings.INVOICE_PDF_PRERENDER.
+    """
+    if not getattr(settings, 'INVOICE_PDF_PRERENDER', False):
+        return
+    invoice_id = invoice.id
+
+    def worker():
+        try:
+            invoice = Invoice.objects.select_related('user').get(id=invoice_id)
+            user_profile = UserProfile.objects.select_related('bankdetails').get(user=invoice.user)
+            get_invoice_pdf(invoice, user_profile)
+        except Exception as e:
+            print(f"Error pre-rendering invoice PDF {invoice_id}: {e}")
+
+    transaction.on_commit(lambda: threading.Thread(target=worker, daemon=True).start())
+
+
+# ================ Invoice PDF Render Methods ===========================
+def _text(value):
+    """Escape a value for use inside a reportlab Paragraph"""
+    return escape(str(value or ''))
+
+
+def _amount(value):
+    try:
+        return f"{float(value or 0):,.2f}"
+    except (TypeError, ValueError):
+        return "0.00"
+
+
+def render_invoice_pdf(invoice, user_profile):
+    """Render an invoice to PDF bytes with reportlab"""
+    invoice_data = json.loads(invoice.invoice_json)
+    igst = bool(invoice_data.get('igstcheck'))
+    total_in_words = num2words.num2words(int(float(invoice_data.get('invoice_total_amt_with_gst') or 0)),
+                                         lang='en_IN').title()
+
+    styles = getSampleStyleSheet()
+    title_style = ParagraphStyle("Title", parent=styles["Heading1"], alignment=1, fontSize=16)
+    subtitle_style = ParagraphStyle("Sub", parent=styles["Normal"], alignment=1, fontSize=9)
+    small_style = ParagraphStyle("Small", parent=styles["Normal"], fontSize=8, leading=10)
+
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, rightMargin=10 * mm, leftMargin=10 * mm,
+                            topMargin=12 * mm, bottomMargin=15 * mm,
+                            title=f"Invoice {invoice.invoice_number}")
+    elements = []
+
+    # ---------------- HEADER ---------------- #
+    elements.append(Paragraph(_text(user_profile.business_title), title_style))
+    elements.append(Paragraph(_text(user_profile.business_address), subtitle_style))
+    elements.append(Paragraph(
+        f"Phone: {_text(user_profile.business_phone)} | Email: {_text(user_profile.business_email)}"
+        f" | GST: {_text(user_profile.business_gst)}", subtitle_style))
+    elements.append(Spacer(1, 6))
+    elements.append(Paragraph("TAX INVOICE" if invoice.is_gst else "INVOICE", subtitle_style))
+    elements.append(Spacer(1, 6))
+
+    # ---------------- PARTIES ---------------- #
+    invoice_number = str(invoice.invoice_number) if invoice.is_gst else f"INV-{invoice.invoice_number}"
+    party_table = Table([
+        [Paragraph(f"<b>Bill To:</b> {_text(invoice_data.get('customer_name'))}<br/>"
+                   f"{_text(invoice_data.get('customer_address'))}<br/>"
+                   f"Phone: {_text(invoice_data.get('customer_phone'))}<br/>"
+                   f"GST: {_text(invoice_data.get('customer_gst'))}", small_style),
+         Paragraph(f"<b>Invoice No:</b> {invoice_number}<br/>"
+                   f"<b>Date:</b> {invoice.invoice_date.strftime('%d-%m-%Y')}<br/>"
+                   f"<b>Vehicle No:</b> {_text(invoice_data.get('vehicle_number'))}", small_style)],
+    ], colWidths=[120 * mm, 70 * mm])
+    party_table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+    ]))
+    elements.append(party_table)
+    elements.append(Spacer(1, 6))
+
+    # ---------------- ITEMS ---------------- #
+    if igst:
+        header = ["#", "Product", "HSN", "Qty", "Rate", "Disc", "GST%", "Taxable", "IGST", "Amount"]
+        col_widths = [8, 52, 18, 12, 18, 12, 12, 20, 18, 20]
+    else:
+        header = ["#", "Product", "HSN", "Qty", "Rate", "Disc", "GST%", "Taxable", "SGST", "CGST", "Amount"]
+        col_widths = [8, 44, 16, 11, 17, 11, 11, 19, 16, 16, 21]
+    rows = [header]
+    for idx, item in enumerate(invoice_data.get('items', []), start=1):
+        product = f"{_text(item.get('invoice_product'))} ({_text(item.get('invoice_model_no'))})"
+        row = [str(idx), Paragraph(product, small_style), item.get('invoice_hsn', ''),
+               str(item.get('invoice_qty', '')), _amount(item.get('invoice_rate_without_gst')),
+               str(item.get('invoice_discount', '')), str(item.get('invoice_gst_percentage', '')),
+               _amount(item.get('invoice_amt_without_gst'))]
+        if igst:
+            row += [_amount(item.get('invoice_amt_igst'))]
+        else:
+            row += [_amount(item.get('invoice_amt_sgst')), _amount(item.get('invoice_amt_cgst'))]
+        row += [_amount(item.get('invoice_amt_with_gst'))]
+        rows.append(row)
+
+    total_row = ["", "Total", "", "", "", "", "", _amount(invoice_data.get('invoice_total_amt_without_gst'))]
+    if igst:
+        total_row += [_amount(invoice_data.get('invoice_total_amt_igst'))]
+    else:
+        total_row += [_amount(invoice_data.get('invoice_total_amt_sgst')),
+                      _amount(invoice_data.get('invoice_total_amt_cgst'))]
+    total_row += [_amount(invoice_data.get('invoice_total_amt_with_gst'))]
+    rows.append(total_row)
+
+    items_table = Table(rows, colWidths=[width * mm for width in col_widths], repeatRows=1)
+    items_table.setStyle(TableStyle([
+        ("GRID", (0, 0), (-1, -1), 0.5, colors.grey),
+        ("BACKGROUND", (0, 0), (-1, 0), colors.lightgrey),
+        ("FONTNAME", (0, 0), (-1, 0), "Helvetica-Bold"),
+        ("FONTNAME", (0, -1), (-1, -1), "Helvetica-Bold"),
+        ("FONTSIZE", (0, 0), (-1, -1), 7),
+        ("ALIGN", (3, 1), (-1, -1), "RIGHT"),
+        ("VALIGN", (0, 0), (-1, -1), "MIDDLE"),
+    ]))
+    elements.append(items_table)
+    elements.append(Spacer(1, 6))
+
+    # ---------------- TOTAL IN WORDS / BANK ---------------- #
+    elements.append(Paragraph(f"<b>Amount in words:</b> Rupees {total_in_words} Only", small_style))
+    elements.append(Spacer(1, 6))
+    bank = user_profile.bankdetails
+    if bank:
+        elements.append(Paragraph(
+            f"<b>Bank:</b> {_text(bank.bank_name)} {_text(bank.branch_name)} | <b>A/C Name:</b> {_text(bank.account_name)}"
+            f" | <b>A/C No:</b> {_text(bank.account_number)} | <b>IFSC:</b> {_text(bank.ifsc_code)}"
+            f" | <b>UPI:</b> {_text(bank.upi_id)}", small_style))
+        elements.append(Spacer(1, 6))
+
+    # ---------------- SIGNATURE ---------------- #
+    sign_table = Table([
+        ["Customer Signature", f"For {user_profile.business_title or ''}"],
+        ["", ""],
+        ["_______________________", "Authorized Signatory"],
+    ], colWidths=[95 * mm, 95 * mm])
+    sign_table.setStyle(TableStyle([
+        ("FONTSIZE", (0, 0), (-1, -1), 8),
+        ("ALIGN", (0, 0), (-1, -1), "CENTER"),
+        ("TOPPADDING", (0, 1), (-1, 1), 18),
+    ]))
+    elements.append(sign_table)
+
+    def page_number(canvas, doc):
+        canvas.setFont("Helvetica", 8)
+        canvas.drawCentredString(A4[0] / 2, 8 * mm, f"Page {canvas.getPageNumber()}")
+
+    doc.build(elements, onFirstPage=page_number, onLaterPages=page_number)
+    return buffer.getvalue()
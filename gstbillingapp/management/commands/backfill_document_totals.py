@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gstbillingapp.models import Invoice, Quotation
+
+
+INVOICE_TOTAL_FIELDS = [
+    'invoice_total_amt_with_gst', 'invoice_total_amt_without_gst',
+    'invoice_total_amt_sgst', 'invoice_total_amt_cgst', 'invoice_total_amt_igst',
+    'invoice_item_count', 'invoice_total_qty',
+    'invoice_customer_name', 'invoice_customer_gst',
+]
+
+QUOTATION_TOTAL_FIELDS = [
+    'quotation_total_amt_with_gst', 'quotation_total_amt_without_gst',
+    'quotation_total_amt_sgst', 'quotation_total_amt_cgst', 'quotation_total_amt_igst',
+    'quotation_item_count', 'quotation_total_qty',
+]
+
+
+class Command(BaseCommand):
+    help = 'Backfill the materialized invoice and quotation total columns from their JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of rows written per bulk_update (default: 500)')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        invoices = self.backfill(Invoice.objects.order_by('id'), INVOICE_TOTAL_FIELDS, batch_size)
+        self.stdout.write(f"Updated totals for {invoices} invoices")
+
+        quotations = self.backfill(Quotation.objects.order_by('id'), QUOTATION_TOTAL_FIELDS, batch_size)
+        self.stdout.write(f"Updated totals for {quotations} quotations")
+
+        self.stdout.write(self.style.SUCCESS('Document totals backfilled'))
+
+    def backfill(self, queryset, fields, batch_size):
+        model = queryset.model
+        updated = 0
+        batch = []
+        for obj in queryset.iterator(chunk_size=batch_size):
+            obj.update_totals_from_json()
+            batch.append(obj)
+            if len(batch) >= batch_size:
+                updated += self.flush(model, batch, fields)
+                batch = []
+        if batch:
+            updated += self.flush(model, batch, fields)
+        return updated
+
+    def flush(self, model, batch, fields):
+        with transaction.atomic():
+            model.objects.bulk_update(batch, fields)
+        return len(batch)
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from gstbillingapp.models import Invoice, Quotation, InvoiceLineItem, QuotationLineItem
+from gstbillingapp.models import build_line_items
+
+
+class Command(BaseCommand):
+    help = 'Backfill InvoiceLineItem / QuotationLineItem rows from the invoice and quotation JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Number of documents processed per transaction (default: 500)')
+        parser.add_argument('--after-id', type=int, default=0,
+                            help='Resume from documents with an id greater than this')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Rewrite line items even for documents that already have them')
+        parser.add_argument('--only', choices=['invoices', 'quotations'],
+                            help='Only backfill one document type')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        after_id = options['after_id']
+        rebuild = options['rebuild']
+
+        if options['only'] != 'quotations':
+            count = self.backfill(Invoice, InvoiceLineItem, 'invoice', chunk_size, after_id, rebuild)
+            self.stdout.write(self.style.SUCCESS(f"Backfilled line items for {count} invoices"))
+
+        if options['only'] != 'invoices':
+            count = self.backfill(Quotation, QuotationLineItem, 'quotation', chunk_size, after_id, rebuild)
+            self.stdout.write(self.style.SUCCESS(f"Backfilled line items for {count} quotations"))
+
+    def backfill(self, document_model, line_item_model, document_field, chunk_size, after_id, rebuild):
+        queryset = document_model.objects.order_by('id')
+        if not rebuild:
+            queryset = queryset.filter(line_items__isnull=True)
+
+        processed = 0
+        last_id = after_id
+        while True:
+            # Keyset chunks so an interrupted run can resume with --after-id
+            chunk = list(queryset.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+
+            with transaction.atomic():
+                line_items = []
+                for document in chunk:
+                    document_fields = {document_field: document}
+                    if document_field == 'invoice':
+                        document_fields['invoice_date'] = document.invoice_date
+                        document_fields['is_gst'] = document.is_gst
+                    line_items.extend(build_line_items(
+                        line_item_model, document.user_id,
+                        getattr(document, document_field + '_json'), **document_fields))
+                line_item_model.objects.filter(**{document_field + '__in': chunk}).delete()
+                line_item_model.objects.bulk_create(line_items, batch_size=1000)
+
+            processed += len(chunk)
+            last_id = chunk[-1].id
+            self.stdout.write(f"  {document_field}s processed: {processed} (last id {last_id})")
+
+        return processed
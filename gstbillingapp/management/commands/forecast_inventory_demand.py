@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from gstbillingapp.forecasting import update_demand_forecasts, FORECAST_LEAD_TIME_DAYS, FORECAST_SAFETY_FACTOR
+
+
+class Command(BaseCommand):
+    help = 'Forecast product demand from sales logs and suggest stock alert levels (run nightly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='Only forecast the inventories of this user id (repeatable)')
+        parser.add_argument('--full', action='store_true',
+                            help='Forecast every inventory (default: only those with new inventory logs)')
+        parser.add_argument('--apply', action='store_true',
+                            help='Also raise alert_level to the suggested level where there were sales')
+        parser.add_argument('--allow-lower', action='store_true',
+                            help='With --apply, also lower alert_level to the suggested level')
+        parser.add_argument('--lead-time', type=float, default=FORECAST_LEAD_TIME_DAYS,
+                            help=f'Days between reordering and restocking (default: {FORECAST_LEAD_TIME_DAYS})')
+        parser.add_argument('--safety-factor', type=float, default=FORECAST_SAFETY_FACTOR,
+                            help=f'Safety stock in standard deviations of demand (default: {FORECAST_SAFETY_FACTOR})')
+
+    def handle(self, *args, **options):
+        count = update_demand_forecasts(options['user'], full=options['full'], apply=options['apply'],
+                                        lead_time=options['lead_time'], safety_factor=options['safety_factor'],
+                                        allow_lower=options['allow_lower'])
+        self.stdout.write(self.style.SUCCESS(f"Updated the demand forecast of {count} inventories"))
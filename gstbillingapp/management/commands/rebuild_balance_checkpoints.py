@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from gstbillingapp.utils import rebuild_balance_checkpoints
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly LedgerBalanceCheckpoint rows from the ledger rollups (run monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='Only rebuild the checkpoints of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rebuild_balance_checkpoints(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} balance checkpoints"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from gstbillingapp.utils import rebuild_ledger_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the LedgerMonthlyRollup table from the BookLog ledger'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='Only rebuild the rollups of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rebuild_ledger_rollups(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} monthly ledger rollups"))
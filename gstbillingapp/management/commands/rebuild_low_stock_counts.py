@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from gstbillingapp.utils import rebuild_low_stock_counts
+
+
+class Command(BaseCommand):
+    help = 'Recompute the low stock flags and per user low stock counts from the current stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='Only rebuild the counts of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rebuild_low_stock_counts(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"Found {count} low stock products"))
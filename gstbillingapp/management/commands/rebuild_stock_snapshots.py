@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from gstbillingapp.utils import rebuild_stock_snapshots
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly InventoryStockSnapshot rows from the inventory logs (run monthly)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            help='Only rebuild the snapshots of this user id (repeatable)')
+
+    def handle(self, *args, **options):
+        count = rebuild_stock_snapshots(options['user'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} stock snapshots"))
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Sum, Q, F, Case, When, Value, FloatField
+from django.db.models.functions import Coalesce
+from gstbillingapp.models import Book, BOOK_BALANCE_CHANGE_TYPES
+
+
+class Command(BaseCommand):
+    help = 'Verify Book.current_balance against the sum of its ledger and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Repair drifted balances (default: only report them)')
+        parser.add_argument('--user', type=int,
+                            help='Only check the books of this user id')
+        parser.add_argument('--tolerance', type=float, default=0.005,
+                            help='Largest difference not treated as drift (default: 0.005)')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Number of books repaired per UPDATE (default: 500)')
+
+    def handle(self, *args, **options):
+        books = Book.objects.order_by('id')
+        if options['user']:
+            books = books.filter(user_id=options['user'])
+
+        # Expected balances of every book in one grouped query
+        books = books.annotate(expected=Coalesce(
+            Sum('booklog__change', filter=Q(booklog__is_active=True,
+                                           booklog__change_type__in=BOOK_BALANCE_CHANGE_TYPES)),
+            Value(0.0), output_field=FloatField()))
+
+        checked = 0
+        drifted = []
+        for book_id, current_balance, expected in books.values_list('id', 'current_balance', 'expected').iterator():
+            checked += 1
+            if abs(current_balance - expected) > options['tolerance']:
+                drifted.append((book_id, expected - current_balance))
+                self.stdout.write(f"  Book {book_id}: balance {current_balance}, ledger {round(expected, 2)}")
+
+        self.stdout.write(f"Checked {checked} books, {len(drifted)} drifted")
+        if not options['fix'] or not drifted:
+            return
+
+        batch_size = options['batch_size']
+        for start in range(0, len(drifted), batch_size):
+            batch = drifted[start:start + batch_size]
+            # Corrections are applied as deltas, so ledger writes racing with the
+            # check are not lost
+            correction = Case(*[When(id=book_id, then=Value(delta)) for book_id, delta in batch],
+                              default=Value(0.0), output_field=FloatField())
+            with transaction.atomic():
+                Book.objects.filter(id__in=[book_id for book_id, _ in batch]).update(
+                    current_balance=F('current_balance') + correction)
+        self.stdout.write(self.style.SUCCESS(f"Repaired {len(drifted)} book balances"))
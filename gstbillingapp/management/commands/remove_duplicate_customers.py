@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.db.models import Count, Sum
 from django.db import transaction
 from gstbillingapp.models import Customer, Book, BookLog, Invoice, Quotation
+from gstbillingapp.utils import rebuild_ledger_rollups, rebuild_balance_checkpoints
 
 
 class Command(BaseCommand):
@@ -117,6 +118,10 @@ class Command(BaseCommand):
                     
                     self.stdout.write(f"  ✓ Updated keeper's book balance: {total_balance}")
 
+                    # Logs moved between books, so the monthly rollups and checkpoints are rebuilt for this user
+                    rebuild_ledger_rollups([keeper.user_id])
+                    rebuild_balance_checkpoints([keeper.user_id])
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n{"="*60}\n'
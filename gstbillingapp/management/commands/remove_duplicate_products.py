@@ -1,7 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db.models import Count, Sum
 from django.db import transaction
-from gstbillingapp.models import Product, Inventory, InventoryLog
+from gstbillingapp.models import Product, Inventory, InventoryLog, InvoiceLineItem, QuotationLineItem
+from gstbillingapp.utils import rebuild_low_stock_counts, rebuild_stock_snapshots
 
 
 class Command(BaseCommand):
@@ -47,6 +48,10 @@ class Command(BaseCommand):
                     
                     # Update all inventory logs to point to keeper
                     InventoryLog.objects.filter(product=product).update(product=keeper)
+
+                    # Line item products are SET_NULL, so move them before the delete
+                    InvoiceLineItem.objects.filter(product=product).update(product=keeper)
+                    QuotationLineItem.objects.filter(product=product).update(product=keeper)
                     
                     # Check for inventory record
                     duplicate_inventory = Inventory.objects.filter(product=product).first()
@@ -73,7 +78,7 @@ class Command(BaseCommand):
                     # Update inventory
                     keeper_inventory.current_stock = total_stock
                     keeper_inventory.last_log = last_log
-                    keeper_inventory.save()
+                    keeper_inventory.save(update_fields=['current_stock', 'last_log'])
                     
                     self.stdout.write(f"  ✓ Updated inventory stock: {total_stock}")
                 else:
@@ -93,6 +98,11 @@ class Command(BaseCommand):
                         )
                         self.stdout.write(f"  ✓ Created inventory with stock: {total_stock}")
 
+                # Inventory rows were deleted and the keeper's stock recomputed
+                rebuild_low_stock_counts([keeper.user_id])
+                # The logs were moved with update(), which skips the snapshot deltas
+                rebuild_stock_snapshots([keeper.user_id])
+
         self.stdout.write(
             self.style.SUCCESS(
                 f'\n{"="*60}\n'
@@ -15,6 +15,7 @@ urlpatterns = [
     path('customer/profile', customer.customer_profile, name='v1customerprofile'),
     path('customer/invoices', customer.customer_invoices, name='v1customerinvoices'),
     path('customer/invoice_viewer/<int:invoice_id>', customer.customer_invoice_viewer, name='v1customerinvoiceviewer'),
+    path('customer/invoice_pdf/<int:invoice_id>', customer.customer_invoice_pdf, name='v1customerinvoicepdf'),
     path('customer/notifications', customer.customer_notifications, name='v1customernotifications'),
     
     # Customer Ordering URLs
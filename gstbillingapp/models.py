@@ -1,10 +1,15 @@
 # Django imports
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 
 # Python imports
+import json
+import time
 from datetime import datetime
-from django.db.models import Q
+from django.core.cache import cache
+from django.utils import timezone
+from django.db.models import Q, F, Case, When, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ValidationError
 
 # ========================== SAAS Data models ==================================
@@ -23,6 +28,8 @@ class UserProfile(models.Model):
     business_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     business_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     bankdetails = models.ForeignKey('BankDetails', blank=True, null=True, on_delete=models.SET_NULL)
+    # Products with 0 < current_stock <= alert_level, maintained by utils.check_low_stock
+    low_stock_count = models.IntegerField(default=0)
 
     def save(self, *args, **kwargs):
         if self.business_title:
@@ -62,6 +69,166 @@ class BillingProfile(models.Model):
 
 # ======================= Invoice Data models =================================
 
+def document_totals_from_json(document_json):
+    """
+    Extract the stored totals of an invoice/quotation JSON document.
+    Returns a dict with with_gst, without_gst, sgst, cgst, igst, item_count, total_qty,
+    and the customer_name / customer_gst the document was issued to.
+    """
+    totals = {
+        'with_gst': 0.0, 'without_gst': 0.0,
+        'sgst': 0.0, 'cgst': 0.0, 'igst': 0.0,
+        'item_count': 0, 'total_qty': 0.0,
+        'customer_name': '', 'customer_gst': '',
+    }
+    try:
+        data = json.loads(document_json) if isinstance(document_json, str) else (document_json or {})
+        items = data.get('items', []) or []
+        totals['with_gst'] = float(data.get('invoice_total_amt_with_gst') or 0)
+        if 'invoice_total_amt_without_gst' in data:
+            totals['without_gst'] = float(data.get('invoice_total_amt_without_gst') or 0)
+        else:
+            # Admin edited orders only store the GST total
+            totals['without_gst'] = totals['with_gst'] - float(data.get('invoice_total_gst') or 0)
+        totals['sgst'] = float(data.get('invoice_total_amt_sgst') or 0)
+        totals['cgst'] = float(data.get('invoice_total_amt_cgst') or 0)
+        totals['igst'] = float(data.get('invoice_total_amt_igst') or 0)
+        totals['item_count'] = len(items)
+        totals['total_qty'] = sum(float(item.get('invoice_qty') or 0) for item in items)
+        totals['customer_name'] = str(data.get('customer_name') or '')[:200]
+        totals['customer_gst'] = str(data.get('customer_gst') or '').strip().upper()[:15]
+    except Exception:
+        pass
+    return totals
+
+
+def document_line_items_from_json(document_json):
+    """
+    Normalize the items of an invoice/quotation JSON document into line item dicts.
+    Handles the invoice form, customer order and admin order item layouts.
+    """
+    try:
+        data = json.loads(document_json) if isinstance(document_json, str) else (document_json or {})
+        items = data.get('items', []) or []
+    except Exception:
+        return []
+
+    line_items = []
+    for line_no, item in enumerate(items, start=1):
+        try:
+            qty = float(item.get('invoice_qty') or 0)
+            gst_percentage = float(item.get('invoice_gst_percentage') or 0)
+            rate_with_gst = float(item.get('invoice_rate_with_gst') or item.get('invoice_discounted_rate') or item.get('invoice_rate') or 0)
+            if 'invoice_rate_without_gst' in item:
+                rate_without_gst = float(item.get('invoice_rate_without_gst') or 0)
+            else:
+                rate_without_gst = rate_with_gst / (1 + gst_percentage / 100)
+            if 'invoice_amt_with_gst' in item:
+                amt_with_gst = float(item.get('invoice_amt_with_gst') or 0)
+            elif 'invoice_amt' in item:
+                amt_with_gst = float(item.get('invoice_amt') or 0)
+            else:
+                amt_with_gst = rate_with_gst * qty
+            if 'invoice_amt_without_gst' in item:
+                amt_without_gst = float(item.get('invoice_amt_without_gst') or 0)
+            elif 'invoice_gst_amount' in item:
+                amt_without_gst = amt_with_gst - float(item.get('invoice_gst_amount') or 0)
+            else:
+                amt_without_gst = amt_with_gst / (1 + gst_percentage / 100)
+            if any(key in item for key in ['invoice_amt_sgst', 'invoice_amt_cgst', 'invoice_amt_igst']):
+                amt_sgst = float(item.get('invoice_amt_sgst') or 0)
+                amt_cgst = float(item.get('invoice_amt_cgst') or 0)
+                amt_igst = float(item.get('invoice_amt_igst') or 0)
+            elif data.get('igstcheck'):
+                amt_sgst, amt_cgst, amt_igst = 0.0, 0.0, amt_with_gst - amt_without_gst
+            else:
+                # Order items only carry the GST total, split it into SGST/CGST
+                amt_sgst = amt_cgst = (amt_with_gst - amt_without_gst) / 2
+                amt_igst = 0.0
+        except (TypeError, ValueError, AttributeError):
+            continue
+
+        line_items.append({
+            'line_no': line_no,
+            'model_no': str(item.get('invoice_model_no') or '').upper(),
+            'product_name': item.get('invoice_product') or item.get('invoice_product_name') or '',
+            'hsn': item.get('invoice_hsn') or '',
+            'qty': qty,
+            'discount': float(item.get('invoice_discount') or 0),
+            'gst_percentage': gst_percentage,
+            'rate_with_gst': rate_with_gst,
+            'rate_without_gst': rate_without_gst,
+            'amt_without_gst': amt_without_gst,
+            'amt_sgst': amt_sgst,
+            'amt_cgst': amt_cgst,
+            'amt_igst': amt_igst,
+            'amt_with_gst': amt_with_gst,
+        })
+    return line_items
+
+
+def build_line_items(line_item_model, user_id, document_json, products=None, **document_fields):
+    """
+    Build unsaved line item rows for a document, linking each to the user's Product by model number.
+    products optionally maps model_no -> product id to skip the lookup when building many documents.
+    """
+    line_items = document_line_items_from_json(document_json)
+    model_nos = set(item['model_no'] for item in line_items if item['model_no'])
+    if products is None:
+        products = {}
+        if model_nos:
+            products = dict(Product.objects.filter(user_id=user_id, model_no__in=model_nos).values_list('model_no', 'id'))
+    return [
+        line_item_model(user_id=user_id, product_id=products.get(item['model_no']), **document_fields, **item)
+        for item in line_items
+    ]
+
+
+def bump_cache_versions(keys):
+    """
+    Set cache version keys to a new version now and, inside a transaction, once more
+    when it commits: a result computed in between from the old committed rows is
+    cached under the first version and never read after the commit.
+    """
+    def bump():
+        version = time.time_ns()
+        cache.set_many({key: version for key in keys}, None)
+
+    bump()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(bump)
+
+
+def invoice_period_version_key(user_id, year, month):
+    return f"invoice-period-version:{user_id}:{year}-{month:02d}"
+
+
+def touch_invoice_period(user_id, date):
+    """
+    Mark the invoices of the month containing date as changed, so reports cached
+    for that (user, month) are rebuilt (see gst_reports).
+    """
+    if isinstance(date, str):
+        date = datetime.strptime(date[:10], '%Y-%m-%d')
+    bump_cache_versions([invoice_period_version_key(user_id, date.year, date.month)])
+
+
+ANALYTICS_DOMAINS = ['books', 'inventory', 'purchases', 'expenses', 'invoices']
+
+
+def analytics_version_key(user_id, domain):
+    return f"analytics-version:{user_id}:{domain}"
+
+
+def touch_analytics(user_id, *domains):
+    """
+    Mark a user's data of the given domains as changed, so analytics cached
+    from it are recomputed (see analytics_cache).
+    """
+    if user_id:
+        bump_cache_versions([analytics_version_key(user_id, domain) for domain in domains])
+
+
 class Customer(models.Model):
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     customer_name = models.CharField(max_length=200)
@@ -108,7 +275,78 @@ class Invoice(models.Model):
     inventory_reflected = models.BooleanField(default=True)
     books_reflected = models.BooleanField(default=True)
     is_gst = models.BooleanField(default=True)
-    
+
+    # Totals materialized from invoice_json (kept in sync on save)
+    invoice_total_amt_with_gst = models.FloatField(default=0, db_index=True)
+    invoice_total_amt_without_gst = models.FloatField(default=0)
+    invoice_total_amt_sgst = models.FloatField(default=0)
+    invoice_total_amt_cgst = models.FloatField(default=0)
+    invoice_total_amt_igst = models.FloatField(default=0)
+    invoice_item_count = models.IntegerField(default=0)
+    invoice_total_qty = models.FloatField(default=0)
+    # Customer as printed on the invoice; GSTR-1 reports B2B by this GSTIN, not the customer's current one
+    invoice_customer_name = models.CharField(max_length=200, blank=True, default='')
+    invoice_customer_gst = models.CharField(max_length=15, blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'invoice_date']),
+            models.Index(fields=['user', 'is_gst', 'invoice_number']),
+        ]
+
+    def update_totals_from_json(self):
+        """Copy the totals stored in invoice_json into the typed total columns"""
+        totals = document_totals_from_json(self.invoice_json)
+        self.invoice_total_amt_with_gst = totals['with_gst']
+        self.invoice_total_amt_without_gst = totals['without_gst']
+        self.invoice_total_amt_sgst = totals['sgst']
+        self.invoice_total_amt_cgst = totals['cgst']
+        self.invoice_total_amt_igst = totals['igst']
+        self.invoice_item_count = totals['item_count']
+        self.invoice_total_qty = totals['total_qty']
+        self.invoice_customer_name = totals['customer_name']
+        self.invoice_customer_gst = totals['customer_gst']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._line_items_source = instance.line_items_source()
+        return instance
+
+    def line_items_source(self):
+        """Values the stored line items are derived from (None when invoice_json is deferred)"""
+        if 'invoice_json' in self.get_deferred_fields():
+            return None
+        return (self.invoice_json, str(self.invoice_date)[:10], self.is_gst, self.user_id)
+
+    def sync_line_items(self):
+        """Rewrite the InvoiceLineItem rows of this invoice from invoice_json"""
+        InvoiceLineItem.objects.filter(invoice=self).delete()
+        InvoiceLineItem.objects.bulk_create(build_line_items(
+            InvoiceLineItem, self.user_id, self.invoice_json,
+            invoice=self, invoice_date=self.invoice_date, is_gst=self.is_gst))
+        self._line_items_source = self.line_items_source()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        json_saved = update_fields is None or 'invoice_json' in update_fields
+        if json_saved:
+            self.update_totals_from_json()
+        super().save(*args, **kwargs)
+        source = self.line_items_source()
+        previous_source = getattr(self, '_line_items_source', None)
+        if source is not None and source != previous_source:
+            self.sync_line_items()
+            touch_invoice_period(self.user_id, self.invoice_date)
+            if previous_source is not None and previous_source[1:] != source[1:]:
+                touch_invoice_period(previous_source[3], previous_source[1])
+        touch_analytics(self.user_id, 'invoices')
+
+    def delete(self, *args, **kwargs):
+        touch_invoice_period(self.user_id, self.invoice_date)
+        touch_analytics(self.user_id, 'invoices')
+        return super().delete(*args, **kwargs)
+
     def __str__(self):
         return str(self.invoice_number) + " | " + str(self.invoice_date)
 
@@ -166,7 +404,16 @@ class Quotation(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     created_by_customer = models.BooleanField(default=False)  # For customer self-orders
     notes = models.TextField(blank=True, null=True)
-    
+
+    # Totals materialized from quotation_json (kept in sync on save)
+    quotation_total_amt_with_gst = models.FloatField(default=0, db_index=True)
+    quotation_total_amt_without_gst = models.FloatField(default=0)
+    quotation_total_amt_sgst = models.FloatField(default=0)
+    quotation_total_amt_cgst = models.FloatField(default=0)
+    quotation_total_amt_igst = models.FloatField(default=0)
+    quotation_item_count = models.IntegerField(default=0)
+    quotation_total_qty = models.FloatField(default=0)
+
     class Meta:
         ordering = ['-quotation_date', '-id']
         indexes = [
@@ -174,7 +421,47 @@ class Quotation(models.Model):
             models.Index(fields=['quotation_customer', 'status']),
             models.Index(fields=['status', 'quotation_date']),
         ]
-    
+
+    def update_totals_from_json(self):
+        """Copy the totals stored in quotation_json into the typed total columns"""
+        totals = document_totals_from_json(self.quotation_json)
+        self.quotation_total_amt_with_gst = totals['with_gst']
+        self.quotation_total_amt_without_gst = totals['without_gst']
+        self.quotation_total_amt_sgst = totals['sgst']
+        self.quotation_total_amt_cgst = totals['cgst']
+        self.quotation_total_amt_igst = totals['igst']
+        self.quotation_item_count = totals['item_count']
+        self.quotation_total_qty = totals['total_qty']
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._line_items_source = instance.line_items_source()
+        return instance
+
+    def line_items_source(self):
+        """Values the stored line items are derived from (None when quotation_json is deferred)"""
+        if 'quotation_json' in self.get_deferred_fields():
+            return None
+        return (self.quotation_json, self.user_id)
+
+    def sync_line_items(self):
+        """Rewrite the QuotationLineItem rows of this quotation from quotation_json"""
+        QuotationLineItem.objects.filter(quotation=self).delete()
+        QuotationLineItem.objects.bulk_create(build_line_items(
+            QuotationLineItem, self.user_id, self.quotation_json, quotation=self))
+        self._line_items_source = self.line_items_source()
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        json_saved = update_fields is None or 'quotation_json' in update_fields
+        if json_saved:
+            self.update_totals_from_json()
+        super().save(*args, **kwargs)
+        source = self.line_items_source()
+        if source is not None and source != getattr(self, '_line_items_source', None):
+            self.sync_line_items()
+
     def __str__(self):
         return f"QT-{self.quotation_number} | {self.quotation_date} | {self.status}"
     
@@ -193,6 +480,85 @@ class Quotation(models.Model):
             return True  # Invoice was deleted, allow deletion
         return self.status != 'CONVERTED'
 
+class DocumentLineItem(models.Model):
+    """
+    One item row of an invoice/quotation, normalized out of the document JSON
+    so product, HSN and GST rate reports can run as indexed GROUP BY queries.
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    product = models.ForeignKey('Product', null=True, blank=True, on_delete=models.SET_NULL)
+    line_no = models.IntegerField(default=1)
+    model_no = models.CharField(max_length=200, blank=True)
+    product_name = models.CharField(max_length=200, blank=True)
+    hsn = models.CharField(max_length=50, blank=True)
+    qty = models.FloatField(default=0)
+    discount = models.FloatField(default=0)
+    gst_percentage = models.FloatField(default=0)
+    rate_with_gst = models.FloatField(default=0)
+    rate_without_gst = models.FloatField(default=0)
+    amt_without_gst = models.FloatField(default=0)
+    amt_sgst = models.FloatField(default=0)
+    amt_cgst = models.FloatField(default=0)
+    amt_igst = models.FloatField(default=0)
+    amt_with_gst = models.FloatField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['line_no']
+
+
+class InvoiceLineItem(DocumentLineItem):
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='line_items')
+    invoice_date = models.DateField()
+    is_gst = models.BooleanField(default=True)
+
+    class Meta(DocumentLineItem.Meta):
+        indexes = [
+            models.Index(fields=['user', 'invoice_date']),
+            models.Index(fields=['user', 'product', 'invoice_date']),
+            models.Index(fields=['user', 'hsn']),
+        ]
+
+    def __str__(self):
+        return f"{self.invoice_id} | {self.model_no} x {self.qty}"
+
+
+class QuotationLineItem(DocumentLineItem):
+    quotation = models.ForeignKey(Quotation, on_delete=models.CASCADE, related_name='line_items')
+
+    class Meta(DocumentLineItem.Meta):
+        indexes = [
+            models.Index(fields=['user', 'product']),
+        ]
+
+    def __str__(self):
+        return f"QT {self.quotation_id} | {self.model_no} x {self.qty}"
+
+
+class DocumentSequence(models.Model):
+    """
+    Last allocated document number per numbering series.
+    GST documents share a series per GSTIN, non-GST documents are numbered per user.
+    """
+    DOCUMENT_TYPE_CHOICES = [
+        ('INVOICE', 'Invoice'),
+        ('QUOTATION', 'Quotation'),
+    ]
+
+    scope = models.CharField(max_length=50)  # GSTIN, or "USER-<id>" for per-user series
+    document_type = models.CharField(max_length=20, choices=DOCUMENT_TYPE_CHOICES)
+    is_gst = models.BooleanField(default=True)
+    fiscal_year = models.IntegerField()  # Starting year of the April-March fiscal year
+    last_number = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = [['scope', 'document_type', 'is_gst', 'fiscal_year']]
+
+    def __str__(self):
+        return f"{self.scope} | {self.document_type} | {'GST' if self.is_gst else 'NON-GST'} | FY{self.fiscal_year} | {self.last_number}"
+
+
 class ProductCategory(models.Model):
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
     category_name = models.CharField(max_length=100)
@@ -268,6 +634,31 @@ class InventoryLog(models.Model):
     associated_invoice = models.ForeignKey(Invoice, blank=True, null=True, default=None, on_delete=models.SET_NULL)
     description = models.TextField(max_length=600, blank=True, null=True)
 
+    def save(self, *args, **kwargs):
+        """Shift the stock snapshots after the log's month by its change (or the edit of it)"""
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding and self.pk:
+                previous = InventoryLog.objects.filter(pk=self.pk).values_list('product_id', 'date', 'change').first()
+            super().save(*args, **kwargs)
+            deltas = {}
+            if previous:
+                add_stock_snapshot_delta(deltas, *previous, sign=-1)
+            add_stock_snapshot_delta(deltas, self.product_id, self.date, self.change)
+            apply_stock_snapshot_deltas(deltas)
+        touch_analytics(self.user_id, 'inventory')
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            stored = InventoryLog.objects.filter(pk=self.pk).values_list('product_id', 'date', 'change').first()
+            result = super().delete(*args, **kwargs)
+            if stored:
+                deltas = {}
+                add_stock_snapshot_delta(deltas, *stored, sign=-1)
+                apply_stock_snapshot_deltas(deltas)
+        touch_analytics(self.user_id, 'inventory')
+        return result
+
     def __str__(self):
         return self.product.model_no + " | " + str(self.change) + " | " + self.description + " | " + str(self.date)
 
@@ -277,10 +668,85 @@ class Inventory(models.Model):
     current_stock = models.IntegerField(default=0)
     alert_level = models.IntegerField(default=0)
     last_log = models.ForeignKey(InventoryLog, null=True, blank=True, default=None, on_delete=models.SET_NULL)
+    # Demand forecast, written by the forecast_inventory_demand job
+    suggested_alert_level = models.IntegerField(null=True, blank=True)
+    daily_demand = models.FloatField(default=0)
+    days_of_cover = models.FloatField(null=True, blank=True)
+    forecast_log_id = models.IntegerField(null=True, blank=True)
+    forecast_updated_at = models.DateTimeField(null=True, blank=True)
+    # Low stock state, kept by utils.check_low_stock: is_low_stock is what
+    # UserProfile.low_stock_count counts, low_stock_alerted is set once notified
+    # and cleared when the stock recovers above alert_level
+    is_low_stock = models.BooleanField(default=False)
+    low_stock_alerted = models.BooleanField(default=False)
 
     def __str__(self):
         return self.product.model_no
 
+class InventoryStockSnapshot(models.Model):
+    """
+    Stock of a product at the end of a month (local time): the sum of its inventory
+    logs dated before closing_at, the start of the next month. Written by the
+    rebuild_stock_snapshots job and shifted by later InventoryLog writes, so stock
+    as of any date is the nearest snapshot plus the logs after it.
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_snapshots')
+    year = models.IntegerField()
+    month = models.IntegerField()
+    closing_at = models.DateTimeField()
+    closing_stock = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'year', 'month')
+        indexes = [models.Index(fields=['product', 'closing_at'])]
+
+    def __str__(self):
+        return f"{self.product_id} | {self.year}-{self.month:02d} | {self.closing_stock}"
+
+
+def add_stock_snapshot_delta(deltas, product_id, date, change, sign=1):
+    """Add an inventory log's change to {(product id, year, month): change} deltas (undated logs count nowhere)"""
+    if product_id and date and change:
+        key = (product_id, *ledger_month(date))
+        deltas[key] = deltas.get(key, 0) + sign * change
+
+
+STOCK_SNAPSHOT_UPDATE_CHUNK_SIZE = 200
+
+
+def apply_stock_snapshot_deltas(deltas):
+    """
+    Shift the InventoryStockSnapshot rows closing after the month of each
+    {(product id, year, month): change} delta, so back-dated stock changes keep later
+    snapshots right. One lookup of the products that have snapshots, then one
+    Case/When UPDATE per month and chunk of products; without snapshots only the lookup runs.
+    """
+    deltas = {key: change for key, change in deltas.items() if change}
+    product_ids = list(set(product_id for product_id, _, _ in deltas))
+    with_snapshots = set()
+    for start in range(0, len(product_ids), STOCK_SNAPSHOT_UPDATE_CHUNK_SIZE):
+        chunk = product_ids[start:start + STOCK_SNAPSHOT_UPDATE_CHUNK_SIZE]
+        with_snapshots.update(InventoryStockSnapshot.objects.filter(product_id__in=chunk)
+                              .values_list('product_id', flat=True).distinct())
+    if not with_snapshots:
+        return
+
+    months = {}
+    for (product_id, year, month), change in deltas.items():
+        if product_id in with_snapshots:
+            months.setdefault((year, month), {})[product_id] = int(change)
+    for (year, month), changes in months.items():
+        month_start = timezone.make_aware(datetime(year, month, 1))
+        changed = list(changes)
+        for start in range(0, len(changed), STOCK_SNAPSHOT_UPDATE_CHUNK_SIZE):
+            chunk = changed[start:start + STOCK_SNAPSHOT_UPDATE_CHUNK_SIZE]
+            InventoryStockSnapshot.objects.filter(product_id__in=chunk, closing_at__gt=month_start).update(
+                closing_stock=F('closing_stock') + Case(
+                    *[When(product_id=product_id, then=Value(changes[product_id])) for product_id in chunk],
+                    default=Value(0), output_field=models.IntegerField()))
+
+
 # ========================= Books Data models ======================================
 
 class Book(models.Model):
@@ -293,6 +759,94 @@ class Book(models.Model):
         return self.customer.customer_name
 
 
+BOOK_BALANCE_CHANGE_TYPES = [0, 1, 2, 3]
+
+
+def book_log_balance_change(change, change_type, is_active):
+    """Part of a BookLog change counted in Book.current_balance: active logs of types 0-3"""
+    if is_active and change_type in BOOK_BALANCE_CHANGE_TYPES:
+        return float(change or 0)
+    return 0.0
+
+
+def ledger_month(date):
+    """(year, month) of a BookLog date in local time, as the date__year / date__month lookups see it"""
+    if date is None:
+        return (None, None)
+    date = BookLog._meta.get_field('date').to_python(date)
+    if timezone.is_naive(date):
+        date = timezone.make_aware(date)
+    date = timezone.localtime(date)
+    return (date.year, date.month)
+
+
+def book_log_ledger_source(parent_book_id, date, change, change_type, is_active):
+    return (parent_book_id, *ledger_month(date), int(change_type), bool(is_active), float(change or 0))
+
+
+def apply_ledger_rollup_deltas(deltas):
+    """
+    Add {(book id, year, month, change_type, is_active): (total, count)} deltas to
+    LedgerMonthlyRollup: missing rows are inserted, then one F() UPDATE per chunk applies them.
+    The balance checkpoints of the same and later months are moved along and the
+    books analytics of the owners are marked as changed.
+    """
+    deltas = {key: value for key, value in deltas.items() if key[0] and any(value)}
+    if not deltas:
+        return
+    books = {book_id: (user_id, customer_id) for book_id, user_id, customer_id in
+             Book.objects.filter(id__in={key[0] for key in deltas}).values_list('id', 'user_id', 'customer_id')}
+    for user_id in set(user_id for user_id, _ in books.values()):
+        touch_analytics(user_id, 'books')
+    # Undated logs belong to no month
+    deltas = {key: value for key, value in deltas.items() if key[1]}
+    keys = [key for key in deltas if key[0] in books]
+    LedgerMonthlyRollup.objects.bulk_create([
+        LedgerMonthlyRollup(book_id=book_id, user_id=books[book_id][0], customer_id=books[book_id][1],
+                            year=year, month=month, change_type=change_type, is_active=is_active)
+        for book_id, year, month, change_type, is_active in keys], ignore_conflicts=True)
+
+    for start in range(0, len(keys), 200):
+        chunk = keys[start:start + 200]
+        conditions = [Q(book_id=book_id, year=year, month=month, change_type=change_type, is_active=is_active)
+                      for book_id, year, month, change_type, is_active in chunk]
+        match = Q()
+        for condition in conditions:
+            match |= condition
+        LedgerMonthlyRollup.objects.filter(match).update(
+            total=F('total') + Case(*[When(condition, then=Value(float(deltas[key][0])))
+                                      for condition, key in zip(conditions, chunk)],
+                                    default=Value(0.0), output_field=models.FloatField()),
+            count=F('count') + Case(*[When(condition, then=Value(int(deltas[key][1])))
+                                      for condition, key in zip(conditions, chunk)],
+                                    default=Value(0), output_field=models.IntegerField()))
+    apply_balance_checkpoint_deltas(deltas)
+
+
+CHECKPOINT_TOTAL_FIELDS = {0: 'total_paid', 1: 'total_purchased', 2: 'total_returned', 3: 'total_others'}
+
+
+def apply_balance_checkpoint_deltas(deltas):
+    """
+    Shift the LedgerBalanceCheckpoint rows at or after the month of each
+    {(book id, year, month, change_type, is_active): (total, count)} delta, so
+    back-dated ledger edits keep later closing balances right. One UPDATE per
+    (book, month); months without checkpoints yet cost nothing.
+    """
+    changes = {}
+    for (book_id, year, month, change_type, is_active), (total, _) in deltas.items():
+        if not (book_id and year and total and is_active and change_type in BOOK_BALANCE_CHANGE_TYPES):
+            continue
+        totals = changes.setdefault((book_id, year, month), {})
+        field = CHECKPOINT_TOTAL_FIELDS[change_type]
+        totals[field] = totals.get(field, 0.0) + total
+    for (book_id, year, month), totals in changes.items():
+        updates = {field: F(field) + Value(float(total)) for field, total in totals.items()}
+        updates['closing_balance'] = F('closing_balance') + Value(float(sum(totals.values())))
+        LedgerBalanceCheckpoint.objects.filter(
+            Q(year__gt=year) | Q(year=year, month__gte=month), book_id=book_id).update(**updates)
+
+
 class BookLog(models.Model):
     parent_book = models.ForeignKey(Book, null=True, blank=True, on_delete=models.CASCADE)
     date = models.DateTimeField(default=datetime.now, blank=True, null=True)
@@ -312,9 +866,131 @@ class BookLog(models.Model):
     createdby = models.CharField(max_length=100, blank=True, null=True, default='SYSTEM')
     is_active = models.BooleanField(default=True)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._ledger_source = instance.ledger_source()
+        return instance
+
+    def ledger_source(self):
+        """
+        (book id, year, month, change_type, is_active, change) this log contributes
+        to Book.current_balance and the monthly rollups (None when fields are deferred)
+        """
+        if self.get_deferred_fields() & {'parent_book_id', 'date', 'change', 'change_type', 'is_active'}:
+            return None
+        return book_log_ledger_source(self.parent_book_id, self.date, self.change, self.change_type, self.is_active)
+
+    def _read_ledger_source(self):
+        row = BookLog.objects.filter(pk=self.pk).values_list(
+            'parent_book_id', 'date', 'change', 'change_type', 'is_active').first()
+        return book_log_ledger_source(*row) if row else None
+
+    def _stored_ledger_source(self):
+        """ledger_source() as of the last save, read back from the database if unknown"""
+        source = getattr(self, '_ledger_source', None)
+        if source is None and self.pk:
+            source = self._read_ledger_source()
+        return source
+
+    def _apply_ledger_source(self, source, sign, set_last_log=False):
+        book_id, year, month, change_type, is_active, change = source
+        if not book_id:
+            return
+        updates = {}
+        balance_change = book_log_balance_change(change, change_type, is_active)
+        if balance_change:
+            updates['current_balance'] = F('current_balance') + sign * balance_change
+        if set_last_log:
+            updates['last_log'] = self.id
+        if updates:
+            Book.objects.filter(id=book_id).update(**updates)
+        apply_ledger_rollup_deltas({(book_id, year, month, change_type, is_active): (sign * change, sign)})
+
+    def save(self, *args, **kwargs):
+        """
+        Keep Book.current_balance and the monthly rollups in step with O(1) F()
+        deltas instead of re-summing the ledger. Bulk writes go through
+        utils.apply_book_deltas.
+        """
+        adding = self._state.adding
+        with transaction.atomic():
+            previous = None if adding else self._stored_ledger_source()
+            super().save(*args, **kwargs)
+            source = self.ledger_source() or self._read_ledger_source()
+            if adding or previous != source:
+                if previous:
+                    self._apply_ledger_source(previous, -1)
+                self._apply_ledger_source(source, 1, set_last_log=adding)
+            self._ledger_source = source
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            source = self._stored_ledger_source()
+            result = super().delete(*args, **kwargs)
+            if source:
+                self._apply_ledger_source(source, -1)
+                # last_log is SET_NULL, so it falls back to the newest remaining log
+                latest_log = BookLog.objects.filter(parent_book_id=OuterRef('id')).order_by('-id').values('id')[:1]
+                Book.objects.filter(id=source[0]).update(
+                    last_log=Coalesce(F('last_log_id'), Subquery(latest_log), output_field=models.IntegerField()))
+        return result
+
     def __str__(self):
         return self.parent_book.customer.customer_name + " | " + str(self.change) + " | " + self.description + " | " + str(self.date)
 
+    class Meta:
+        indexes = [
+            # Covers whole-ledger reads (analytics, statements) without table lookups
+            models.Index(fields=['parent_book', 'is_active', 'change_type', 'date', 'change']),
+        ]
+
+class LedgerMonthlyRollup(models.Model):
+    """
+    BookLog totals per book, month, change type and active flag, kept in step by
+    BookLog writes so dashboards read months instead of transactions.
+    Rebuilt from the ledger with the rebuild_ledger_rollups command.
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    customer = models.ForeignKey(Customer, null=True, blank=True, on_delete=models.SET_NULL)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='monthly_rollups')
+    year = models.IntegerField()
+    month = models.IntegerField()
+    change_type = models.IntegerField(choices=BookLog.CHANGE_TYPES)
+    is_active = models.BooleanField(default=True)
+    total = models.FloatField(default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'year', 'month', 'change_type', 'is_active')
+        indexes = [models.Index(fields=['user', 'year', 'month'])]
+
+    def __str__(self):
+        return f"{self.book_id} | {self.year}-{self.month:02d} | {self.change_type} | {self.total}"
+
+class LedgerBalanceCheckpoint(models.Model):
+    """
+    Closing balance of a book at the end of a month (local time) together with the
+    cumulative totals per change type, counting active logs of types 0-3. Written by
+    the rebuild_balance_checkpoints job and shifted by later ledger writes, so a
+    balance as of any date is the nearest checkpoint plus a few months of rollups.
+    """
+    user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    year = models.IntegerField()
+    month = models.IntegerField()
+    closing_balance = models.FloatField(default=0)
+    total_paid = models.FloatField(default=0)
+    total_purchased = models.FloatField(default=0)
+    total_returned = models.FloatField(default=0)
+    total_others = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('book', 'year', 'month')
+
+    def __str__(self):
+        return f"{self.book_id} | {self.year}-{self.month:02d} | {self.closing_balance}"
+
 # ========================= Purchase Data models ====================================
 class PurchaseLog(models.Model):
     user = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
@@ -338,6 +1014,11 @@ class PurchaseLog(models.Model):
             self.category = self.category.upper()
 
         super().save(*args, **kwargs)
+        touch_analytics(self.user_id, 'purchases')
+
+    def delete(self, *args, **kwargs):
+        touch_analytics(self.user_id, 'purchases')
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return str(self.date)
@@ -388,6 +1069,11 @@ class ExpenseTracker(models.Model):
         if self.amount:
             self.amount = abs(round(self.amount, 2))
         super().save(*args, **kwargs)
+        touch_analytics(self.user_id, 'expenses')
+
+    def delete(self, *args, **kwargs):
+        touch_analytics(self.user_id, 'expenses')
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return self.reference + " | " + str(self.amount) + " | " + str(self.category)
@@ -0,0 +1,160 @@
+# Django imports
+from django.utils import timezone
+
+# Third-party libraries
+import numpy as np
+
+# Model imports
+from .models import BookLog, Customer, BOOK_BALANCE_CHANGE_TYPES
+from .arrays import datetime_column, epoch_seconds, SECONDS_PER_DAY
+
+
+RFM_SCORE_LEVELS = 5
+
+# (segment, minimum recency score, minimum frequency/monetary score), first match wins
+RFM_SEGMENTS = [
+    ('Champions', 4, 4),
+    ('Loyal', 3, 3),
+    ('Promising', 4, 1),
+    ('At Risk', 1, 3),
+    ('Hibernating', 1, 1),
+]
+
+
+# ================ RFM Data Methods ===========================
+def ledger_arrays(user):
+    """
+    The active ledger of a tenant as NumPy arrays, read with a single values_list:
+    customer ids, entry times (epoch seconds), change types and changes.
+    """
+    ledger = BookLog.objects.filter(
+        parent_book__user=user, parent_book__customer__isnull=False, is_active=True,
+        change_type__in=BOOK_BALANCE_CHANGE_TYPES, date__isnull=False,
+    ).order_by()
+    ledger, date_field = datetime_column(ledger, 'date')
+    rows = list(ledger.values_list('parent_book__customer_id', date_field, 'change_type', 'change'))
+
+    count = len(rows)
+    customer_ids, dates, change_types, changes = zip(*rows) if rows else ((), (), (), ())
+    return (
+        np.fromiter(customer_ids, dtype=np.int64, count=count),
+        epoch_seconds(dates),
+        np.fromiter(change_types, dtype=np.int8, count=count),
+        np.fromiter(changes, dtype=np.float64, count=count),
+    )
+
+
+def quantile_scores(values, levels=RFM_SCORE_LEVELS):
+    """Scores 1..levels by rank, higher values scoring higher and equal values scoring alike"""
+    if not len(values):
+        return np.zeros(0, dtype=np.int64)
+    ranks = np.searchsorted(np.sort(values), values, side='left')
+    return 1 + ranks * levels // len(values)
+
+
+def _payment_delays(customer_index, times, is_purchase, is_payment):
+    """
+    Days from each purchase to the customer's next payment, found for all purchases
+    at once with searchsorted on (customer, time) keys. NaN where no payment followed.
+    """
+    span = (times.max() - times.min() + 1) if len(times) else 1
+    keys = customer_index * span + (times - (times.min() if len(times) else 0))
+    payment_keys = np.sort(keys[is_payment])
+    payment_customers = np.floor(payment_keys / span).astype(np.int64)
+
+    purchase_keys = keys[is_purchase]
+    position = np.searchsorted(payment_keys, purchase_keys, side='left')
+    found = position < len(payment_keys)
+    position = np.minimum(position, max(len(payment_keys) - 1, 0))
+    if len(payment_keys):
+        found &= payment_customers[position] == customer_index[is_purchase]
+    delays = np.full(len(purchase_keys), np.nan)
+    if len(payment_keys):
+        delays[found] = (payment_keys[position[found]] - purchase_keys[found]) / SECONDS_PER_DAY
+    return delays
+
+
+# ================ RFM Methods ===========================
+def customer_rfm(user, now=None):
+    """
+    Recency, frequency and monetary value of every customer with purchases, with
+    payment behaviour, computed vectorized over the whole ledger:
+      recency_days (since the last purchase), frequency (purchases), monetary
+      (purchased amount), total_paid, payment_ratio (credits / purchases),
+      avg/max_payment_delay_days (purchase to next payment), open_purchases
+      (purchases with no payment since), r/f/m scores 1-5 and a segment.
+    Returns a list of dicts, best customers first.
+    """
+    now = (now or timezone.now()).timestamp()
+    customer_ids, times, change_types, changes = ledger_arrays(user)
+    if not len(customer_ids):
+        return []
+
+    customers, customer_index = np.unique(customer_ids, return_inverse=True)
+    count = len(customers)
+    amounts = np.abs(changes)
+    is_purchase = change_types == 1
+    is_payment = change_types == 0
+
+    frequency = np.bincount(customer_index[is_purchase], minlength=count)
+    monetary = np.bincount(customer_index[is_purchase], weights=amounts[is_purchase], minlength=count)
+    total_paid = np.bincount(customer_index[is_payment], weights=amounts[is_payment], minlength=count)
+    credits = np.bincount(customer_index[~is_purchase], weights=amounts[~is_purchase], minlength=count)
+    last_purchase = np.full(count, -np.inf)
+    np.maximum.at(last_purchase, customer_index[is_purchase], times[is_purchase])
+
+    delays = _payment_delays(customer_index, times, is_purchase, is_payment)
+    purchase_customers = customer_index[is_purchase]
+    paid = ~np.isnan(delays)
+    delay_count = np.bincount(purchase_customers[paid], minlength=count)
+    delay_total = np.bincount(purchase_customers[paid], weights=delays[paid], minlength=count)
+    max_delay = np.zeros(count)
+    np.maximum.at(max_delay, purchase_customers[paid], delays[paid])
+    open_purchases = np.bincount(purchase_customers[~paid], minlength=count)
+
+    # Only customers who bought something are ranked
+    buyers = frequency > 0
+    recency = (now - last_purchase[buyers]) / SECONDS_PER_DAY
+    r_scores = quantile_scores(-recency)
+    f_scores = quantile_scores(frequency[buyers])
+    m_scores = quantile_scores(monetary[buyers])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_delay = np.where(delay_count > 0, delay_total / delay_count, np.nan)[buyers]
+        payment_ratio = credits[buyers] / monetary[buyers]
+
+    buyer_ids = customers[buyers].tolist()
+    names = dict(Customer.objects.filter(id__in=buyer_ids).values_list('id', 'customer_name'))
+    columns = zip(buyer_ids, recency.tolist(), frequency[buyers].tolist(), monetary[buyers].tolist(),
+                  total_paid[buyers].tolist(), payment_ratio.tolist(), avg_delay.tolist(),
+                  max_delay[buyers].tolist(), open_purchases[buyers].tolist(),
+                  r_scores.tolist(), f_scores.tolist(), m_scores.tolist())
+    results = []
+    for customer_id, recency_days, purchases, purchased, paid_total, ratio, average, longest, unpaid, r, f, m in columns:
+        results.append({
+            'customer_id': customer_id,
+            'name': names.get(customer_id, ''),
+            'recency_days': round(recency_days, 1),
+            'frequency': purchases,
+            'monetary': round(purchased, 2),
+            'total_paid': round(paid_total, 2),
+            'payment_ratio': round(ratio, 3),
+            'avg_payment_delay_days': None if np.isnan(average) else round(average, 1),
+            'max_payment_delay_days': round(longest, 1),
+            'open_purchases': unpaid,
+            'r_score': r,
+            'f_score': f,
+            'm_score': m,
+            'rfm_score': f"{r}{f}{m}",
+            'segment': rfm_segment(r, f, m),
+        })
+    results.sort(key=lambda row: (-(row['r_score'] + row['f_score'] + row['m_score']), -row['monetary']))
+    return results
+
+
+def rfm_segment(r_score, f_score, m_score):
+    """Segment of a customer from its recency score and averaged frequency/monetary score"""
+    fm_score = (f_score + m_score + 1) // 2
+    for segment, min_recency, min_value in RFM_SEGMENTS:
+        if r_score >= min_recency and fm_score >= min_value:
+            return segment
+    return RFM_SEGMENTS[-1][0]
@@ -0,0 +1,244 @@
+# Django imports
+from django.db import connection
+from django.db.models import Sum, Q, F, Value, FloatField, Window, RowRange
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+# Third-party libraries
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.units import mm
+from reportlab.pdfgen import canvas
+
+# Python imports
+import io
+import csv
+import datetime
+
+# Model imports
+from .models import BookLog, BOOK_BALANCE_CHANGE_TYPES
+from .utils import book_balance_as_of
+
+
+STATEMENT_CSV_COLUMNS = ['date', 'type', 'description', 'invoice_number', 'debit', 'credit', 'balance']
+
+STATEMENT_ITERATOR_CHUNK_SIZE = 2000
+
+
+# ================ Statement Methods ===========================
+def _day_start(day):
+    """Aware start of a local calendar day"""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def statement_ledger(book):
+    """Ledger entries that move the balance: active logs of change types 0-3"""
+    return BookLog.objects.filter(parent_book=book, is_active=True, change_type__in=BOOK_BALANCE_CHANGE_TYPES,
+                                  date__isnull=False)
+
+
+def statement_summary(book, start_date, end_date):
+    """
+    Opening balance before start_date, read from the balance checkpoints, and the
+    debits / credits from start_date to end_date (both inclusive, local days).
+    Balances follow Book.current_balance: credits positive, purchases negative.
+    """
+    start, end = _day_start(start_date), _day_start(end_date + datetime.timedelta(days=1))
+    totals = statement_ledger(book).filter(date__gte=start, date__lt=end).aggregate(
+        total_debits=Coalesce(Sum('change', filter=Q(change__lt=0)), Value(0.0), output_field=FloatField()),
+        total_credits=Coalesce(Sum('change', filter=Q(change__gt=0)), Value(0.0), output_field=FloatField()),
+    )
+    totals['opening_balance'] = book_balance_as_of(book, start)
+    totals['total_debits'] = abs(totals['total_debits'])
+    totals['closing_balance'] = totals['opening_balance'] + totals['total_credits'] - totals['total_debits']
+    return totals
+
+
+CHANGE_TYPE_LABELS = dict(BookLog.CHANGE_TYPES)
+
+
+def statement_entries(book, start_date, end_date, opening_balance):
+    """
+    Generator over the entries from start_date to end_date, oldest first, as dicts with
+    debit, credit and the running balance after the entry. The running balance is an SQL
+    window SUM offset by opening_balance; rows are plain values() streamed with
+    .iterator(), so no model instances are built.
+    """
+    start, end = _day_start(start_date), _day_start(end_date + datetime.timedelta(days=1))
+    entries = (statement_ledger(book).filter(date__gte=start, date__lt=end).order_by('date', 'id')
+               .values('id', 'date', 'change', 'change_type', 'description', 'associated_invoice_id',
+                       invoice_number=F('associated_invoice__invoice_number'),
+                       invoice_is_gst=F('associated_invoice__is_gst')))
+
+    window = connection.features.supports_over_clause
+    if window:
+        entries = entries.annotate(balance=Window(
+            expression=Sum('change'),
+            order_by=[F('date').asc(), F('id').asc()],
+            frame=RowRange(start=None, end=0),
+        ) + Value(opening_balance, output_field=FloatField()))
+
+    balance = opening_balance
+    for entry in entries.iterator(chunk_size=STATEMENT_ITERATOR_CHUNK_SIZE):
+        # Single pass fallback for databases without window functions
+        if not window:
+            balance += entry['change']
+            entry['balance'] = balance
+        change = entry['change']
+        entry['date'] = timezone.localtime(entry['date'])
+        entry['type'] = CHANGE_TYPE_LABELS.get(entry['change_type'], '')
+        entry['debit'] = -change if change < 0 else 0.0
+        entry['credit'] = change if change > 0 else 0.0
+        entry['invoice'] = _invoice_label(entry)
+        yield entry
+
+
+def customer_statement(book, start_date, end_date):
+    """Statement of one customer book for a date range: summary totals and the entries generator"""
+    statement = statement_summary(book, start_date, end_date)
+    statement.update({
+        'book': book,
+        'customer': book.customer,
+        'start_date': start_date,
+        'end_date': end_date,
+        'entries': statement_entries(book, start_date, end_date, statement['opening_balance']),
+    })
+    return statement
+
+
+def _invoice_label(entry):
+    if entry['invoice_number'] is None:
+        return ''
+    return str(entry['invoice_number']) if entry['invoice_is_gst'] else f"INV-{entry['invoice_number']}"
+
+
+def _amount(value, blank_zero=False):
+    if blank_zero and not value:
+        return ''
+    return f"{value:,.2f}"
+
+
+def statement_display_rows(statement):
+    """
+    Entries with every column already formatted as text, for the HTML view:
+    formatting in Python is much cheaper than template filters on large ledgers.
+    """
+    for entry in statement['entries']:
+        yield {
+            'date': entry['date'].strftime('%b %d, %Y %I:%M %p'),
+            'type': entry['type'],
+            'description': entry['description'] or '',
+            'invoice': entry['invoice'],
+            'invoice_id': entry['associated_invoice_id'],
+            'is_debit': entry['change'] < 0,
+            'debit': _amount(entry['debit'], blank_zero=True),
+            'credit': _amount(entry['credit'], blank_zero=True),
+            'balance': _amount(entry['balance']),
+        }
+
+
+# ================ Statement Export Methods ===========================
+class _Echo:
+    """File-like object handing each written CSV line back to the caller"""
+    def write(self, value):
+        return value
+
+
+def stream_statement_csv(statement):
+    """Generator yielding the statement as CSV lines, opening and closing balances included"""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(STATEMENT_CSV_COLUMNS)
+    yield writer.writerow([statement['start_date'].isoformat(), 'Opening Balance', '', '', '', '',
+                           f"{statement['opening_balance']:.2f}"])
+    for entry in statement['entries']:
+        yield writer.writerow([
+            entry['date'].strftime('%Y-%m-%d %H:%M'),
+            entry['type'],
+            entry['description'] or '',
+            entry['invoice'],
+            f"{entry['debit']:.2f}" if entry['debit'] else '',
+            f"{entry['credit']:.2f}" if entry['credit'] else '',
+            f"{entry['balance']:.2f}",
+        ])
+    yield writer.writerow([statement['end_date'].isoformat(), 'Closing Balance', '', '',
+                           f"{statement['total_debits']:.2f}", f"{statement['total_credits']:.2f}",
+                           f"{statement['closing_balance']:.2f}"])
+
+
+# Column x positions (mm from the left margin) and alignment of the PDF ledger
+STATEMENT_PDF_COLUMNS = [
+    ("Date", 0, 'left'), ("Type", 20, 'left'), ("Description", 46, 'left'), ("Invoice", 104, 'left'),
+    ("Debit", 146, 'right'), ("Credit", 168, 'right'), ("Balance", 190, 'right'),
+]
+STATEMENT_PDF_LINE_HEIGHT = 4.2 * mm
+
+
+def render_statement_pdf(statement, user_profile):
+    """
+    Render a statement to PDF bytes. Ledger lines are drawn straight on the canvas
+    rather than through a platypus Table, whose layout pass is far too slow for
+    ledgers with thousands of entries.
+    """
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    pdf.setTitle(f"Statement {statement['customer'].customer_name}")
+    width, height = A4
+    left, top, bottom = 10 * mm, height - 12 * mm, 15 * mm
+    title = (f"Statement of Account: {statement['customer'].customer_name} | "
+             f"{statement['start_date'].strftime('%d-%m-%Y')} to {statement['end_date'].strftime('%d-%m-%Y')}")
+
+    def draw_row(y, cells, bold=False):
+        # One text object per line instead of one per cell
+        font = "Helvetica-Bold" if bold else "Helvetica"
+        line = pdf.beginText()
+        line.setFont(font, 7)
+        for (_, x, align), text in zip(STATEMENT_PDF_COLUMNS, cells):
+            if not text:
+                continue
+            if align == 'right':
+                x -= pdf.stringWidth(text, font, 7) / mm
+            line.setTextOrigin(left + x * mm, y)
+            line.textOut(text)
+        pdf.drawText(line)
+
+    def start_page():
+        y = top
+        if pdf.getPageNumber() == 1:
+            pdf.setFont("Helvetica-Bold", 16)
+            pdf.drawCentredString(width / 2, y - 5 * mm, user_profile.business_title or '')
+            pdf.setFont("Helvetica", 9)
+            pdf.drawCentredString(width / 2, y - 11 * mm, user_profile.business_address or '')
+            y -= 16 * mm
+        pdf.setFont("Helvetica", 9)
+        pdf.drawCentredString(width / 2, y, title)
+        y -= 7 * mm
+        draw_row(y, [label for label, _, _ in STATEMENT_PDF_COLUMNS], bold=True)
+        pdf.line(left, y - 1.5 * mm, width - left, y - 1.5 * mm)
+        return y - STATEMENT_PDF_LINE_HEIGHT - 1 * mm
+
+    def end_page():
+        pdf.setFont("Helvetica", 8)
+        pdf.drawCentredString(width / 2, 8 * mm, f"Page {pdf.getPageNumber()}")
+        pdf.showPage()
+
+    y = start_page()
+    draw_row(y, [statement['start_date'].strftime('%d-%m-%Y'), "Opening Balance", "", "", "", "",
+                 _amount(statement['opening_balance'])], bold=True)
+    y -= STATEMENT_PDF_LINE_HEIGHT
+    for entry in statement['entries']:
+        if y < bottom:
+            end_page()
+            y = start_page()
+        draw_row(y, [entry['date'].strftime('%d-%m-%Y'), entry['type'], (entry['description'] or '')[:38],
+                     entry['invoice'], _amount(entry['debit'], blank_zero=True),
+                     _amount(entry['credit'], blank_zero=True), _amount(entry['balance'])])
+        y -= STATEMENT_PDF_LINE_HEIGHT
+    if y < bottom:
+        end_page()
+        y = start_page()
+    pdf.line(left, y + STATEMENT_PDF_LINE_HEIGHT - 1.5 * mm, width - left, y + STATEMENT_PDF_LINE_HEIGHT - 1.5 * mm)
+    draw_row(y, [statement['end_date'].strftime('%d-%m-%Y'), "Closing Balance", "", "",
+                 _amount(statement['total_debits']), _amount(statement['total_credits']),
+                 _amount(statement['closing_balance'])], bold=True)
+    end_page()
+    pdf.save()
+    return buffer.getvalue()
@@ -0,0 +1,112 @@
+# Django imports
+from django.db.models import Sum, DateField
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.utils import timezone
+
+# Python imports
+import datetime
+
+
+TIMESERIES_BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+# Longest range (in days) still drawn with daily / weekly points
+TIMESERIES_MAX_DAILY_SPAN = 92
+TIMESERIES_MAX_WEEKLY_SPAN = 731
+
+
+# ================ Time Series Range Methods ===========================
+def timeseries_range(params, queryset, date_field='date'):
+    """
+    (start, end) local dates of a graph filter: today, this_week, this_month,
+    this_year, all (from the earliest row of queryset) or custom start_date/end_date.
+    """
+    filter_type = params.get('filter', 'this_month')
+    today = timezone.localdate()
+
+    if filter_type == 'today':
+        return today, today
+    if filter_type == 'this_week':
+        return today - datetime.timedelta(days=today.weekday()), today
+    if filter_type == 'this_month':
+        return today.replace(day=1), today
+    if filter_type == 'this_year':
+        return today.replace(month=1, day=1), today
+    if filter_type == 'all':
+        first = queryset.exclude(**{date_field: None}).order_by(date_field).values_list(date_field, flat=True).first()
+        return (timezone.localtime(first).date() if first else today), today
+    start_date = datetime.datetime.strptime(params.get('start_date', str(today)), '%Y-%m-%d').date()
+    end_date = datetime.datetime.strptime(params.get('end_date', str(today)), '%Y-%m-%d').date()
+    return start_date, end_date
+
+
+def choose_bucket(start_date, end_date, requested=None):
+    """Explicit day/week/month, else daily up to ~3 months, weekly up to ~2 years, then monthly"""
+    if requested in TIMESERIES_BUCKETS:
+        return requested
+    span = (end_date - start_date).days
+    if span <= TIMESERIES_MAX_DAILY_SPAN:
+        return 'day'
+    if span <= TIMESERIES_MAX_WEEKLY_SPAN:
+        return 'week'
+    return 'month'
+
+
+def bucket_start(day, bucket):
+    """First day of the bucket containing day (weeks start on Monday, like TruncWeek)"""
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_bucket(day, bucket):
+    if bucket == 'week':
+        return day + datetime.timedelta(days=7)
+    if bucket == 'month':
+        return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+    return day + datetime.timedelta(days=1)
+
+
+# ================ Time Series Methods ===========================
+def timeseries(queryset, value, series, start_date, end_date, bucket='day', date_field='date', key_prefix='type_'):
+    """
+    Google Charts rows for several series in one grouped query.
+
+    series maps a series key to the Q selecting its rows, value is the summed
+    expression (e.g. Abs('change')). Rows of queryset from start_date to end_date
+    (local days, inclusive) are truncated to the bucket and summed per series with
+    conditional aggregation, then every bucket of the range is filled in order.
+    Returns (rows, totals): [{'date': 'YYYY-MM-DD', '<key_prefix><key>': amount}, ...]
+    and {key: total}.
+    """
+    start = timezone.make_aware(datetime.datetime.combine(start_date, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(end_date + datetime.timedelta(days=1), datetime.time.min))
+    truncate = TIMESERIES_BUCKETS[bucket]
+
+    sums = {f'series_{index}': Sum(value, filter=condition) for index, condition in enumerate(series.values())}
+    grouped = {}
+    if sums:
+        rows = (queryset.filter(**{f'{date_field}__gte': start, f'{date_field}__lt': end})
+                .annotate(period=truncate(date_field, output_field=DateField()))
+                .values('period').annotate(**sums).order_by('period'))
+        grouped = {row['period']: row for row in rows}
+
+    chart_data = []
+    totals = {key: 0.0 for key in series}
+    day = bucket_start(start_date, bucket)
+    while day <= end_date:
+        row = {'date': day.strftime('%Y-%m-%d')}
+        values = grouped.get(day)
+        for index, key in enumerate(series):
+            amount = float((values or {}).get(f'series_{index}') or 0)
+            totals[key] += amount
+            row[f'{key_prefix}{key}'] = round(amount, 2)
+        chart_data.append(row)
+        day = _next_bucket(day, bucket)
+
+    return chart_data, {key: round(total, 2) for key, total in totals.items()}
@@ -30,8 +30,11 @@ urlpatterns = [
     path('invoices/ajax', invoices.invoices_ajax, name='invoices_ajax'),
     path('invoices/new', invoices.invoice_create, name='invoice_create'),
     path('invoice/<int:invoice_id>/', invoices.invoice_viewer, name='invoice_viewer'),
+    path('invoice/<int:invoice_id>/pdf', invoices.invoice_pdf, name='invoice_pdf'),
     path('invoices/delete', invoices.invoice_delete, name='invoice_delete'),
     path('invoices/push-to-books/<int:invoice_id>', invoices.invoice_push_to_books, name='invoice_push_to_books'),
+    path('invoices/api/add', invoices.invoice_api_add, name='invoice_api_add'),
+    path('invoices/export', invoices.invoice_export, name='invoice_export'),
     path('api/customer-invoice-filter/', invoices.customerInvoiceFilter, name='customer_invoice_filter'),
 
     # Quotation URLs
@@ -62,6 +65,7 @@ urlpatterns = [
     # Book URLs
     path('books', books.books, name='books'),
     path('books/<int:book_id>', books.book_logs, name='book_logs'),
+    path('books/<int:book_id>/statement', books.book_statement, name='book_statement'),
     path('books/<int:book_id>/addupdate', books.book_logs_add, name='book_logs_add'),
     path('book/del/<int:booklog_id>', books.book_logs_del, name='book_logs_del'),
     # Full Book Logs View
@@ -98,6 +102,7 @@ urlpatterns = [
     # API Endpoints
     path('inventory/api/stock-alert-level/add', inventory.invertory_stock_alert_update, name='invertory_stock_alert_update'),
     path('inventory/api/stock/add', inventory.inventory_api_stock_add, name='inventory_api_stock_add'),
+    path('inventory/api/stock-as-of', inventory.inventory_stock_as_of, name='inventory_stock_as_of'),
     path('inventory/logs/ajax/', inventory.inventory_logs_ajax, name='inventory_logs_ajax'),
     path('inventory/chart/trend/', inventory.inventory_trend_chart, name='inventory_trend_chart'),
     path('inventory/chart/product/', inventory.inventory_product_chart, name='inventory_product_chart'),
@@ -136,11 +141,15 @@ urlpatterns = [
 
     # Reports URLs
     path('reports/sales', reports.sales_report_pdf, name='sales_report'),
+    path('reports/gstr1', reports.gstr1_report_view, name='gstr1_report'),
+    path('reports/aging', reports.aging_report_view, name='aging_report'),
+    path('reports/inventory-valuation', reports.inventory_valuation_report_view, name='inventory_valuation_report'),
 
     # Graphs and Analytics URLs
     path('graphs/dashboard', graphs.sales_dashboard, name='sales_dashboard'),
     path('graphs/books', graphs.customer_books_graph, name='customer_books_graph'),
     path('graphs/customer', graphs.customer_graph, name='customer_graph'),
+    path('graphs/customer-rfm', graphs.customer_rfm_segments, name='customer_rfm_segments'),
     path('graphs/purchase-log', graphs.purchase_log_graph, name='purchase_log_graph'),
     path('graphs/expense-tracker', graphs.expense_tracker_graph, name='expense_tracker_graph'),
     path('graphs/customer-location-map', graphs.customer_location_map, name='customer_location_map'),
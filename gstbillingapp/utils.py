@@ -1,11 +1,15 @@
 # Django imports
-from django.db.models import Sum
+from django.db.models import Sum, Max, Count, F, Case, When, Value, IntegerField, FloatField, BooleanField, OuterRef, Subquery, Q, ExpressionWrapper
+from django.db.models.functions import Coalesce, ExtractYear, ExtractMonth
+from django.db import transaction
 from gstbilling import settings
 from django.shortcuts import get_object_or_404
+from django.utils import timezone
 
 # Python imports
 import re
 import json
+import bisect
 import datetime
 
 
@@ -16,6 +20,23 @@ from .models import InventoryLog
 from .models import Book
 from .models import BookLog
 from .models import Customer
+from .models import Invoice
+from .models import Quotation
+from .models import UserProfile
+from .models import DocumentSequence
+from .models import InvoiceLineItem
+from .models import build_line_items
+from .models import touch_invoice_period
+from .models import touch_analytics
+from .models import LedgerMonthlyRollup
+from .models import LedgerBalanceCheckpoint
+from .models import BOOK_BALANCE_CHANGE_TYPES
+from .models import CHECKPOINT_TOTAL_FIELDS
+from .models import ledger_month
+from .models import apply_ledger_rollup_deltas
+from .models import InventoryStockSnapshot
+from .models import add_stock_snapshot_delta
+from .models import apply_stock_snapshot_deltas
 
 
 #  ================= Invoice Methods ====================
@@ -139,6 +160,237 @@ def update_products_from_invoice(invoice_data_processed, request):
             create_inventory(product)
 
 
+def invoice_data_from_api(invoice_entry, products):
+    """
+    Build the invoice JSON document for one invoice of the bulk invoice API.
+    products maps model_no -> Product and fills in missing item names, HSN, rates and GST %;
+    items of unknown model numbers need their own rate_with_gst.
+    Returns (invoice_data, error).
+    """
+    form_data = {
+        'invoice-number': str(invoice_entry.get('invoice_number') or 0),
+        'invoice-date': str(invoice_entry.get('invoice_date') or ''),
+        'customer-name': str(invoice_entry.get('customer_name') or ''),
+        'customer-address': str(invoice_entry.get('customer_address') or ''),
+        'customer-phone': str(invoice_entry.get('customer_phone') or ''),
+        'customer-gst': str(invoice_entry.get('customer_gst') or ''),
+    }
+    validation_error = invoice_data_validator(form_data)
+    if validation_error:
+        return None, validation_error
+
+    igstcheck = bool(invoice_entry.get('igstcheck', False))
+    invoice_data = {
+        'invoice_number': form_data['invoice-number'],
+        'invoice_date': form_data['invoice-date'],
+        'customer_name': form_data['customer-name'],
+        'customer_address': form_data['customer-address'],
+        'customer_phone': form_data['customer-phone'],
+        'customer_gst': form_data['customer-gst'],
+        'vehicle_number': invoice_entry.get('vehicle_number') or '',
+        'igstcheck': igstcheck,
+        'items': [],
+    }
+    totals = {'without_gst': 0.0, 'sgst': 0.0, 'cgst': 0.0, 'igst': 0.0, 'with_gst': 0.0}
+
+    for item in invoice_entry.get('items') or []:
+        model_no = str(item.get('model_no') or '').upper()
+        if not model_no:
+            return None, "Error: Item without model number"
+        product = products.get(model_no)
+        if product is None and item.get('rate_with_gst') is None:
+            return None, f"Error: Unknown model number {model_no} without rate_with_gst"
+        try:
+            qty = int(item.get('qty') or 0)
+            rate_with_gst = float(item.get('rate_with_gst', product.product_rate_with_gst if product else 0))
+            gst_percentage = float(item.get('gst_percentage', product.product_gst_percentage if product else 0))
+            discount = float(item.get('discount', 0))
+        except (TypeError, ValueError):
+            return None, f"Error: Incorrect quantity or rate for {model_no}"
+        if qty <= 0:
+            return None, f"Error: Incorrect quantity for {model_no}"
+        if not 0 <= discount <= 100:
+            return None, f"Error: Incorrect discount for {model_no}"
+
+        # The discount is a percentage off the rate with GST, as on mobile orders
+        discounted_rate = rate_with_gst * (1 - discount / 100)
+        rate_without_gst = discounted_rate / (1 + gst_percentage / 100)
+        amt_with_gst = round(discounted_rate * qty, 2)
+        amt_without_gst = round(rate_without_gst * qty, 2)
+        gst_amt = amt_with_gst - amt_without_gst
+        amt_igst = round(gst_amt, 2) if igstcheck else 0.0
+        amt_sgst = 0.0 if igstcheck else round(gst_amt / 2, 2)
+        amt_cgst = 0.0 if igstcheck else round(gst_amt / 2, 2)
+
+        invoice_data['items'].append({
+            'invoice_model_no': model_no,
+            'invoice_product': item.get('product_name') or (product.product_name if product else '') or '',
+            'invoice_hsn': item.get('hsn') or (product.product_hsn if product else '') or '',
+            'invoice_qty': qty,
+            'invoice_discount': discount,
+            'invoice_rate_with_gst': rate_with_gst,
+            'invoice_gst_percentage': gst_percentage,
+            'invoice_rate_without_gst': round(rate_without_gst, 2),
+            'invoice_amt_without_gst': amt_without_gst,
+            'invoice_amt_sgst': amt_sgst,
+            'invoice_amt_cgst': amt_cgst,
+            'invoice_amt_igst': amt_igst,
+            'invoice_amt_with_gst': amt_with_gst,
+        })
+        totals['without_gst'] += amt_without_gst
+        totals['sgst'] += amt_sgst
+        totals['cgst'] += amt_cgst
+        totals['igst'] += amt_igst
+        totals['with_gst'] += amt_with_gst
+
+    if not invoice_data['items']:
+        return None, "Error: Invoice has no items"
+
+    invoice_data['invoice_total_amt_without_gst'] = round(totals['without_gst'], 2)
+    invoice_data['invoice_total_amt_sgst'] = round(totals['sgst'], 2)
+    invoice_data['invoice_total_amt_cgst'] = round(totals['cgst'], 2)
+    invoice_data['invoice_total_amt_igst'] = round(totals['igst'], 2)
+    invoice_data['invoice_total_amt_with_gst'] = round(totals['with_gst'], 2)
+    return invoice_data, None
+
+
+def bulk_create_invoices(user, invoice_entries):
+    """
+    Create many invoices in one transaction, with their line items, inventory
+    deductions and book entries written through bulk_create.
+    Returns one result dict per entry, in order; successful ones list the
+    unknown_model_nos that were invoiced at the given rate without a stock deduction.
+    """
+    results = [None] * len(invoice_entries)
+
+    # Entries of the wrong shape fail on their own instead of failing the batch
+    entries = []
+    for index, entry in enumerate(invoice_entries):
+        if not isinstance(entry, dict):
+            results[index] = {'index': index, 'status': 'error', 'message': 'Error: Invoice must be an object'}
+        elif not isinstance(entry.get('items') or [], list) or not all(isinstance(item, dict) for item in entry.get('items') or []):
+            results[index] = {'index': index, 'status': 'error', 'message': 'Error: Items must be a list of objects'}
+        else:
+            entries.append((index, entry))
+
+    # Resolve customers, books and products for the whole batch up front
+    customer_userids = set(str(entry.get('customer_id')) for _, entry in entries if entry.get('customer_id'))
+    customers = {customer.customer_userid: customer for customer in
+                 Customer.objects.filter(user=user, customer_userid__in=customer_userids)}
+    model_nos = set(str(item.get('model_no') or '').upper()
+                    for _, entry in entries for item in (entry.get('items') or []))
+    products = {product.model_no: product for product in
+                Product.objects.filter(user=user, model_no__in=model_nos)}
+
+    prepared = []
+    for index, entry in entries:
+        customer = customers.get(str(entry.get('customer_id')))
+        if customer is None:
+            results[index] = {'index': index, 'status': 'error', 'message': 'Customer not found'}
+            continue
+        entry = dict(entry)
+        # Missing or null customer fields come from the customer, never None
+        for field in ['name', 'address', 'phone', 'gst']:
+            if entry.get('customer_' + field) is None:
+                entry['customer_' + field] = getattr(customer, 'customer_' + field) or ''
+        if entry.get('invoice_date') is None:
+            entry['invoice_date'] = datetime.date.today().strftime('%Y-%m-%d')
+        is_gst = bool(entry.get('is_gst', True))
+        if is_gst and not str(entry['customer_gst']).strip():
+            results[index] = {'index': index, 'status': 'error', 'message': 'GST Invoice requires Customer GST Number.'}
+            continue
+        invoice_data, error = invoice_data_from_api(entry, products)
+        if error:
+            results[index] = {'index': index, 'status': 'error', 'message': error}
+            continue
+        prepared.append((index, entry, customer, is_gst, invoice_data))
+
+    books = {book.customer_id: book for book in
+             Book.objects.filter(user=user, customer__in=[customer for _, _, customer, _, _ in prepared])}
+
+    with transaction.atomic():
+        # Numbers: explicit ones are checked one by one (used ones fail the entry), the rest are reserved as a block per series
+        invoices = []
+        pending = {True: [], False: []}
+        requested_numbers = set()
+        for index, entry, customer, is_gst, invoice_data in prepared:
+            invoice = Invoice(user=user, invoice_customer=customer, is_gst=is_gst,
+                              invoice_date=datetime.datetime.strptime(invoice_data['invoice_date'], '%Y-%m-%d').date())
+            requested = int(entry.get('invoice_number') or 0)
+            if requested:
+                # A retried push must not come back as a second invoice under a new number
+                if (is_gst, requested) in requested_numbers or \
+                        not reserve_document_number('INVOICE', user, is_gst, requested):
+                    results[index] = {'index': index, 'status': 'error',
+                                      'message': f"Error: Invoice number {requested} already exists"}
+                    continue
+                invoice.invoice_number = requested
+                requested_numbers.add((is_gst, requested))
+            else:
+                pending[is_gst].append(invoice)
+            invoices.append((index, invoice, invoice_data))
+        for is_gst, pending_invoices in pending.items():
+            if pending_invoices:
+                numbers = allocate_document_numbers('INVOICE', user, is_gst, len(pending_invoices))
+                for invoice, number in zip(pending_invoices, numbers):
+                    invoice.invoice_number = number
+
+        for index, invoice, invoice_data in invoices:
+            invoice_data['invoice_number'] = str(invoice.invoice_number)
+            invoice.invoice_json = json.dumps(invoice_data)
+            invoice.update_totals_from_json()
+        Invoice.objects.bulk_create([invoice for _, invoice, _ in invoices])
+
+        product_ids = {model_no: product.id for model_no, product in products.items()}
+        line_items = []
+        inventory_logs = []
+        book_logs = []
+        now = datetime.datetime.now()
+        for index, invoice, invoice_data in invoices:
+            line_items.extend(build_line_items(
+                InvoiceLineItem, user.id, invoice.invoice_json, products=product_ids,
+                invoice=invoice, invoice_date=invoice.invoice_date, is_gst=invoice.is_gst))
+            description = "Sale - Auto Deduct" if invoice.is_gst else "Non-GST Sale - Auto Deduct"
+            for item in invoice_data['items']:
+                product = products.get(item['invoice_model_no'])
+                if product:
+                    inventory_logs.append(InventoryLog(
+                        user=user, product=product, date=now, change=-item['invoice_qty'],
+                        change_type=4, associated_invoice=invoice, description=description))
+            book = books.get(invoice.invoice_customer_id)
+            if book:
+                book_logs.append(BookLog(
+                    parent_book=book, date=invoice.invoice_date, change_type=1,
+                    change=(-1.0) * invoice_data['invoice_total_amt_with_gst'], associated_invoice=invoice,
+                    description="Purchase - Auto Deduct" if invoice.is_gst else "Non-GST Sale - Auto Deduct"))
+            results[index] = {'index': index, 'status': 'success', 'invoice_id': invoice.id,
+                              'invoice_number': invoice.invoice_number,
+                              'invoice_total_amt_with_gst': invoice_data['invoice_total_amt_with_gst'],
+                              'books_reflected': book is not None,
+                              'unknown_model_nos': list(dict.fromkeys(
+                                  item['invoice_model_no'] for item in invoice_data['items']
+                                  if item['invoice_model_no'] not in products))}
+
+        InvoiceLineItem.objects.bulk_create(line_items, batch_size=1000)
+        InventoryLog.objects.bulk_create(inventory_logs, batch_size=1000)
+        if inventory_logs:
+            apply_inventory_deltas(user, inventory_logs)
+        BookLog.objects.bulk_create(book_logs, batch_size=1000)
+        if book_logs:
+            apply_book_deltas(book_logs)
+
+        for invoice_date in set(invoice.invoice_date.replace(day=1) for _, invoice, _ in invoices):
+            touch_invoice_period(user.id, invoice_date)
+        touch_analytics(user.id, 'invoices')
+
+        # Invoices of customers without a book are left for "Push to Books"
+        unbooked_ids = [invoice.id for index, invoice, _ in invoices if invoice.invoice_customer_id not in books]
+        if unbooked_ids:
+            Invoice.objects.filter(id__in=unbooked_ids).update(books_reflected=False)
+
+    return results
+
+
 #  ================== Inventory methods ====================
 def create_inventory(product):
     if not Inventory.objects.filter(user=product.user, product=product).exists():
@@ -146,41 +398,116 @@ def create_inventory(product):
         new_inventory.save()
 
 def update_inventory(invoice, request):
-    if invoice.is_gst:
-        description = "Sale - Auto Deduct"
-    else:
-        description = "Non-GST Sale - Auto Deduct"
-    invoice_data =  json.loads(invoice.invoice_json)
-    for item in invoice_data['items']:
-        product = Product.objects.get(user=request.user,
-                                      model_no=item['invoice_model_no'],
-                                      product_name=item['invoice_product'],
-                                      product_hsn=item['invoice_hsn'],
-                                      product_gst_percentage=item['invoice_gst_percentage'])
-        inventory = Inventory.objects.get(user=product.user, product=product)
-        change = int(item['invoice_qty'])*(-1)
-        inventory_log = InventoryLog(user=product.user,
-                                     product=product,
-                                     date=datetime.datetime.now(),
-                                     change=change,
-                                     change_type=4,
-                                     associated_invoice=invoice,
-                                     description=description)
-        inventory_log.save()
-        inventory.current_stock += change
-        inventory.last_log = inventory_log
-        inventory.save()
+    return deduct_inventory_for_invoice(invoice)
+
+
+def deduct_inventory_for_invoice(invoice, description=None):
+    """
+    Deduct the stock of every invoice item in a few queries: one product lookup,
+    one bulk insert of the sales logs and F('current_stock') UPDATEs per chunk of products. Returns the model numbers that matched no product.
+    """
+    if description is None:
+        if invoice.is_gst:
+            description = "Sale - Auto Deduct"
+        else:
+            description = "Non-GST Sale - Auto Deduct"
+    invoice_data = json.loads(invoice.invoice_json)
+
+    lines = []
+    for item in invoice_data.get('items', []):
+        model_no = str(item.get('invoice_model_no') or '').upper()
+        qty = int(float(item.get('invoice_qty') or 0))
+        if model_no and qty:
+            lines.append((model_no, qty))
+    if not lines:
+        return []
+
+    user = invoice.user
+    products = {product.model_no: product for product in
+                Product.objects.filter(user=user, model_no__in=set(model_no for model_no, _ in lines))}
+    missing = sorted(set(model_no for model_no, _ in lines if model_no not in products))
+
+    now = datetime.datetime.now()
+    inventory_logs = [
+        InventoryLog(user=user, product=products[model_no], date=now, change=-qty,
+                     change_type=4, associated_invoice=invoice, description=description)
+        for model_no, qty in lines if model_no in products
+    ]
+    if not inventory_logs:
+        return missing
+
+    with transaction.atomic():
+        InventoryLog.objects.bulk_create(inventory_logs)
+        apply_inventory_deltas(user, inventory_logs)
+    return missing
+
+
+INVENTORY_UPDATE_CHUNK_SIZE = 200
+
+
+def apply_inventory_deltas(user, inventory_logs):
+    """
+    Apply the changes of freshly created inventory logs to Inventory.current_stock
+    with one F() UPDATE per chunk of products, pointing last_log at each product's newest log.
+    Inventory rows missing for a product are created first. bulk_create skips
+    InventoryLog.save(), so the stock snapshots are shifted and the inventory
+    analytics marked as changed here. Low stock crossings are checked once for
+    all the products, so an invoice or import raises at most one notification.
+    """
+    deltas = {}
+    snapshot_deltas = {}
+    for inventory_log in inventory_logs:
+        deltas[inventory_log.product_id] = deltas.get(inventory_log.product_id, 0) + inventory_log.change
+        add_stock_snapshot_delta(snapshot_deltas, inventory_log.product_id, inventory_log.date, inventory_log.change)
+
+    existing = set(Inventory.objects.filter(user=user, product_id__in=deltas).values_list('product_id', flat=True))
+    Inventory.objects.bulk_create([Inventory(user=user, product_id=product_id)
+                                   for product_id in deltas if product_id not in existing])
+
+    # The new logs are each product's newest, so last_log is read back with a subquery.
+    # Every row checks every When, so the UPDATE goes out in chunks of products
+    latest_log = InventoryLog.objects.filter(user=user, product_id=OuterRef('product_id')).order_by('-id').values('id')[:1]
+    product_ids = list(deltas)
+    for start in range(0, len(product_ids), INVENTORY_UPDATE_CHUNK_SIZE):
+        chunk = product_ids[start:start + INVENTORY_UPDATE_CHUNK_SIZE]
+        stock_delta = Case(*[When(product_id=product_id, then=Value(deltas[product_id])) for product_id in chunk],
+                           default=Value(0), output_field=IntegerField())
+        Inventory.objects.filter(user=user, product_id__in=chunk).update(
+            current_stock=F('current_stock') + stock_delta, last_log=Subquery(latest_log))
+    apply_stock_snapshot_deltas(snapshot_deltas)
+    touch_analytics(user.id, 'inventory')
+    check_low_stock(user, list(deltas))
 
 
 def remove_inventory_entries_for_invoice(invoice, user):
-        inventory_logs = InventoryLog.objects.filter(user=user,
-                                     associated_invoice=invoice)
-        for inventory_log in inventory_logs:
-            inventory_product = inventory_log.product
-            inventory_log.delete()
-            # update the inventory total
-            inventory_obj = Inventory.objects.get(user=user, product=inventory_product)
-            recalculate_inventory_total(inventory_obj, user)
+    """
+    Reverse the stock changes of an invoice: the logs are read once, deleted in bulk
+    and the negated per-product deltas applied with F(), to the snapshots as well.
+    """
+    with transaction.atomic():
+        inventory_logs = InventoryLog.objects.filter(user=user, associated_invoice=invoice)
+        deltas = {}
+        snapshot_deltas = {}
+        for product_id, date, change in inventory_logs.values_list('product_id', 'date', 'change'):
+            deltas[product_id] = deltas.get(product_id, 0) + change
+            add_stock_snapshot_delta(snapshot_deltas, product_id, date, change, sign=-1)
+        if not deltas:
+            return
+        # Inventory.last_log is SET_NULL, so inventories pointing at these logs lose it here
+        inventory_logs.delete()
+
+        latest_log = InventoryLog.objects.filter(user=user, product_id=OuterRef('product_id')).order_by('-id').values('id')[:1]
+        product_ids = list(deltas)
+        for start in range(0, len(product_ids), INVENTORY_UPDATE_CHUNK_SIZE):
+            chunk = product_ids[start:start + INVENTORY_UPDATE_CHUNK_SIZE]
+            stock_delta = Case(*[When(product_id=product_id, then=Value(deltas[product_id])) for product_id in chunk],
+                               default=Value(0), output_field=IntegerField())
+            Inventory.objects.filter(user=user, product_id__in=chunk).update(
+                current_stock=F('current_stock') - stock_delta,
+                last_log=Coalesce(F('last_log_id'), Subquery(latest_log), output_field=IntegerField()))
+        apply_stock_snapshot_deltas(snapshot_deltas)
+        touch_analytics(user.id, 'inventory')
+        check_low_stock(user, list(deltas))
 
 
 def recalculate_inventory_total(inventory_obj, user):
@@ -192,15 +519,190 @@ def recalculate_inventory_total(inventory_obj, user):
 
 
 def add_stock_to_inventory(product, quantity, description, user):
-    inventory = Inventory.objects.get(user=user, product=product)
+    """Log a stock change of one product and apply it incrementally, without re-summing its history"""
     inventory_log = InventoryLog(user=user,
                                  product=product,
                                  date=datetime.datetime.now(),
                                  change=quantity,
                                  change_type=1,
                                  description=description)
-    inventory_log.save()
-    recalculate_inventory_total(inventory, user)
+    with transaction.atomic():
+        InventoryLog.objects.bulk_create([inventory_log])
+        apply_inventory_deltas(user, [inventory_log])
+
+
+# ================ Low Stock Methods ===========================
+def is_low_stock(current_stock, alert_level):
+    """Low stock as the dashboards count it: some stock left, at or below the alert level"""
+    return 0 < current_stock <= alert_level
+
+
+def check_low_stock(user, product_ids):
+    """
+    Check the products whose stock or alert level just changed for low stock
+    crossings. Products that fell to or below alert_level since their last alert
+    get one batched notification and are not alerted again until their stock
+    recovers above it. UserProfile.low_stock_count is moved by the products
+    entering or leaving low stock. One query when nothing crossed.
+    Returns the inventories alerted.
+    """
+    inventories = list(Inventory.objects.filter(user=user, product_id__in=product_ids).select_related('product'))
+    entering, leaving, alerts, recovered = [], [], [], []
+    for inventory in inventories:
+        low = is_low_stock(inventory.current_stock, inventory.alert_level)
+        if low != inventory.is_low_stock:
+            (entering if low else leaving).append(inventory.id)
+        below = 0 < inventory.alert_level and inventory.current_stock <= inventory.alert_level
+        if below and not inventory.low_stock_alerted:
+            alerts.append(inventory)
+        elif not below and inventory.low_stock_alerted:
+            recovered.append(inventory.id)
+    if not (entering or leaving or alerts or recovered):
+        return []
+
+    with transaction.atomic():
+        # Conditional UPDATEs, so a product checked concurrently is counted and alerted once
+        count_delta = 0
+        if entering:
+            count_delta += Inventory.objects.filter(id__in=entering, is_low_stock=False).update(is_low_stock=True)
+        if leaving:
+            count_delta -= Inventory.objects.filter(id__in=leaving, is_low_stock=True).update(is_low_stock=False)
+        if count_delta:
+            UserProfile.objects.filter(user=user).update(low_stock_count=F('low_stock_count') + count_delta)
+        if recovered:
+            Inventory.objects.filter(id__in=recovered).update(low_stock_alerted=False)
+        if alerts:
+            alerted = Inventory.objects.filter(id__in=[inventory.id for inventory in alerts],
+                                               low_stock_alerted=False).update(low_stock_alerted=True)
+            if not alerted:
+                alerts = []
+    if alerts:
+        notify_low_stock_products(user, alerts)
+    return alerts
+
+
+def rebuild_low_stock_counts(user_ids=None):
+    """
+    Recompute Inventory.is_low_stock and UserProfile.low_stock_count from the stock,
+    e.g. after stock was changed outside check_low_stock. Products already at or
+    below their alert level are marked alerted, so a rebuild sends no notifications.
+    Returns the number of low stock products.
+    """
+    inventories = Inventory.objects.all()
+    profiles = UserProfile.objects.all()
+    if user_ids is not None:
+        inventories = inventories.filter(user_id__in=user_ids)
+        profiles = profiles.filter(user_id__in=user_ids)
+
+    with transaction.atomic():
+        inventories.update(
+            is_low_stock=ExpressionWrapper(Q(current_stock__gt=0, current_stock__lte=F('alert_level')),
+                                           output_field=BooleanField()),
+            low_stock_alerted=ExpressionWrapper(Q(alert_level__gt=0, current_stock__lte=F('alert_level')),
+                                                output_field=BooleanField()))
+        counts = dict(inventories.filter(is_low_stock=True).order_by().values('user_id').annotate(
+            total=Count('id')).values_list('user_id', 'total'))
+        profiles.update(low_stock_count=Case(*[When(user_id=user_id, then=Value(total)) for user_id, total in counts.items()],
+                                             default=Value(0), output_field=IntegerField()))
+    return sum(counts.values())
+
+
+# ================ Inventory Snapshot Methods ===========================
+# Lower bound of the logs counted when a product has no snapshot yet
+STOCK_HISTORY_START = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+
+
+def rebuild_stock_snapshots(user_ids=None, through=None):
+    """
+    Recompute InventoryStockSnapshot from the inventory logs in one grouped query:
+    one row per product and month from its first log up to through (year, month),
+    by default the last complete month. Returns the number of snapshots written.
+    """
+    if through is None:
+        today = timezone.localdate()
+        through = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    logs = InventoryLog.objects.filter(product__isnull=False, date__lt=_local_month_start(*_next_month(*through)))
+    snapshots = InventoryStockSnapshot.objects.all()
+    if user_ids is not None:
+        logs = logs.filter(product__user_id__in=user_ids)
+        snapshots = snapshots.filter(product__user_id__in=user_ids)
+
+    with transaction.atomic():
+        months = {}
+        product_users = {}
+        for product_id, user_id, year, month, total in logs.annotate(
+                year=ExtractYear('date'), month=ExtractMonth('date')).values(
+                'product_id', 'product__user_id', 'year', 'month').annotate(total=Sum('change')).order_by().values_list(
+                'product_id', 'product__user_id', 'year', 'month', 'total'):
+            product_users[product_id] = user_id
+            months.setdefault(product_id, {})[(year, month)] = total or 0
+
+        new_snapshots = []
+        for product_id, product_months in months.items():
+            stock = 0
+            year, month = min(product_months)
+            while (year, month) <= through:
+                stock += product_months.get((year, month), 0)
+                new_snapshots.append(InventoryStockSnapshot(
+                    product_id=product_id, user_id=product_users[product_id], year=year, month=month,
+                    closing_at=_local_month_start(*_next_month(year, month)), closing_stock=stock))
+                year, month = _next_month(year, month)
+
+        snapshots.delete()
+        InventoryStockSnapshot.objects.bulk_create(new_snapshots, batch_size=1000)
+    return len(new_snapshots)
+
+
+def stock_as_of_queryset(user, moment):
+    """
+    The products of a user annotated with stock (sum of the inventory logs dated before
+    moment) and value (stock x product_rate_with_gst), in a single query: the latest
+    snapshot closing by moment plus the logs between its closing and moment.
+    """
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    snapshot = InventoryStockSnapshot.objects.filter(
+        product_id=OuterRef('pk'), closing_at__lte=moment).order_by('-closing_at')
+    logs_since = InventoryLog.objects.filter(
+        product_id=OuterRef('pk'), date__lt=moment,
+        date__gte=Coalesce(OuterRef('snapshot_at'), Value(STOCK_HISTORY_START))).order_by().values(
+        'product_id').annotate(total=Sum('change')).values('total')
+    return Product.objects.filter(user=user).annotate(
+        snapshot_at=Subquery(snapshot.values('closing_at')[:1]),
+        snapshot_stock=Coalesce(Subquery(snapshot.values('closing_stock')[:1]), Value(0)),
+    ).annotate(
+        stock=F('snapshot_stock') + Coalesce(Subquery(logs_since), Value(0)),
+    ).annotate(
+        value=ExpressionWrapper(F('stock') * F('product_rate_with_gst'), output_field=FloatField()),
+    )
+
+
+def stock_valuation(user, moment, product_ids=None):
+    """
+    Stock and valuation of every product of a user as of moment, with totals and
+    per category subtotals: {'products': [...], 'categories': [...], 'total_stock', 'total_value'}.
+    """
+    products = stock_as_of_queryset(user, moment)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+    rows = list(products.order_by('model_no').values(
+        'id', 'model_no', 'product_name', 'product_rate_with_gst', 'stock', 'value',
+        category=F('product_category__category_name')))
+
+    categories = {}
+    for row in rows:
+        row['value'] = round(row['value'] or 0, 2)
+        category = categories.setdefault(row['category'] or '', {'category': row['category'] or '', 'stock': 0, 'value': 0.0})
+        category['stock'] += row['stock']
+        category['value'] += row['value']
+    for category in categories.values():
+        category['value'] = round(category['value'], 2)
+    return {
+        'products': rows,
+        'categories': sorted(categories.values(), key=lambda category: category['category']),
+        'total_stock': sum(row['stock'] for row in rows),
+        'total_value': round(sum(row['value'] for row in rows), 2),
+    }
 
 
 # ================ Book Methods ===========================
@@ -228,18 +730,367 @@ def auto_deduct_book_from_invoice(invoice):
                        associated_invoice=invoice,
                        description=description)
 
+    # BookLog.save() moves the balance and last_log
     book_log.save()
 
-    book.current_balance = book.current_balance + book_log.change
-    book.last_log = book_log
-    book.save()
+def apply_book_deltas(book_logs):
+    """
+    Apply the changes of freshly created book logs to Book.current_balance with a
+    single F() UPDATE, pointing last_log at each book's newest log.
+    Only active logs of change types 0-3 count towards the balance.
+    """
+    deltas = {}
+    last_logs = {}
+    rollup_deltas = {}
+    for book_log in book_logs:
+        if book_log.is_active and book_log.change_type in [0, 1, 2, 3]:
+            deltas[book_log.parent_book_id] = deltas.get(book_log.parent_book_id, 0) + book_log.change
+        deltas.setdefault(book_log.parent_book_id, 0)
+        last_logs[book_log.parent_book_id] = book_log.id
+        key = (book_log.parent_book_id, *ledger_month(book_log.date), book_log.change_type, book_log.is_active)
+        total, count = rollup_deltas.get(key, (0.0, 0))
+        rollup_deltas[key] = (total + book_log.change, count + 1)
+    apply_ledger_rollup_deltas(rollup_deltas)
+
+    balance_delta = Case(*[When(id=book_id, then=Value(delta)) for book_id, delta in deltas.items()],
+                         default=Value(0.0), output_field=FloatField())
+    last_log = Case(*[When(id=book_id, then=Value(log_id)) for book_id, log_id in last_logs.items()],
+                    default=F('last_log_id'), output_field=IntegerField())
+    Book.objects.filter(id__in=deltas).update(
+        current_balance=F('current_balance') + balance_delta, last_log=last_log)
+
+
+def remove_book_entries_for_invoice(invoice, user):
+    """
+    Reverse the book entries of an invoice: the logs are deleted in bulk and
+    the counted part of their change is taken off the balance with F().
+    Returns False when the invoice has no book entry.
+    """
+    with transaction.atomic():
+        book_logs = BookLog.objects.filter(parent_book__user=user, associated_invoice=invoice)
+        rows = list(book_logs.values_list('parent_book_id', 'date', 'change', 'change_type', 'is_active'))
+        if not rows:
+            return False
+        deltas = {}
+        rollup_deltas = {}
+        for book_id, date, change, change_type, is_active in rows:
+            counted = change if is_active and change_type in [0, 1, 2, 3] else 0
+            deltas[book_id] = deltas.get(book_id, 0) + counted
+            key = (book_id, *ledger_month(date), change_type, is_active)
+            total, count = rollup_deltas.get(key, (0.0, 0))
+            rollup_deltas[key] = (total - change, count - 1)
+        # Book.last_log is SET_NULL, so books pointing at these logs lose it here
+        book_logs.delete()
+
+        balance_delta = Case(*[When(id=book_id, then=Value(delta)) for book_id, delta in deltas.items()],
+                             default=Value(0.0), output_field=FloatField())
+        latest_log = BookLog.objects.filter(parent_book_id=OuterRef('id')).order_by('-id').values('id')[:1]
+        Book.objects.filter(id__in=deltas).update(
+            current_balance=F('current_balance') - balance_delta,
+            last_log=Coalesce(F('last_log_id'), Subquery(latest_log), output_field=IntegerField()))
+        apply_ledger_rollup_deltas(rollup_deltas)
+    return True
+
 
 def recalculate_book_current_balance(book_obj):
+    """Full re-sum of one ledger. Balances are kept incrementally; this is for repairs"""
     new_total = BookLog.objects.filter(parent_book=book_obj, is_active=True, change_type__in=[0,1,2,3]).aggregate(Sum('change'))['change__sum']
     if not new_total:
         new_total = 0
     book_obj.current_balance = new_total
-    book_obj.save()
+    Book.objects.filter(id=book_obj.id).update(current_balance=new_total)
+
+# ================ Ledger Rollup Methods ===========================
+def rebuild_ledger_rollups(user_ids=None):
+    """
+    Recompute LedgerMonthlyRollup from the BookLog ledger with one grouped query,
+    for every book or only the books of user_ids. Returns the number of rows written.
+    """
+    book_logs = BookLog.objects.filter(parent_book__isnull=False, date__isnull=False)
+    rollups = LedgerMonthlyRollup.objects.all()
+    if user_ids is not None:
+        book_logs = book_logs.filter(parent_book__user_id__in=user_ids)
+        rollups = rollups.filter(book__user_id__in=user_ids)
+
+    # ExtractYear / ExtractMonth use the current time zone, like ledger_month()
+    rows = book_logs.annotate(year=ExtractYear('date'), month=ExtractMonth('date')).values(
+        'parent_book_id', 'parent_book__user_id', 'parent_book__customer_id',
+        'year', 'month', 'change_type', 'is_active',
+    ).annotate(total=Sum('change'), count=Count('id')).order_by()
+
+    with transaction.atomic():
+        rollups.delete()
+        LedgerMonthlyRollup.objects.bulk_create([
+            LedgerMonthlyRollup(book_id=row['parent_book_id'], user_id=row['parent_book__user_id'],
+                                customer_id=row['parent_book__customer_id'], year=row['year'],
+                                month=row['month'], change_type=row['change_type'],
+                                is_active=row['is_active'], total=row['total'] or 0, count=row['count'])
+            for row in rows.iterator()], batch_size=1000)
+    return rollups.count()
+
+
+def ledger_rollup_totals(rollups):
+    """Sum and count per change type of a LedgerMonthlyRollup queryset, in one query"""
+    aggregates = {}
+    for change_type in [0, 1, 2, 3]:
+        aggregates[f'total_{change_type}'] = Sum('total', filter=Q(change_type=change_type))
+        aggregates[f'count_{change_type}'] = Sum('count', filter=Q(change_type=change_type))
+    totals = rollups.aggregate(**aggregates)
+    return {key: value or 0 for key, value in totals.items()}
+
+
+# ================ Ledger Checkpoint Methods ===========================
+def _month_before(year, month):
+    """Q for (year, month) strictly before the given month"""
+    return Q(year__lt=year) | Q(year=year, month__lt=month)
+
+
+def _next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _local_month_start(year, month):
+    return timezone.make_aware(datetime.datetime(year, month, 1))
+
+
+def rebuild_balance_checkpoints(user_ids=None, through=None):
+    """
+    Recompute LedgerBalanceCheckpoint from the monthly rollups: one row per book and
+    month from its first entry up to through (year, month), by default the last
+    complete month. Returns the number of checkpoints written.
+    """
+    if through is None:
+        today = timezone.localdate()
+        through = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    rollups = LedgerMonthlyRollup.objects.filter(is_active=True, change_type__in=BOOK_BALANCE_CHANGE_TYPES).filter(
+        _month_before(*_next_month(*through)))
+    checkpoints = LedgerBalanceCheckpoint.objects.all()
+    if user_ids is not None:
+        rollups = rollups.filter(book__user_id__in=user_ids)
+        checkpoints = checkpoints.filter(book__user_id__in=user_ids)
+
+    with transaction.atomic():
+        months = {}
+        book_users = {}
+        for book_id, user_id, year, month, change_type, total in rollups.values_list(
+                'book_id', 'book__user_id', 'year', 'month', 'change_type', 'total').order_by():
+            book_users[book_id] = user_id
+            totals = months.setdefault(book_id, {}).setdefault((year, month), {})
+            totals[change_type] = totals.get(change_type, 0.0) + total
+
+        new_checkpoints = []
+        for book_id, book_months in months.items():
+            cumulative = dict.fromkeys(CHECKPOINT_TOTAL_FIELDS, 0.0)
+            year, month = min(book_months)
+            while (year, month) <= through:
+                for change_type, total in book_months.get((year, month), {}).items():
+                    cumulative[change_type] += total
+                new_checkpoints.append(LedgerBalanceCheckpoint(
+                    book_id=book_id, user_id=book_users[book_id], year=year, month=month,
+                    closing_balance=sum(cumulative.values()),
+                    **{field: cumulative[change_type] for change_type, field in CHECKPOINT_TOTAL_FIELDS.items()}))
+                year, month = _next_month(year, month)
+
+        checkpoints.delete()
+        LedgerBalanceCheckpoint.objects.bulk_create(new_checkpoints, batch_size=1000)
+    return len(new_checkpoints)
+
+
+def book_balances_as_of(book_ids, moment=None):
+    """
+    Balance and totals per change type of each book counting the active logs dated
+    before moment (all of them when moment is None), as
+    {book id: {'balance', 'total_paid', 'total_purchased', 'total_returned', 'total_others'}}.
+    Reads the latest checkpoint before moment's month, the rollups of the months after
+    it and only the logs of moment's own month, in three queries for any number of books.
+    """
+    book_ids = list(book_ids)
+    results = {book_id: dict.fromkeys(CHECKPOINT_TOTAL_FIELDS.values(), 0.0) for book_id in book_ids}
+    if moment is None:
+        # Everything is in the rollups; checkpoints would not save anything
+        checkpoint_months = {}
+        rollups = LedgerMonthlyRollup.objects.all()
+    else:
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        local = timezone.localtime(moment)
+        month_start = _local_month_start(local.year, local.month)
+        before = _month_before(local.year, local.month)
+
+        latest = (LedgerBalanceCheckpoint.objects.filter(before, book_id=OuterRef('book_id'))
+                  .order_by('-year', '-month').values('id')[:1])
+        checkpoint_months = {}
+        for checkpoint in LedgerBalanceCheckpoint.objects.filter(book_id__in=book_ids, id=Subquery(latest)):
+            checkpoint_months[checkpoint.book_id] = (checkpoint.year, checkpoint.month)
+            for field in CHECKPOINT_TOTAL_FIELDS.values():
+                results[checkpoint.book_id][field] = getattr(checkpoint, field)
+        rollups = LedgerMonthlyRollup.objects.filter(before)
+        if checkpoint_months and len(checkpoint_months) == len(results):
+            rollups = rollups.exclude(_month_before(*_next_month(*min(checkpoint_months.values()))))
+
+    for book_id, year, month, change_type, total in rollups.filter(
+            book_id__in=book_ids, is_active=True, change_type__in=BOOK_BALANCE_CHANGE_TYPES).values_list(
+            'book_id', 'year', 'month', 'change_type', 'total'):
+        if (year, month) > checkpoint_months.get(book_id, (0, 0)):
+            results[book_id][CHECKPOINT_TOTAL_FIELDS[change_type]] += total
+
+    if moment is not None:
+        for book_id, change_type, total in BookLog.objects.filter(
+                parent_book_id__in=book_ids, is_active=True, change_type__in=BOOK_BALANCE_CHANGE_TYPES,
+                date__gte=month_start, date__lt=moment).values('parent_book_id', 'change_type').annotate(
+                total=Sum('change')).order_by().values_list('parent_book_id', 'change_type', 'total'):
+            results[book_id][CHECKPOINT_TOTAL_FIELDS[change_type]] += total or 0
+
+    for totals in results.values():
+        totals['balance'] = sum(totals[field] for field in CHECKPOINT_TOTAL_FIELDS.values())
+    return results
+
+
+def book_balance_as_of(book, moment=None):
+    """Balance of one book counting the active logs dated before moment"""
+    return book_balances_as_of([book.id], moment)[book.id]['balance']
+
+
+def annotate_balance_after(book_logs):
+    """
+    Set balance_after on each BookLog of a page (None for undated ones): the book
+    balance right after the entry in (date, id) order. Costs an as-of lookup per
+    book plus one read of the entries between the page's oldest and newest dates.
+    """
+    by_book = {}
+    for book_log in book_logs:
+        book_log.balance_after = None
+        if book_log.date and book_log.parent_book_id:
+            by_book.setdefault(book_log.parent_book_id, []).append(book_log)
+
+    for book_id, logs in by_book.items():
+        oldest = min(book_log.date for book_log in logs)
+        newest = max(book_log.date for book_log in logs)
+        keys = []
+        balances = []
+        opening = balance = book_balances_as_of([book_id], oldest)[book_id]['balance']
+        for log_id, date, change in BookLog.objects.filter(
+                parent_book_id=book_id, is_active=True, change_type__in=BOOK_BALANCE_CHANGE_TYPES,
+                date__gte=oldest, date__lte=newest).order_by('date', 'id').values_list('id', 'date', 'change'):
+            balance += change
+            keys.append((date, log_id))
+            balances.append(balance)
+        for book_log in logs:
+            position = bisect.bisect_right(keys, (book_log.date, book_log.id))
+            book_log.balance_after = balances[position - 1] if position else opening
+
+
+# ================ Document Number Methods ===========================
+def fiscal_year_for(date):
+    """Starting year of the April-March fiscal year containing date"""
+    return date.year if date.month >= 4 else date.year - 1
+
+
+def document_sequence_scope(user, is_gst):
+    """GST documents are numbered per GSTIN, everything else per user"""
+    if is_gst:
+        business_gst = UserProfile.objects.filter(user=user).values_list('business_gst', flat=True).first()
+        if business_gst:
+            return business_gst
+    return f"USER-{user.id}"
+
+
+def _document_queryset(document_type, scope, user, is_gst):
+    """Existing documents belonging to a numbering series"""
+    if document_type == 'INVOICE':
+        queryset = Invoice.objects.filter(is_gst=is_gst)
+    else:
+        queryset = Quotation.objects.filter(is_gst=is_gst)
+    if scope.startswith('USER-'):
+        return queryset.filter(user=user)
+    return queryset.filter(user__userprofile__business_gst=scope)
+
+
+def _get_document_sequence(document_type, user, is_gst):
+    """
+    Fetch (and lock) the sequence row of a series, seeding a new row from the
+    highest existing document number so numbering carries on across fiscal years.
+    Must be called inside transaction.atomic().
+    """
+    scope = document_sequence_scope(user, is_gst)
+    fiscal_year = fiscal_year_for(datetime.date.today())
+    lookup = dict(scope=scope, document_type=document_type, is_gst=is_gst, fiscal_year=fiscal_year)
+
+    sequence = DocumentSequence.objects.select_for_update().filter(**lookup).first()
+    if sequence is None:
+        number_field = 'invoice_number' if document_type == 'INVOICE' else 'quotation_number'
+        seed = _document_queryset(document_type, scope, user, is_gst).aggregate(
+            max_number=Max(number_field))['max_number'] or 0
+        DocumentSequence.objects.get_or_create(defaults={'last_number': seed}, **lookup)
+        sequence = DocumentSequence.objects.select_for_update().get(**lookup)
+    return sequence
+
+
+def peek_document_number(document_type, user, is_gst):
+    """
+    Next number of a series, for pre-filling forms. Does not reserve it: a plain
+    read of the sequence that neither locks nor creates its row, falling back to
+    the highest existing document number when the series has no row yet.
+    """
+    scope = document_sequence_scope(user, is_gst)
+    last_number = DocumentSequence.objects.filter(
+        scope=scope, document_type=document_type, is_gst=is_gst,
+        fiscal_year=fiscal_year_for(datetime.date.today())).values_list('last_number', flat=True).first()
+    if last_number is None:
+        number_field = 'invoice_number' if document_type == 'INVOICE' else 'quotation_number'
+        last_number = _document_queryset(document_type, scope, user, is_gst).aggregate(
+            max_number=Max(number_field))['max_number'] or 0
+    return last_number + 1
+
+
+def allocate_document_number(document_type, user, is_gst, requested=None):
+    """
+    Atomically allocate the next number of a series (INVOICE / QUOTATION).
+    A requested number is honoured unless another document of the series already
+    uses it (e.g. a stale pre-filled form), in which case the next free number is used.
+    Call inside the transaction that saves the document.
+    """
+    with transaction.atomic():
+        sequence = _get_document_sequence(document_type, user, is_gst)
+        number_field = 'invoice_number' if document_type == 'INVOICE' else 'quotation_number'
+
+        if requested and not _document_queryset(document_type, sequence.scope, user, is_gst).filter(
+                **{number_field: requested}).exists():
+            number = requested
+            sequence.last_number = max(sequence.last_number, requested)
+        else:
+            sequence.last_number += 1
+            number = sequence.last_number
+        sequence.save(update_fields=['last_number', 'updated_at'])
+    return number
+
+
+def reserve_document_number(document_type, user, is_gst, number):
+    """
+    Claim an explicit number of a series. Returns False, reserving nothing, when
+    another document of the series already uses it. Call inside the transaction
+    that saves the document.
+    """
+    with transaction.atomic():
+        sequence = _get_document_sequence(document_type, user, is_gst)
+        number_field = 'invoice_number' if document_type == 'INVOICE' else 'quotation_number'
+        if _document_queryset(document_type, sequence.scope, user, is_gst).filter(**{number_field: number}).exists():
+            return False
+        if number > sequence.last_number:
+            sequence.last_number = number
+            sequence.save(update_fields=['last_number', 'updated_at'])
+    return True
+
+
+def allocate_document_numbers(document_type, user, is_gst, count):
+    """Reserve a block of count consecutive numbers of a series in one locked update"""
+    with transaction.atomic():
+        sequence = _get_document_sequence(document_type, user, is_gst)
+        first_number = sequence.last_number + 1
+        sequence.last_number += count
+        sequence.save(update_fields=['last_number', 'updated_at'])
+    return list(range(first_number, first_number + count))
+
 
 # ================ Customer Methods ===========================
 def add_customer_userid(customer):
@@ -470,6 +1321,34 @@ def notify_low_stock(user, product, quantity):
     )
 
 
+# Products named in a batched low stock notification
+LOW_STOCK_NOTIFICATION_PRODUCTS = 10
+
+
+def notify_low_stock_products(user, inventories):
+    """
+    One low stock notification for several inventories (e.g. all the products an
+    invoice or import took below their alert level)
+
+    Usage: notify_low_stock_products(request.user, check_low_stock(...))
+    """
+    if len(inventories) == 1:
+        return notify_low_stock(user, inventories[0].product, inventories[0].current_stock)
+    listed = ", ".join(f"{inventory.product.model_no} ({inventory.current_stock})"
+                       for inventory in inventories[:LOW_STOCK_NOTIFICATION_PRODUCTS])
+    if len(inventories) > LOW_STOCK_NOTIFICATION_PRODUCTS:
+        listed += f" and {len(inventories) - LOW_STOCK_NOTIFICATION_PRODUCTS} more"
+    return create_notification(
+        user=user,
+        title="Low Stock Alert",
+        message=f"{len(inventories)} products have low stock: {listed}",
+        notification_type="WARNING",
+        link_url="/products",
+        link_text="View Products",
+        related_object_type="Product"
+    )
+
+
 def notify_custom(user, title, message, notification_type='INFO', 
                  link_url=None, link_text=None):
     """
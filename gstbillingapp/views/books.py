@@ -1,9 +1,12 @@
 # Django imports
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
+from django.db import transaction
 from django.db.models import Sum, Case, When, FloatField, F, Q
+from django.utils.http import content_disposition_header
+from django.utils.text import get_valid_filename
 
 # Models
 from ..models import (
@@ -15,9 +18,9 @@ from ..models import (
 from ..forms import BookLogForm, BookLogFullForm
 
 # Utility functions
-from ..utils import (
-    recalculate_book_current_balance
-)
+from ..utils import apply_book_deltas
+from ..datatables import cached_count, filtered_count, datatables_page
+from ..statements import customer_statement, statement_display_rows, stream_statement_csv, render_statement_pdf
 
 # Python imports
 import json
@@ -92,11 +95,6 @@ def book_logs_add(request, book_id):
         if invoice:
             book_log.associated_invoice = invoice
         book_log.save()
-
-        book.current_balance = book.current_balance + book_log.change
-        book.last_log = book_log
-        book.save()
-        recalculate_book_current_balance(book)
         return redirect('book_logs', book.id)
 
     return render(request, 'books/book_logs_add.html', context)
@@ -106,13 +104,6 @@ def book_logs_del(request, booklog_id):
     bklg = get_object_or_404(BookLog, id=booklog_id)
     book = get_object_or_404(Book, id=bklg.parent_book.id, user=request.user)
     bklg.delete()
-    new_total = BookLog.objects.filter(parent_book=book, is_active=True).aggregate(Sum('change'))['change__sum']
-    new_last_log = BookLog.objects.filter(parent_book=book, is_active=True).last()
-    if not new_total:
-        new_total = 0
-    book.current_balance = new_total
-    book.last_log = new_last_log
-    book.save()
     return redirect('book_logs', book.id)
 
 # ================= Full Books Views ===========================
@@ -206,14 +197,13 @@ def book_logs_full_ajax(request):
                 Q(change__icontains=search_value)
             )
         
-        # Total records (before filtering)
-        total_records = BookLog.objects.filter(
+        # Total records before filtering (cached, approximate) and filtered records count
+        base_queryset = BookLog.objects.filter(
             parent_book__isnull=False,
             parent_book__user=request.user
-        ).count()
-        
-        # Filtered records count
-        filtered_records = queryset.count()
+        )
+        total_records = cached_count(base_queryset)
+        filtered_records = filtered_count(queryset, base_queryset, total_records)
         
         # Calculate filtered totals before pagination
         filtered_totals = queryset.aggregate(
@@ -236,12 +226,12 @@ def book_logs_full_ajax(request):
             order_by = order_columns[order_column_index]
             if order_direction == 'desc':
                 order_by = '-' + order_by
-            queryset = queryset.order_by(order_by)
+            ordering = [order_by, '-id']
         else:
-            queryset = queryset.order_by('-date')
+            ordering = ['-date', '-id']
         
-        # Pagination
-        queryset = queryset[start:start + length]
+        # Pagination (keyset when possible)
+        queryset, next_cursor = datatables_page(request, queryset, ordering, start, length)
         
         # Prepare data
         data = []
@@ -298,6 +288,7 @@ def book_logs_full_ajax(request):
             'recordsTotal': total_records,
             'recordsFiltered': filtered_records,
             'data': data,
+            'next_cursor': next_cursor,
             'totals': {
                 'total_purchased': total_purchased,
                 'total_paid': total_paid,
@@ -316,6 +307,46 @@ def book_logs_full_ajax(request):
             'details': error_details
         }, status=500)
 
+@login_required
+def book_statement(request, book_id):
+    """
+    Statement of account of a customer book for ?start=YYYY-MM-DD&end=YYYY-MM-DD
+    (default: this month so far) with opening and running balances.
+    ?format=html (default), pdf or csv.
+    """
+    book = get_object_or_404(Book.objects.select_related('customer'), id=book_id, user=request.user)
+    today = datetime.date.today()
+    try:
+        start_date = datetime.datetime.strptime(request.GET.get('start', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date = today.replace(day=1)
+    try:
+        end_date = datetime.datetime.strptime(request.GET.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        end_date = today
+    if end_date < start_date:
+        start_date, end_date = end_date, start_date
+
+    statement = customer_statement(book, start_date, end_date)
+    # Customer names may hold quotes or non-ASCII characters: sanitized, and sent as filename* when needed
+    file_name = get_valid_filename(f"statement_{book.customer.customer_name}_{start_date}_{end_date}")
+    export_format = request.GET.get('format', 'html')
+
+    if export_format == 'csv':
+        response = StreamingHttpResponse(stream_statement_csv(statement), content_type='text/csv')
+        response['Content-Disposition'] = content_disposition_header(True, f"{file_name}.csv")
+        return response
+    if export_format == 'pdf':
+        user_profile = get_object_or_404(UserProfile, user=request.user)
+        response = HttpResponse(render_statement_pdf(statement, user_profile), content_type='application/pdf')
+        response['Content-Disposition'] = content_disposition_header(False, f"{file_name}.pdf")
+        return response
+
+    context = dict(statement)
+    context['entries'] = statement_display_rows(statement)
+    context['nav_hide'] = request.GET.get('nav') or ''
+    return render(request, 'books/book_statement.html', context)
+
 @login_required
 def book_logs_full_add(request):
     context = {}
@@ -325,20 +356,44 @@ def book_logs_full_add(request):
         book_log_form = BookLogFullForm(request.POST, user=request.user)
         if book_log_form.is_valid():
             book_log = book_log_form.save(commit=False)
-            book = book_log.parent_book
             book_log.save()
-            recalculate_book_current_balance(book)
             return redirect('book_logs_full')
     return render(request, 'books/book_logs_full_add.html', context)
 
 # ================= Books API Views ===========================
+BOOK_LOGS_API_BATCH_SIZE = 500
+
+
+def _parse_book_log_api_item(item):
+    """(date, change, invoice number or None) of one API entry, or None if it is invalid"""
+    try:
+        date = datetime.datetime.strptime(item.get('date') or '', '%Y-%m-%d')
+        changes = item.get('change') or 0
+        if changes in [None, 'None', '', 0]:
+            return None
+        change = float(changes)
+    except (AttributeError, TypeError, ValueError):
+        return None
+    try:
+        invoice_number = int(item.get('associated_invoice') or 0) or None
+    except (TypeError, ValueError):
+        invoice_number = None
+    return date, change, invoice_number
+
+
 @csrf_exempt
 def book_logs_api_add(request):
+    """
+    Bulk ingest of book logs for one customer. Entries are validated in memory,
+    referenced invoices are resolved with one IN query and the logs are inserted
+    in chunks with a single balance update. ?dry_run=1 only validates.
+    """
     if request.method == "POST":
         business_uid = request.GET.get('business_uid', None)
         customer_id = request.GET.get('id', None)
         notes = request.GET.get('notes', "Added via API")
-        if not business_uid or not id:
+        dry_run = request.GET.get('dry_run') in ['1', 'true', 'True']
+        if not business_uid or not customer_id:
             return JsonResponse({'status': 'error', 'message': 'Business UID and Customer ID are required.'})
         user_profile = get_object_or_404(UserProfile, business_uid=business_uid)
         if user_profile:
@@ -347,58 +402,54 @@ def book_logs_api_add(request):
         parent_book = get_object_or_404(Book, customer=customer, user=user)
         data = request.body.decode('utf-8')
         data = json.loads(data)
-        inserted_count = 0
+
+        parsed = []
         not_inserted_count = 0
-        credits = 0
-        debits = 0
         for item in data:
-            try:
-                date_text = item.get('date') or None
-                if date_text:
-                    try:
-                        date_text = datetime.datetime.strptime(date_text, '%Y-%m-%d')
-                    except:
-                        not_inserted_count += 1
-                        continue
-                else:
-                    not_inserted_count += 1
-                    continue
-                changes = item.get('change') or 0
-                if changes in [None, 'None', '', 0]:
-                    not_inserted_count += 1
-                    continue
-                change = float(changes)
-                if change > 0:
-                    change_type = 0  # credit
-                    credits += change
-                else:
-                    change_type = 1  # debit
-                    debits += abs(change)
-
-                associated_invoice_no = item.get('associated_invoice') or None
-                associated_invoice = None
-                if associated_invoice_no:
-                    try:
-                        associated_invoice_no = int(associated_invoice_no)
-                        associated_invoice = Invoice.objects.get(user=user, invoice_number=associated_invoice_no)
-                    except:
-                        pass
-                description = notes
-
-                book_log = BookLog(
-                    parent_book=parent_book,
-                    date=date_text,
-                    change=change,
-                    change_type=change_type,
-                    associated_invoice=associated_invoice,
-                    description=description
-                )
-                book_log.save()
-                inserted_count += 1
-            except Exception as e:
+            entry = _parse_book_log_api_item(item) if isinstance(item, dict) else None
+            if entry is None:
                 not_inserted_count += 1
-        recalculate_book_current_balance(parent_book)
-        return JsonResponse({'status': 'success', 'message': f'{customer.customer_name}\n{inserted_count} Book logs added successfully.\n{not_inserted_count} Book logs not added.\nCredits: {credits}, Debits: {debits}.'})
+            else:
+                parsed.append(entry)
+
+        # GST and non-GST invoices can share a number; those stay unlinked
+        invoice_numbers = set(number for _, _, number in parsed if number)
+        invoices = {}
+        ambiguous = set()
+        for invoice in Invoice.objects.filter(user=user, invoice_number__in=invoice_numbers).only('id', 'invoice_number'):
+            if invoice.invoice_number in invoices:
+                ambiguous.add(invoice.invoice_number)
+            invoices[invoice.invoice_number] = invoice
+
+        book_logs = []
+        credits = 0
+        debits = 0
+        for date, change, invoice_number in parsed:
+            if change > 0:
+                change_type = 0  # credit
+                credits += change
+            else:
+                change_type = 1  # debit
+                debits += abs(change)
+            associated_invoice = None if invoice_number in ambiguous else invoices.get(invoice_number)
+            book_logs.append(BookLog(
+                parent_book=parent_book,
+                date=date,
+                change=change,
+                change_type=change_type,
+                associated_invoice=associated_invoice,
+                description=notes
+            ))
+
+        if book_logs and not dry_run:
+            with transaction.atomic():
+                BookLog.objects.bulk_create(book_logs, batch_size=BOOK_LOGS_API_BATCH_SIZE)
+                apply_book_deltas(book_logs)
+        inserted_count = len(book_logs)
+        message = f'{customer.customer_name}\n{inserted_count} Book logs added successfully.\n{not_inserted_count} Book logs not added.\nCredits: {credits}, Debits: {debits}.'
+        if dry_run:
+            message = f'Dry run, nothing was saved.\n{message}'
+        return JsonResponse({'status': 'success', 'message': message, 'dry_run': dry_run})
     return JsonResponse({'status': 'error', 'message': 'Use POST method to add book logs.'})
 
 @csrf_exempt
@@ -408,7 +459,6 @@ def book_logs_api_active(request):
     booklog = get_object_or_404(BookLog, id=booklog_id)
     booklog.is_active = True
     booklog.save()
-    recalculate_book_current_balance(booklog.parent_book)
     return JsonResponse({'status': 'success', 'message': f'Book log ID {booklog_id} marked as active. Change: ₹{change} Updated.'})
 
 @login_required
@@ -449,6 +499,5 @@ def book_logs_pending(request):
                 description = booklog_description
             )
             book_logs_new.save()
-        recalculate_book_current_balance(booklog.parent_book)
         return JsonResponse({'status': 'success', 'message': f'Book log ID {booklog_id} processed successfully.'})
     return JsonResponse({'status': 'error', 'message': 'Use POST method to add products alert stock.'})
\ No newline at end of file
@@ -1,8 +1,8 @@
 # Django imports
 from django.db.models import Sum
 from django.db.models import Sum, Q
-from django.core.cache import cache
 from django.http import JsonResponse
+from django.db import transaction
 from django.db.models.functions import TruncMonth
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
@@ -18,11 +18,13 @@ from ..models import (
 from ..forms import InventoryLogForm
 
 # Utility functions
-from gstbillingapp.utils import add_stock_to_inventory
+from gstbillingapp.utils import apply_inventory_deltas, check_low_stock, stock_valuation
+from ..datatables import cached_count, filtered_count, datatables_page
+from ..analytics_cache import cached_analytics, request_params
 
 # Python imports
 import json
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 
 # ================= Inventory Views ===========================
 @login_required
@@ -81,7 +83,8 @@ def inventory_logs_add(request, inventory_id):
         inventory_log.save()
         inventory.current_stock = inventory.current_stock + inventory_log.change
         inventory.last_log = inventory_log
-        inventory.save()
+        inventory.save(update_fields=['current_stock', 'last_log'])
+        check_low_stock(request.user, [inventory.product_id])
         return redirect('inventory_logs', inventory.id)
     return render(request, 'inventory/inventory_logs_add.html', context)
 
@@ -96,7 +99,8 @@ def inventory_logs_del(request, inventorylog_id):
         new_total = 0
     inv_obj.current_stock = new_total
     inv_obj.last_log = new_last_log
-    inv_obj.save()
+    inv_obj.save(update_fields=['current_stock', 'last_log'])
+    check_low_stock(request.user, [inv_obj.product_id])
     return redirect('inventory_logs', inv_obj.id)
 
 # ================= Inventory API Views ===========================
@@ -112,29 +116,74 @@ def inventory_api_stock_add(request):
             user = user_profile.user
         data = request.body.decode('utf-8')
         data = json.loads(data)
-        inserted_count = 0
+
+        # One lookup for every model number; rows are then logged with one bulk insert
+        # and applied to the stock with chunked UPDATEs (see apply_inventory_deltas)
+        model_nos = {str(item.get('model_no')).upper() for item in data if item.get('model_no')}
+        products = dict(Product.objects.filter(user=user, model_no__in=model_nos).values_list('model_no', 'id'))
+        inventory_logs = []
+        unknown_model_nos = []
         not_inserted_count = 0
         increased_quantity = 0
         decreased_quantity = 0
+        now = datetime.now()
         for item in data:
-            if item.get('model_no') == "" or item.get('model_no') is None:
+            model_no = str(item.get('model_no') or '').upper()
+            if not model_no:
+                not_inserted_count += 1
+                continue
+            if model_no not in products:
+                not_inserted_count += 1
+                unknown_model_nos.append(model_no)
+                continue
+            try:
+                product_stock = int(item.get('product_stock') or 0)
+            except (TypeError, ValueError):
+                product_stock = 0
+            if product_stock == 0:
                 not_inserted_count += 1
-            elif Product.objects.filter(user=user, model_no=item.get('model_no').upper()).exists():
-                product = Product.objects.get(user=user, model_no=item.get('model_no').upper())
-                product_stock = item.get('product_stock') or 0
-                if int(product_stock) > 0:
-                    add_stock_to_inventory(product, int(product_stock), notes, user)
-                    inserted_count += 1
-                    increased_quantity += int(product_stock)
-                elif int(product_stock) < 0:
-                    add_stock_to_inventory(product, -abs(int(product_stock)), notes, user)
-                    inserted_count += 1
-                    decreased_quantity += -abs(int(product_stock))
+            else:
+                inventory_logs.append(InventoryLog(user=user, product_id=products[model_no], date=now,
+                                                   change=product_stock, change_type=1, description=notes))
+                if product_stock > 0:
+                    increased_quantity += product_stock
                 else:
-                    not_inserted_count += 1
-        return JsonResponse({'status': 'success', 'message': f'{inserted_count} Products Stock added successfully.\n{not_inserted_count} Products Stock not added.\nQuantity Added: {increased_quantity}\nQuantity Removed: {decreased_quantity}'})
+                    decreased_quantity += product_stock
+
+        if inventory_logs:
+            with transaction.atomic():
+                inventory_logs = InventoryLog.objects.bulk_create(inventory_logs, batch_size=500)
+                apply_inventory_deltas(user, inventory_logs)
+        inserted_count = len(inventory_logs)
+        message = f'{inserted_count} Products Stock added successfully.\n{not_inserted_count} Products Stock not added.\nQuantity Added: {increased_quantity}\nQuantity Removed: {decreased_quantity}'
+        if unknown_model_nos:
+            message += f'\nUnknown Model Nos: {", ".join(dict.fromkeys(unknown_model_nos))}'
+        return JsonResponse({'status': 'success', 'message': message, 'unknown_model_nos': list(dict.fromkeys(unknown_model_nos))})
     return JsonResponse({'status': 'error', 'message': 'Use POST method to add products stock.'})
 
+@login_required
+def inventory_stock_as_of(request):
+    """Stock and value of the products as on ?date=YYYY-MM-DD (end of that day, default now), optionally one ?product_id= or ?model_no="""
+    day, moment = date.today(), datetime.now()
+    if request.GET.get('date'):
+        try:
+            day = datetime.strptime(request.GET['date'], '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'date must be YYYY-MM-DD'}, status=400)
+        moment = datetime.combine(day, datetime.min.time()) + timedelta(days=1)
+
+    product_ids = None
+    if request.GET.get('product_id') or request.GET.get('model_no'):
+        products = Product.objects.filter(user=request.user)
+        if request.GET.get('product_id'):
+            products = products.filter(id=request.GET['product_id'])
+        if request.GET.get('model_no'):
+            products = products.filter(model_no=request.GET['model_no'].upper())
+        product_ids = list(products.values_list('id', flat=True))
+        if not product_ids:
+            return JsonResponse({'status': 'error', 'message': 'Product not found.'})
+    return JsonResponse({'status': 'success', 'date': str(day), **stock_valuation(request.user, moment, product_ids)})
+
 @csrf_exempt
 def invertory_stock_alert_update(request):
     if request.method == "POST":
@@ -142,7 +191,8 @@ def invertory_stock_alert_update(request):
         alert_level = request.POST["alert_level"]
         inventory = get_object_or_404(Inventory, id=inventory_id, user=request.user)
         inventory.alert_level = int(alert_level)
-        inventory.save()
+        inventory.save(update_fields=['alert_level'])
+        check_low_stock(request.user, [inventory.product_id])
         return JsonResponse({'status': 'success', 'message': f'Product Alert Stock {alert_level} set successfully.'})
     return JsonResponse({'status': 'error', 'message': 'Use POST method to add products alert stock.'})
 
@@ -150,7 +200,6 @@ from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum
 from django.db.models.functions import TruncMonth
-from django.core.cache import cache
 from datetime import date
 
 @login_required
@@ -160,13 +209,16 @@ def inventory_logs_ajax(request):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
 
-    qs = InventoryLog.objects.filter(user=request.user)
+    base_qs = InventoryLog.objects.filter(user=request.user)
+    qs = base_qs
 
     if from_date and to_date:
         qs = qs.filter(date__date__range=[from_date,to_date])
 
-    total = qs.count()
-    qs = qs.order_by('-date')[start:start+length]
+    total = cached_count(base_qs)
+    # Compared before select_related, whose JOIN would never match base_qs
+    filtered = filtered_count(qs, base_qs, total)
+    qs, next_cursor = datatables_page(request, qs.select_related('product'), ['-date', '-id'], start, length)
 
     data = [[
         o.date.strftime('%b %d %Y'),
@@ -178,8 +230,9 @@ def inventory_logs_ajax(request):
 
     return JsonResponse({
         'recordsTotal': total,
-        'recordsFiltered': total,
+        'recordsFiltered': filtered,
         'data': data,
+        'next_cursor': next_cursor,
         'draw': int(request.GET.get('draw',1))
     })
 
@@ -194,14 +247,15 @@ def inventory_trend_chart(request):
         except ValueError:
             year = date.today().year
 
-    cache_key = f"trend_{request.user.id}_{year}"
-    cached = cache.get(cache_key)
-    if cached:
-        return JsonResponse(cached, safe=False)
+    data = cached_analytics(request.user.id, 'inventory_trend_chart', ['inventory'],
+                            lambda: _inventory_trend_data(request.user, year), [('year', year)])
+    return JsonResponse(data, safe=False)
+
 
+def _inventory_trend_data(user, year):
     # Filter logs by year
     qs = InventoryLog.objects.filter(
-        user=request.user,
+        user=user,
         date__year=year
     ).annotate(month=TruncMonth('date'))
 
@@ -218,13 +272,17 @@ def inventory_trend_chart(request):
         stock_in = float(q['stock_in'] or 0)
         stock_out = abs(float(q['stock_out'] or 0))  # convert negative to positive for chart
         data.append([month_label, stock_in, stock_out])
-
-    cache.set(cache_key, data, 600)  # cache 10 minutes
-    return JsonResponse(data, safe=False)
+    return data
 
 
 @login_required
 def inventory_product_chart(request):
+    chart_data = cached_analytics(request.user.id, 'inventory_product_chart', ['inventory'],
+                                  lambda: _inventory_product_chart_data(request), request_params(request))
+    return JsonResponse(chart_data, safe=False)
+
+
+def _inventory_product_chart_data(request):
     from_date = request.GET.get('from_date')
     to_date = request.GET.get('to_date')
 
@@ -246,6 +304,4 @@ def inventory_product_chart(request):
         chart_data.append([product, net])
 
     # Sort by absolute change and take top 10
-    chart_data = [chart_data[0]] + sorted(chart_data[1:], key=lambda x: abs(x[1]), reverse=True)[:10]
-
-    return JsonResponse(chart_data, safe=False)
\ No newline at end of file
+    return [chart_data[0]] + sorted(chart_data[1:], key=lambda x: abs(x[1]), reverse=True)[:10]
\ No newline at end of file
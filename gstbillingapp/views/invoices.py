@@ -1,7 +1,8 @@
 # Django imports
 from django.contrib import messages
-from django.db.models import Max, Sum
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Sum
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
@@ -10,7 +11,6 @@ from django.shortcuts import render, redirect, get_object_or_404
 from ..models import Customer
 from ..models import Invoice
 from ..models import UserProfile
-from ..models import Book
 from ..models import BookLog
 from ..models import Quotation
 
@@ -22,6 +22,16 @@ from ..utils import update_inventory
 from ..utils import add_customer_book
 from ..utils import auto_deduct_book_from_invoice
 from ..utils import remove_inventory_entries_for_invoice
+from ..utils import remove_book_entries_for_invoice
+from ..utils import peek_document_number
+from ..utils import allocate_document_number
+from ..utils import bulk_create_invoices
+from ..invoice_pdf import get_invoice_pdf
+from ..invoice_pdf import prerender_invoice_pdf
+from ..invoice_pdf import remove_invoice_pdfs
+from ..invoice_export import invoice_export_queryset
+from ..invoice_export import stream_invoice_export
+from ..datatables import cached_count, filtered_count, datatables_page
 
 # Third-party libraries
 import json
@@ -42,22 +52,9 @@ def invoice_create(request):
         return redirect('user_profile_edit')
 
     context = {}
-    context['non_gst_invoice_number'] = Invoice.objects.filter(user=request.user, is_gst=False).aggregate(Max('invoice_number'))['invoice_number__max']
-    if not context['non_gst_invoice_number']:
-        context['non_gst_invoice_number'] = 1
-    else:
-        context['non_gst_invoice_number'] += 1
-
-    max_invoice_number = []
-    user_profiles = UserProfile.objects.filter(business_gst=user_profile.business_gst)
-    for profile in user_profiles:
-        max_invoice_number.append(Invoice.objects.filter(user=profile.user, is_gst=True).aggregate(Max('invoice_number'))['invoice_number__max'])
-    max_invoice_number = [num for num in max_invoice_number if num is not None]
-
-    if max_invoice_number:
-        context['default_invoice_number'] = max(max_invoice_number) + 1
-    else:
-        context['default_invoice_number'] = 1
+    context['non_gst_invoice_number'] = peek_document_number('INVOICE', request.user, is_gst=False)
+    # GST invoice numbers are shared across the same GST
+    context['default_invoice_number'] = peek_document_number('INVOICE', request.user, is_gst=True)
 
     context['default_invoice_date'] = datetime.datetime.strftime(datetime.datetime.now(), '%Y-%m-%d')
 
@@ -110,19 +107,60 @@ def invoice_create(request):
 
         # save invoice
         invoice_data_processed_json = json.dumps(invoice_data_processed)
-        new_invoice = Invoice(user=request.user,
-            invoice_number=int(invoice_data['invoice-number']),
-            invoice_date=datetime.datetime.strptime(invoice_data['invoice-date'], '%Y-%m-%d'),
-            invoice_customer=customer, invoice_json=invoice_data_processed_json, is_gst= is_gst)
-        new_invoice.save()
-
-        update_inventory(new_invoice, request)
+        with transaction.atomic():
+            invoice_number = allocate_document_number('INVOICE', request.user, is_gst,
+                                                      requested=int(invoice_data['invoice-number']))
+            new_invoice = Invoice(user=request.user,
+                invoice_number=invoice_number,
+                invoice_date=datetime.datetime.strptime(invoice_data['invoice-date'], '%Y-%m-%d'),
+                invoice_customer=customer, invoice_json=invoice_data_processed_json, is_gst= is_gst)
+            new_invoice.save()
+            prerender_invoice_pdf(new_invoice)
+
+        missing_products = update_inventory(new_invoice, request)
+        if missing_products:
+            messages.warning(request, f"Stock not deducted for unknown products: {', '.join(missing_products)}")
         auto_deduct_book_from_invoice(new_invoice)
         return redirect('invoice_viewer', invoice_id=new_invoice.id)
 
     return render(request, 'invoices/invoice_create.html', context)
 
 
+@csrf_exempt
+def invoice_api_add(request):
+    """
+    Bulk invoice import. POST a JSON list of invoices:
+    [{"customer_id": "<customer_userid>", "invoice_date": "YYYY-MM-DD", "is_gst": true,
+      "invoice_number": optional, "igstcheck": false, "vehicle_number": "",
+      "items": [{"model_no": "...", "qty": 1, "rate_with_gst": optional, "gst_percentage": optional,
+                 "discount": optional percentage}]}]
+    An invoice_number already used in the series fails that invoice.
+    """
+    if request.method != "POST":
+        return JsonResponse({'status': 'error', 'message': 'Use POST method to add invoices.'})
+    business_uid = request.GET.get('business_uid', None)
+    if not business_uid:
+        return JsonResponse({'status': 'error', 'message': 'Business UID is required.'})
+    user_profile = get_object_or_404(UserProfile, business_uid=business_uid)
+    user = user_profile.user
+
+    try:
+        invoice_entries = json.loads(request.body.decode('utf-8'))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Invalid JSON body.'})
+    if not isinstance(invoice_entries, list):
+        return JsonResponse({'status': 'error', 'message': 'Expected a list of invoices.'})
+
+    results = bulk_create_invoices(user, invoice_entries)
+    inserted_count = len([result for result in results if result['status'] == 'success'])
+    not_inserted_count = len(results) - inserted_count
+    return JsonResponse({
+        'status': 'success',
+        'message': f'{inserted_count} Invoices added successfully.\n{not_inserted_count} Invoices not added.',
+        'results': results
+    })
+
+
 @login_required
 def invoices(request):
     context = {}
@@ -200,11 +238,10 @@ def invoices_ajax(request):
                 Q(invoice_customer__customer_name__icontains=search_value)
             )
         
-        # Total records
-        total_records = Invoice.objects.filter(user=request.user).count()
-        
-        # Filtered records count
-        filtered_records = queryset.count()
+        # Total records (cached, approximate) and filtered records count
+        base_queryset = Invoice.objects.filter(user=request.user)
+        total_records = cached_count(base_queryset)
+        filtered_records = filtered_count(queryset, base_queryset, total_records)
         
         # Default ordering: by invoice_date desc, then id desc
         default_ordering = ['-invoice_date', '-id']
@@ -216,25 +253,17 @@ def invoices_ajax(request):
             if order_direction == 'desc':
                 order_by = '-' + order_by
             # Apply user-specified order first, then fallback to date & id desc
-            queryset = queryset.order_by(order_by, '-invoice_date', '-id')
+            ordering = [order_by, '-invoice_date', '-id']
         else:
             # Default ordering
-            queryset = queryset.order_by(*default_ordering)
-        
-        # Calculate total invoice amount - optimized query
-        # Use values_list to only fetch invoice_json field, not all related data
-        total_invoice_amount = 0.0
-        invoice_jsons = queryset.values_list('invoice_json', flat=True)
-        for invoice_json_str in invoice_jsons:
-            try:
-                invoice_json = json.loads(invoice_json_str)
-                invoice_amount = float(invoice_json.get('invoice_total_amt_with_gst', 0))
-                total_invoice_amount += invoice_amount
-            except Exception:
-                pass
+            ordering = default_ordering
         
-        # Pagination - apply after total calculation
-        queryset = queryset[start:start + length]
+        # Calculate total invoice amount in SQL from the materialized total column
+        total_invoice_amount = queryset.aggregate(
+            total=Sum('invoice_total_amt_with_gst'))['total'] or 0.0
+
+        # Pagination (keyset when possible) - apply after total calculation
+        queryset, next_cursor = datatables_page(request, queryset.defer('invoice_json'), ordering, start, length)
         
         # Prepare data for current page
         data = []
@@ -251,12 +280,8 @@ def invoices_ajax(request):
             else:
                 customer_html = '<span class="text-danger">N/A</span>'
 
-            # Invoice Amount (from invoice_json)
-            try:
-                invoice_json = json.loads(invoice.invoice_json)
-                invoice_amount = float(invoice_json.get('invoice_total_amt_with_gst', 0))
-            except Exception:
-                invoice_amount = 0.0
+            # Invoice Amount
+            invoice_amount = invoice.invoice_total_amt_with_gst
 
             # Actions
             actions_html = '<div class="btn-group" role="group">'
@@ -287,6 +312,7 @@ def invoices_ajax(request):
             'recordsTotal': total_records,
             'recordsFiltered': filtered_records,
             'data': data,
+            'next_cursor': next_cursor,
             'total_invoice_amount': total_invoice_amount
         })
     except Exception as e:
@@ -313,6 +339,41 @@ def invoice_viewer(request, invoice_id):
     return render(request, 'invoices/invoice_printer.html', context)
 
 
+@login_required
+def invoice_pdf(request, invoice_id):
+    invoice_obj = get_object_or_404(Invoice, user=request.user, id=invoice_id)
+    user_profile = get_object_or_404(UserProfile.objects.select_related('bankdetails'), user=request.user)
+    pdf_path = get_invoice_pdf(invoice_obj, user_profile)
+    return FileResponse(open(pdf_path, 'rb'), content_type='application/pdf',
+                        filename=f'invoice_{invoice_obj.invoice_number}.pdf',
+                        as_attachment=bool(request.GET.get('download')))
+
+
+@login_required
+def invoice_export(request):
+    """Stream a ZIP of every invoice (PDF or JSON) in a date range"""
+    start_date = request.GET.get('start_date', '')
+    end_date = request.GET.get('end_date', '')
+    export_format = request.GET.get('format', 'pdf')
+    invoice_type = request.GET.get('invoice_type', 'all')
+    try:
+        start_date = datetime.datetime.strptime(start_date, '%Y-%m-%d').date()
+        end_date = datetime.datetime.strptime(end_date, '%Y-%m-%d').date()
+        workers = int(request.GET.get('workers', 0))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'start_date and end_date (YYYY-MM-DD) are required.'}, status=400)
+    if export_format not in ['pdf', 'json']:
+        return JsonResponse({'status': 'error', 'message': 'format must be pdf or json.'}, status=400)
+    get_object_or_404(UserProfile, user=request.user)
+
+    queryset = invoice_export_queryset(request.user, start_date, end_date, invoice_type)
+    response = StreamingHttpResponse(
+        stream_invoice_export(request.user, queryset, export_format, workers),
+        content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="invoices_{start_date}_{end_date}_{export_format}.zip"'
+    return response
+
+
 @login_required
 def invoice_delete(request):
     if request.method == "POST":
@@ -340,47 +401,23 @@ def invoice_delete(request):
             else:
                 # Invoice was not from a quotation - create new quotation
                 try:
-                    # Get next quotation number
-                    user_profile = get_object_or_404(UserProfile, user=request.user)
-                    
-                    if invoice_obj.is_gst:
-                        # GST quotation numbers (shared across same GST)
-                        max_quotation_number = []
-                        user_profiles = UserProfile.objects.filter(business_gst=user_profile.business_gst)
-                        for profile in user_profiles:
-                            max_num = Quotation.objects.filter(
-                                user=profile.user, is_gst=True
-                            ).aggregate(Max('quotation_number'))['quotation_number__max']
-                            max_quotation_number.append(max_num)
-                        max_quotation_number = [num for num in max_quotation_number if num is not None]
-                        
-                        if max_quotation_number:
-                            next_quotation_number = max(max_quotation_number) + 1
-                        else:
-                            next_quotation_number = 1
-                    else:
-                        # Non-GST quotation
-                        next_quotation_number = Quotation.objects.filter(
-                            user=request.user, is_gst=False
-                        ).aggregate(Max('quotation_number'))['quotation_number__max']
-                        if not next_quotation_number:
-                            next_quotation_number = 1
-                        else:
-                            next_quotation_number += 1
-                    
-                    # Create quotation with invoice data
-                    new_quotation = Quotation(
-                        user=request.user,
-                        quotation_number=next_quotation_number,
-                        quotation_date=invoice_obj.invoice_date,
-                        valid_until=(invoice_obj.invoice_date + datetime.timedelta(days=30)),
-                        quotation_customer=invoice_obj.invoice_customer,
-                        quotation_json=invoice_obj.invoice_json,  # Copy invoice JSON
-                        is_gst=invoice_obj.is_gst,
-                        status='DRAFT',
-                        notes=f'Created from deleted Invoice #{invoice_obj.invoice_number}'
-                    )
-                    new_quotation.save()
+                    with transaction.atomic():
+                        # Get next quotation number (GST quotations are shared across same GST)
+                        next_quotation_number = allocate_document_number('QUOTATION', request.user, invoice_obj.is_gst)
+
+                        # Create quotation with invoice data
+                        new_quotation = Quotation(
+                            user=request.user,
+                            quotation_number=next_quotation_number,
+                            quotation_date=invoice_obj.invoice_date,
+                            valid_until=(invoice_obj.invoice_date + datetime.timedelta(days=30)),
+                            quotation_customer=invoice_obj.invoice_customer,
+                            quotation_json=invoice_obj.invoice_json,  # Copy invoice JSON
+                            is_gst=invoice_obj.is_gst,
+                            status='DRAFT',
+                            notes=f'Created from deleted Invoice #{invoice_obj.invoice_number}'
+                        )
+                        new_quotation.save()
                     
                     messages.success(request, f'Invoice #{invoice_obj.invoice_number} moved to Quotation #{new_quotation.quotation_number}')
                 except Exception as e:
@@ -398,20 +435,10 @@ def invoice_delete(request):
         if len(request.POST.getlist('inventory-del')):
             remove_inventory_entries_for_invoice(invoice_obj, request.user)
         if len(request.POST.getlist('book-del')):
-            try:
-                booklog_obj = get_object_or_404(BookLog,associated_invoice=invoice_obj)
-                book = get_object_or_404(Book,user=request.user,id=booklog_obj.parent_book.id)
-            except:
+            if not remove_book_entries_for_invoice(invoice_obj, request.user):
                 messages.warning(request, f'Error Invoice #{invoice_obj.invoice_number} deletion from books')
                 return redirect('invoices')
-            booklog_obj.delete()
-            new_total = BookLog.objects.filter(parent_book=book).aggregate(Sum('change'))['change__sum']
-            new_last_log = BookLog.objects.filter(parent_book=book).last()
-            if not new_total:
-                new_total = 0
-            book.current_balance = new_total
-            book.last_log = new_last_log
-            book.save()
+        remove_invoice_pdfs(invoice_obj)
         invoice_obj.delete()
         
         if not len(request.POST.getlist('move-to-quotation')):
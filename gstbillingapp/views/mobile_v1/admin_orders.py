@@ -12,7 +12,9 @@ import num2words
 import json
 
 # Local imports
-from ...models import Quotation, Customer, Product, Invoice, Inventory, InventoryLog, UserProfile
+from ...models import Quotation, Customer, Product, Invoice, UserProfile
+from ...utils import allocate_document_number
+from ...utils import deduct_inventory_for_invoice
 
 
 # @login_required
@@ -93,17 +95,17 @@ def admin_orders_list(request):
     quotations_list = []
     for quotation in queryset[start_idx:end_idx]:
         try:
-            quotation_data = json.loads(quotation.quotation_json)
-            
-            total_amount = float(quotation_data.get('invoice_total_amt_with_gst', 0))
-            total_qty = sum(float(item.get('invoice_qty', 0)) for item in quotation_data.get('items', []))
-            item_count = len(quotation_data.get('items', []))
+            total_amount = quotation.quotation_total_amt_with_gst
+            total_qty = quotation.quotation_total_qty
+            item_count = quotation.quotation_item_count
             
             customer_name = "Unknown Customer"
             if quotation.quotation_customer:
                 customer_name = quotation.quotation_customer.customer_name
-            elif quotation_data.get('customer_name'):
-                customer_name = quotation_data.get('customer_name')
+            else:
+                quotation_data = json.loads(quotation.quotation_json)
+                if quotation_data.get('customer_name'):
+                    customer_name = quotation_data.get('customer_name')
             
             # Get business brand/title
             business_brand = "Unknown Brand"
@@ -476,8 +478,7 @@ def admin_order_convert_to_invoice(request, quotation_id):
             quotation_data = json.loads(quotation.quotation_json)
             
             # Get next invoice number
-            last_invoice = Invoice.objects.filter(user=user).order_by('-invoice_number').first()
-            next_invoice_number = (last_invoice.invoice_number + 1) if last_invoice else 1
+            next_invoice_number = allocate_document_number('INVOICE', user, quotation.is_gst)
             
             # Add notes to quotation data if provided
             if additional_notes:
@@ -496,31 +497,11 @@ def admin_order_convert_to_invoice(request, quotation_id):
                 is_gst=quotation.is_gst
             )
             
-            # Update inventory for each item
-            for item in quotation_data.get('items', []):
-                product_model = item.get('invoice_model_no')
-                qty = float(item.get('invoice_qty', 0))
-                
-                if product_model and qty > 0:
-                    try:
-                        product = Product.objects.filter(user=user, model_no=product_model).first()
-                        if product:
-                            # Get or create inventory
-                            inventory = Inventory.objects.filter(product=product, user=user).first()
-                            if inventory:
-                                old_stock = inventory.current_stock
-                                inventory.current_stock -= qty
-                                inventory.save()
-                                
-                                # Create inventory log
-                                InventoryLog.objects.create(
-                                    inventory=inventory,
-                                    change_type=1,  # Sale/Outward
-                                    change_amount=-qty,
-                                    description=f'Invoice #{next_invoice_number} - Order #{quotation.quotation_number}'
-                                )
-                    except Exception as e:
-                        print(f"Error updating inventory for {product_model}: {e}")
+            # Update inventory for all items in one batch
+            deduct_inventory_for_invoice(
+                invoice,
+                description=f'Invoice #{next_invoice_number} - Order #{quotation.quotation_number}'
+            )
             
             # Update quotation
             quotation.status = 'CONVERTED'
@@ -1,7 +1,7 @@
 # Django imports
 from django.forms import FloatField
 from django.utils import timezone
-from django.http import JsonResponse
+from django.http import JsonResponse, FileResponse
 from django.core.paginator import Paginator
 from django.template.loader import render_to_string
 from django.shortcuts import get_object_or_404, render
@@ -10,14 +10,14 @@ from django.db.models import (
     F,Q, CharField, Min, Max, Count, ExpressionWrapper
 )
 from django.db.models.functions import (
-    Abs, Cast
+    Cast
 )
 # Models
 from ...models import (
     Customer, UserProfile, Invoice,
     Book, BookLog, ExpenseTracker, Product,
     PurchaseLog, VendorPurchase, Inventory,
-    InventoryLog, Notification
+    InventoryLog, Notification, LedgerMonthlyRollup
 )
 
 # Python imports
@@ -27,8 +27,14 @@ from urllib.parse import urlencode
 
 # Utility functions
 from ...utils import (
-    parse_code_GS
+    parse_code_GS,
+    ledger_rollup_totals,
+    annotate_balance_after,
+    check_low_stock
 )
+from ...invoice_pdf import get_invoice_pdf
+from ...aging import fifo_debits
+from ...analytics_cache import single_flight, analytics_cache_key, request_params
 
 # ================= Customer =============================
 def customer_profile(request):
@@ -92,12 +98,7 @@ def customer_invoices(request):
 
     # Add the invoice_total_amt_with_gst to each invoice object
     for invoice in invoices:
-        # assuming invoice_json is stored as a JSON string
-        if isinstance(invoice.invoice_json, str):
-            invoice_data = json.loads(invoice.invoice_json)
-        else:
-            invoice_data = invoice.invoice_json  # if it's already a dict
-        invoice.total_amt_with_gst = invoice_data.get('invoice_total_amt_with_gst', 0)
+        invoice.total_amt_with_gst = invoice.invoice_total_amt_with_gst
     
     context.update({
         'users': user,
@@ -199,6 +200,9 @@ def customer_books(request):
 
     paginator = Paginator(books_qs, 4)
     books = paginator.get_page(page_number)
+    # Historical balance after each entry, from the balance checkpoints
+    books.object_list = list(books.object_list)
+    annotate_balance_after(books.object_list)
 
     context.update({
         'users': user,
@@ -252,11 +256,13 @@ def customer_home(request):
         year = now.year
     # Format as MM/YYYY
     context['total_last_month_name'] = f"{last_month:02d}/{year}"
-    years = BookLog.objects.filter(
-        parent_book__user__id=user_id,
-        parent_book__customer__id=customer_id,
+    # Totals come from the monthly ledger rollups of the customer's active logs
+    customer_rollups = LedgerMonthlyRollup.objects.filter(
+        user__id=user_id,
+        customer__id=customer_id,
         is_active=True
-    ).aggregate(min_year=Min('date__year'),max_year=Max('date__year'))
+    )
+    years = customer_rollups.aggregate(min_year=Min('year'), max_year=Max('year'))
     if years['min_year'] == years['max_year']:
         context['start_end_year'] = f"{years['min_year']}"
     else:
@@ -268,16 +274,17 @@ def customer_home(request):
         is_active=True
     ).order_by('-date')
 
-    totals = book_logs.aggregate(
-        total_paid=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        total_purchased=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-        total_returned=Sum(Case(When(change_type=2, then=F('change')), output_field=FloatField())),
-        total_others=Sum(Case(When(change_type=3, then=F('change')), output_field=FloatField())),
-        paid_count=Count(Case(When(change_type=0, then=1), output_field=IntegerField())),
-        purchased_count=Count(Case(When(change_type=1, then=1), output_field=IntegerField())),
-        returned_count=Count(Case(When(change_type=2, then=1), output_field=IntegerField())),
-        others_count=Count(Case(When(change_type=3, then=1), output_field=IntegerField())),
-    )
+    rollup_totals = ledger_rollup_totals(customer_rollups)
+    totals = {
+        'total_paid': rollup_totals['total_0'],
+        'total_purchased': rollup_totals['total_1'],
+        'total_returned': rollup_totals['total_2'],
+        'total_others': rollup_totals['total_3'],
+        'paid_count': rollup_totals['count_0'],
+        'purchased_count': rollup_totals['count_1'],
+        'returned_count': rollup_totals['count_2'],
+        'others_count': rollup_totals['count_3'],
+    }
     overall_payment_percentage = 0
     if totals['total_purchased'] and totals['total_purchased'] != 0:
         overall_payment_percentage = (abs(totals['total_paid'] or 0) / abs(totals['total_purchased'])) * 100
@@ -305,19 +312,13 @@ def customer_home(request):
     current_year = now.year
     current_month = now.month
     # Filter logs for current month
-    current_month_book_logs = BookLog.objects.filter(
-        parent_book__user__id=user_id,
-        parent_book__customer__id=customer_id,
-        is_active=True,
-        date__year=current_year,
-        date__month=current_month
-    ).order_by('-date')
-    current_month_totals = current_month_book_logs.aggregate(
-        current_month_total_paid=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        current_month_total_purchased=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-        current_month_paid_count=Count(Case(When(change_type=0, then=1), output_field=IntegerField())),
-        current_month_purchased_count=Count(Case(When(change_type=1, then=1), output_field=IntegerField())),
-    )
+    rollup_totals = ledger_rollup_totals(customer_rollups.filter(year=current_year, month=current_month))
+    current_month_totals = {
+        'current_month_total_paid': rollup_totals['total_0'],
+        'current_month_total_purchased': rollup_totals['total_1'],
+        'current_month_paid_count': rollup_totals['count_0'],
+        'current_month_purchased_count': rollup_totals['count_1'],
+    }
     current_month_payment_percentage = 0
     if current_month_totals['current_month_total_purchased'] and current_month_totals['current_month_total_purchased'] != 0:
         current_month_payment_percentage = (abs(current_month_totals['current_month_total_paid'] or 0) / abs(current_month_totals['current_month_total_purchased'])) * 100
@@ -336,19 +337,13 @@ def customer_home(request):
     last_month = now.month - 1 if now.month > 1 else 12
     last_month_year = current_year if now.month > 1 else current_year - 1
     # Filter logs for last month
-    last_month_book_logs = BookLog.objects.filter(
-        parent_book__user__id=user_id,
-        parent_book__customer__id=customer_id,
-        is_active=True,
-        date__year=last_month_year,
-        date__month=last_month
-    ).order_by('-date')
-    last_month_totals = last_month_book_logs.aggregate(
-        last_month_total_paid=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        last_month_total_purchased=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-        last_month_paid_count=Count(Case(When(change_type=0, then=1), output_field=IntegerField())),
-        last_month_purchased_count=Count(Case(When(change_type=1, then=1), output_field=IntegerField())),
-    )
+    rollup_totals = ledger_rollup_totals(customer_rollups.filter(year=last_month_year, month=last_month))
+    last_month_totals = {
+        'last_month_total_paid': rollup_totals['total_0'],
+        'last_month_total_purchased': rollup_totals['total_1'],
+        'last_month_paid_count': rollup_totals['count_0'],
+        'last_month_purchased_count': rollup_totals['count_1'],
+    }
     last_month_payment_percentage = 0
     if last_month_totals['last_month_total_purchased'] and last_month_totals['last_month_total_purchased'] != 0:
         last_month_payment_percentage = (abs(last_month_totals['last_month_total_paid'] or 0) / abs(last_month_totals['last_month_total_purchased'])) * 100
@@ -361,30 +356,13 @@ def customer_home(request):
     context['last_month_total_paid'] = abs(int(last_month_total_paid))
     context['last_month_paid_count'] = abs(int(last_month_paid_count))
     context['last_month_purchased_count'] = abs(int(last_month_purchased_count))
-    # Overdue
-    only_purchases = book_logs.filter(change_type=1).annotate(amount_positive=Abs('change')).order_by('date')
-    remaining_amount = abs(total_paid) + abs(total_returned) + abs(total_others)
+    # Overdue: payments settle the oldest purchases first, only the unpaid ones are read
+    credits = abs(total_paid) + abs(total_returned) + abs(total_others)
     show_90_only = request.GET.get('overdue') == '90'
-    filtered_logs = []
-    payment_failed = False
-    for log in only_purchases:
-        # overdue days
-        log.overdue_days = (now - log.date).days if log.date else 0
-        invoice_amount = log.amount_positive
-
-        if not payment_failed and remaining_amount >= invoice_amount:
-            # covered
-            remaining_amount -= invoice_amount
-            continue
-
-        # once failed, everything is overdue
-        payment_failed = True
-        log.remaining_amount = remaining_amount
-        log.balance_after = abs(remaining_amount - invoice_amount)
-        log.payment_pending = True
-        if show_90_only and log.overdue_days < 90:
-            continue
-        filtered_logs.append(log)
+    filtered_logs = [
+        log for log in fifo_debits(book_logs.select_related('associated_invoice'), credits, now=now)
+        if not (show_90_only and log.overdue_days < 90)
+    ]
 
     params = request.GET.copy()
     params_overdue_90 = params.copy()
@@ -427,6 +405,20 @@ def customer_invoice_viewer(request, invoice_id):
     context['user_profile'] = user_profile
     return render(request, 'mobile_v1/customer/invoice_printer.html', context)
 
+
+def customer_invoice_pdf(request, invoice_id):
+    cid_data = parse_code_GS(request.GET.get('cid') or '')
+    if not cid_data:
+        return JsonResponse({'success': False, 'message': 'Invalid customer code'}, status=400)
+
+    invoice_obj = get_object_or_404(Invoice, user__id=cid_data.get('GS'), id=invoice_id,
+                                    invoice_customer__id=cid_data.get('C'))
+    user_profile = get_object_or_404(UserProfile.objects.select_related('bankdetails'), user__id=cid_data.get('GS'))
+    pdf_path = get_invoice_pdf(invoice_obj, user_profile)
+    return FileResponse(open(pdf_path, 'rb'), content_type='application/pdf',
+                        filename=f'invoice_{invoice_obj.invoice_number}.pdf',
+                        as_attachment=bool(request.GET.get('download')))
+
 def customers(request):
     from django.core.paginator import Paginator
     from django.http import JsonResponse
@@ -571,23 +563,16 @@ def invoices(request):
             Q(invoice_customer__customer_phone__icontains=search_query)
         )
     
-    # Add invoice amounts
-    invoices_with_amounts = []
-    for invoice in invoices_qs:
-        try:
-            invoice_data = json.loads(invoice.invoice_json)
-            invoice.amount = invoice_data.get('invoice_total_amt_with_gst', 0)
-        except:
-            invoice.amount = 0
-        invoices_with_amounts.append(invoice)
+    # Invoice amounts come from the materialized total column
+    invoices_qs = invoices_qs.defer('invoice_json').annotate(amount=F('invoice_total_amt_with_gst'))
     
     # Pagination
-    paginator = Paginator(invoices_with_amounts, 15)
+    paginator = Paginator(invoices_qs, 15)
     page_obj = paginator.get_page(page_number)
     
     # Calculate totals for current filtered results
-    total_amount = sum(inv.amount for inv in invoices_with_amounts)
-    total_count = len(invoices_with_amounts)
+    total_amount = invoices_qs.aggregate(total=Sum('invoice_total_amt_with_gst'))['total'] or 0
+    total_count = paginator.count
     
     context.update({
         'users': users,
@@ -1230,30 +1215,13 @@ def purchase_logs_overdue(request):
     if total_purchased > 0:
         overall_payment_percentage = min(100, (total_paid / total_purchased) * 100)
 
-    # Overdue
-    only_purchases = only_purchases = purchases_qs.filter(change_type=1).annotate(amount_positive=Abs('change')).order_by('date')
-    remaining_amount = abs(total_paid) + abs(total_returned) + abs(total_others)
+    # Overdue: payments settle the oldest purchases first, only the unpaid ones are read
+    credits = abs(total_paid) + abs(total_returned) + abs(total_others)
     show_80_only = request.GET.get('overdue') == '80'
-    filtered_logs = []
-    payment_failed = False
-    for log in only_purchases:
-        # overdue days
-        log.overdue_days = (now - log.date).days if log.date else 0
-        invoice_amount = log.amount_positive
-
-        if not payment_failed and remaining_amount >= invoice_amount:
-            # covered
-            remaining_amount -= invoice_amount
-            continue
-
-        # once failed, everything is overdue
-        payment_failed = True
-        log.remaining_amount = remaining_amount
-        log.balance_after = abs(remaining_amount - invoice_amount)
-        log.payment_pending = True
-        if show_80_only and log.overdue_days < 80:
-            continue
-        filtered_logs.append(log)
+    filtered_logs = [
+        log for log in fifo_debits(purchases_qs, credits, now=now)
+        if not (show_80_only and log.overdue_days < 80)
+    ]
 
     params = request.GET.copy()
     params_overdue_80 = params.copy()
@@ -1471,6 +1439,13 @@ def products(request):
 
 def home(request):
     """Admin/Employee Dashboard Home Page with comprehensive business overview"""
+    # Staff opening the dashboard together share one computation of it
+    context = single_flight(analytics_cache_key('all', 'mobile_home', request_params(request)),
+                            lambda: _home_context(request))
+    return render(request, 'mobile_v1/home.html', context)
+
+
+def _home_context(request):
     from datetime import datetime, timedelta
     from django.db.models import Sum, Count
     
@@ -1494,15 +1469,20 @@ def home(request):
     # Total users
     total_users = users.count()
     
+    # Book log totals come from the monthly ledger rollups
+    book_rollups = LedgerMonthlyRollup.objects.all()
+    if users_filter:
+        book_rollups = book_rollups.filter(user__id__in=user_ids)
+
     # === CURRENT MONTH STATS ===
     current_month_invoices = Invoice.objects.filter(invoice_date__gte=current_month_start)
-    current_month_books = BookLog.objects.filter(date__date__gte=current_month_start)
+    current_month_books = book_rollups.filter(
+        Q(year__gt=current_month_start.year) | Q(year=current_month_start.year, month__gte=current_month_start.month))
     current_month_expenses = ExpenseTracker.objects.filter(date__date__gte=current_month_start)
     current_month_purchases = PurchaseLog.objects.filter(date__date__gte=current_month_start)
     
     if users_filter:
         current_month_invoices = current_month_invoices.filter(user__id__in=user_ids)
-        current_month_books = current_month_books.filter(parent_book__user__id__in=user_ids)
         current_month_expenses = current_month_expenses.filter(user__id__in=user_ids)
         current_month_purchases = current_month_purchases.filter(user__id__in=user_ids)
 
@@ -1510,12 +1490,9 @@ def home(request):
     current_month_invoice_count = current_month_invoices.count()
     
     # Current month book log totals
-    current_book_stats = current_month_books.aggregate(
-        payments=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        purchases=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-    )
-    current_month_purchases_amount = abs(current_book_stats['purchases'] or 0)
-    current_month_payments_amount = abs(current_book_stats['payments'] or 0)
+    current_book_stats = ledger_rollup_totals(current_month_books)
+    current_month_purchases_amount = abs(current_book_stats['total_1'])
+    current_month_payments_amount = abs(current_book_stats['total_0'])
     
     # Current month expenses
     current_expense_total = current_month_expenses.aggregate(total=Sum('amount'))['total'] or 0
@@ -1531,13 +1508,12 @@ def home(request):
     
     # === LAST MONTH STATS ===
     last_month_invoices = Invoice.objects.filter(invoice_date__gte=last_month_start, invoice_date__lt=current_month_start)
-    last_month_books = BookLog.objects.filter(date__date__gte=last_month_start, date__date__lt=current_month_start)
+    last_month_books = book_rollups.filter(year=last_month_start.year, month=last_month_start.month)
     last_month_expenses = ExpenseTracker.objects.filter(date__date__gte=last_month_start, date__date__lt=current_month_start)
     last_month_purchases = PurchaseLog.objects.filter(date__date__gte=last_month_start, date__date__lt=current_month_start)
     
     if users_filter:
         last_month_invoices = last_month_invoices.filter(user__id__in=user_ids)
-        last_month_books = last_month_books.filter(parent_book__user__id__in=user_ids)
         last_month_expenses = last_month_expenses.filter(user__id__in=user_ids)
         last_month_purchases = last_month_purchases.filter(user__id__in=user_ids)
 
@@ -1545,12 +1521,9 @@ def home(request):
     last_month_invoice_count = last_month_invoices.count()
     
     # Last month book log totals
-    last_book_stats = last_month_books.aggregate(
-        payments=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        purchases=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-    )
-    last_month_purchases_amount = abs(last_book_stats['purchases'] or 0)
-    last_month_payments_amount = abs(last_book_stats['payments'] or 0)
+    last_book_stats = ledger_rollup_totals(last_month_books)
+    last_month_purchases_amount = abs(last_book_stats['total_1'])
+    last_month_payments_amount = abs(last_book_stats['total_0'])
     
     # Last month expenses
     last_expense_total = last_month_expenses.aggregate(total=Sum('amount'))['total'] or 0
@@ -1567,25 +1540,11 @@ def home(request):
         total_invoices = Invoice.objects.filter(user__id__in=user_ids).count()
     
     # Total book logs
-    all_book_stats = BookLog.objects.aggregate(
-        purchases=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-        payments=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        returns=Sum(Case(When(change_type=2, then=F('change')), output_field=FloatField())),
-        others=Sum(Case(When(change_type=3, then=F('change')), output_field=FloatField())),
-    )
-
-    if users_filter:
-        all_book_stats = BookLog.objects.filter(parent_book__user__id__in=user_ids).aggregate(
-            purchases=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-            payments=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-            returns=Sum(Case(When(change_type=2, then=F('change')), output_field=FloatField())),
-            others=Sum(Case(When(change_type=3, then=F('change')), output_field=FloatField())),
-        )
-
-    total_purchases = abs(all_book_stats['purchases'] or 0)
-    total_payments = abs(all_book_stats['payments'] or 0)
-    total_returns = abs(all_book_stats['returns'] or 0)
-    total_others = abs(all_book_stats['others'] or 0)
+    all_book_stats = ledger_rollup_totals(book_rollups)
+    total_purchases = abs(all_book_stats['total_1'])
+    total_payments = abs(all_book_stats['total_0'])
+    total_returns = abs(all_book_stats['total_2'])
+    total_others = abs(all_book_stats['total_3'])
     total_balance = total_purchases - (total_payments + total_returns + total_others)
     
     # Total expenses
@@ -1596,20 +1555,20 @@ def home(request):
         total_expenses = ExpenseTracker.objects.filter(user__id__in=user_ids).aggregate(total=Sum('amount'))['total'] or 0
         total_expense_count = ExpenseTracker.objects.filter(user__id__in=user_ids).count()
     
-    # Inventory stats
+    # Inventory stats; low stock is read from the per tenant counters kept by check_low_stock
     inventory_stats = Inventory.objects.aggregate(
         total_stock=Sum('current_stock'),
-        low_stock_count=Count(Case(When(current_stock__gt=0, current_stock__lte=F('alert_level'), then=1))),
         out_of_stock_count=Count(Case(When(current_stock=0, then=1)))
     )
+    low_stock_stats = UserProfile.objects.aggregate(low_stock_count=Sum('low_stock_count'))
     if users_filter:
         inventory_stats = Inventory.objects.filter(product__user__id__in=user_ids).aggregate(
             total_stock=Sum('current_stock'),
-            low_stock_count=Count(Case(When(current_stock__gt=0, current_stock__lte=F('alert_level'), then=1))),
             out_of_stock_count=Count(Case(When(current_stock=0, then=1)))
         )
+        low_stock_stats = UserProfile.objects.filter(user__id__in=user_ids).aggregate(low_stock_count=Sum('low_stock_count'))
     total_stock = inventory_stats['total_stock'] or 0
-    low_stock_count = inventory_stats['low_stock_count'] or 0
+    low_stock_count = low_stock_stats['low_stock_count'] or 0
     out_of_stock_count = inventory_stats['out_of_stock_count'] or 0
     
     # Products with discount
@@ -1680,16 +1639,15 @@ def home(request):
         'out_of_stock_count': out_of_stock_count,
         'discount_products': discount_products,
         
-        # Recent activity
-        'recent_invoices': recent_invoices,
-        'recent_expenses': recent_expenses,
+        # Recent activity, evaluated so the context can be shared between requests
+        'recent_invoices': list(recent_invoices),
+        'recent_expenses': list(recent_expenses),
 
         # Brands
-        'users': users,
+        'users': list(users),
         'users_filter': users_filter,
     })
-    
-    return render(request, 'mobile_v1/home.html', context)
+    return context
 
 def product_inventory_stock_add(request):
     brand = request.GET.get('brand')
@@ -1716,7 +1674,8 @@ def product_inventory_stock_add(request):
             if stock_alert.isdigit():
                 inventory.alert_level = int(stock_alert)
             if only_alert:
-                inventory.save()
+                inventory.save(update_fields=['alert_level'])
+                check_low_stock(inventory.user, [inventory.product_id])
                 return JsonResponse({'status': 'success', 'message': 'Alert level updated successfully.'})
             added_stock = int(added_stock)
             if reduce_stock:
@@ -1724,7 +1683,7 @@ def product_inventory_stock_add(request):
             if added_stock == 0:
                 return JsonResponse({'status': 'error', 'message': 'Invalid stock quantity.'})
             inventory.current_stock += added_stock
-            inventory.save()
+            inventory.save(update_fields=['current_stock', 'alert_level'])
             # Log the inventory addition
             log_entry = InventoryLog(
                 user = inventory.user,
@@ -1733,6 +1692,7 @@ def product_inventory_stock_add(request):
                 description = description
             )
             log_entry.save()
+            check_low_stock(inventory.user, [inventory.product_id])
 
             return JsonResponse({'status': 'success', 'message': 'Stock added successfully.'})
         except ValueError:
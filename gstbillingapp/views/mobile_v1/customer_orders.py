@@ -2,7 +2,7 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db.models import Max, Q
+from django.db.models import Q
 from django.db import transaction
 from django.utils import timezone
 from django.contrib.auth.models import User
@@ -19,6 +19,7 @@ import num2words
 
 # Utility functions
 from ...utils import parse_code_GS
+from ...utils import allocate_document_number
 
 
 # ================= Customer Ordering System =============================
@@ -163,14 +164,6 @@ def customer_create_order(request):
         # Determine if GST quotation
         is_gst = customer.customer_gst is not None and customer.customer_gst.strip() != ''
         
-        # Get next quotation number
-        max_quotation_number = Quotation.objects.filter(
-            user=business_user, 
-            is_gst=is_gst
-        ).aggregate(Max('quotation_number'))['quotation_number__max']
-        
-        next_quotation_number = (max_quotation_number or 0) + 1
-        
         # Build quotation JSON
         quotation_data = {
             'customer_name': customer.customer_name,
@@ -243,6 +236,8 @@ def customer_create_order(request):
         valid_until = datetime.date.today() + datetime.timedelta(days=30)
         
         with transaction.atomic():
+            # Get next quotation number
+            next_quotation_number = allocate_document_number('QUOTATION', business_user, is_gst)
             new_quotation = Quotation(
                 user=business_user,
                 quotation_number=next_quotation_number,
@@ -335,26 +330,15 @@ def customer_orders_list(request):
             created_by_customer=True
         ).order_by('-created_at')
         
-        # Parse quotation data for display
+        # Totals come from the materialized total columns
         quotations_list = []
-        for quotation in quotations:
-            try:
-                quotation_data = json.loads(quotation.quotation_json)
-                items = quotation_data.get('items', [])
-                total_qty = sum(float(item.get('invoice_qty', 0)) for item in items)
-                quotations_list.append({
-                    'quotation': quotation,
-                    'total_amount': quotation_data.get('invoice_total_amt_with_gst', 0),
-                    'item_count': len(items),
-                    'total_qty': total_qty
-                })
-            except:
-                quotations_list.append({
-                    'quotation': quotation,
-                    'total_amount': 0,
-                    'item_count': 0,
-                    'total_qty': 0
-                })
+        for quotation in quotations.defer('quotation_json'):
+            quotations_list.append({
+                'quotation': quotation,
+                'total_amount': quotation.quotation_total_amt_with_gst,
+                'item_count': quotation.quotation_item_count,
+                'total_qty': quotation.quotation_total_qty
+            })
         
         context['customer'] = customer
         context['quotations_list'] = quotations_list
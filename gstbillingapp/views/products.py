@@ -11,7 +11,7 @@ from ..models import (
 )
 # Utility functions
 from ..utils import (
-    create_inventory, add_stock_to_inventory
+    create_inventory, add_stock_to_inventory, check_low_stock
 )
 # Forms
 from ..forms import ProductForm
@@ -379,6 +379,7 @@ def product_aggrid_update(request):
                         alert_level=0
                     )
                 
+                updated_fields = []
                 if 'current_stock' in data:
                     old_stock = inventory.current_stock
                     new_stock = int(data['current_stock'])
@@ -397,13 +398,17 @@ def product_aggrid_update(request):
                         inventory.current_stock = new_stock
                         inventory.last_log = log
                         inventory_updated = True
+                        updated_fields += ['current_stock', 'last_log']
                 
                 if 'alert_level' in data:
                     inventory.alert_level = int(data['alert_level'])
                     inventory_updated = True
+                    updated_fields.append('alert_level')
                 
                 if inventory_updated:
-                    inventory.save()
+                    # Only the edited fields, so the low stock flags kept by check_low_stock are not overwritten
+                    inventory.save(update_fields=updated_fields)
+                    check_low_stock(request.user, [product.id])
             
             return JsonResponse({
                 'success': True,
@@ -1,8 +1,7 @@
 # Django imports
-from django.utils import timezone
 from django.contrib import messages
 from django.http import JsonResponse
-from django.db.models.functions import Abs, Cast
+from django.db.models.functions import Cast
 from django.contrib.auth.decorators import login_required
 from django.db.models import Sum, Case, When, FloatField, F, Q
 from django.shortcuts import render, redirect, get_object_or_404
@@ -16,6 +15,9 @@ from ..models import (
 from ..forms import (
     PurchaseLogForm
 )
+
+# Utility functions
+from ..aging import fifo_debits, ledger_credits
 # Third-party libraries
 import num2words
 import json
@@ -64,54 +66,22 @@ def purchases_logs_overdue(request):
 
 @login_required
 def purchases_logs_overdue_api(request):
-    purchases = (
-        PurchaseLog.objects
-        .filter(user=request.user)
-        .order_by('date')
-    )
-    totals = purchases.aggregate(
-        total_paid=Sum(Case(When(change_type=0, then=F('change')), output_field=FloatField())),
-        total_purchased=Sum(Case(When(change_type=1, then=F('change')), output_field=FloatField())),
-        total_returned=Sum(Case(When(change_type=2, then=F('change')), output_field=FloatField())),
-        total_others=Sum(Case(When(change_type=3, then=F('change')), output_field=FloatField())),
-    )
-    total_paid = abs(totals['total_paid'] or 0)
-    total_returned = abs(totals['total_returned'] or 0)
-    total_others = abs(totals['total_others'] or 0)
-    
-    now = timezone.now()
+    purchases = PurchaseLog.objects.filter(user=request.user)
+    # ?pending=1 returns only the unpaid purchases, read straight from the running totals
+    pending_only = request.GET.get('pending') == '1'
+    logs = fifo_debits(purchases, ledger_credits(purchases), pending_only=pending_only)
 
-    only_purchases = purchases.filter(change_type=1).annotate(amount_positive=Abs('change')).order_by('date')
-    remaining_amount = abs(total_paid) + abs(total_returned) + abs(total_others)
     result = []
-    first_overdue_found = False
     first_overdue_id = None
-    payment_failed = False
-    for log in only_purchases:
-        # overdue days
-        log.overdue_days = (now - log.date).days if log.date else 0
-        invoice_amount = log.amount_positive
-
-        if not payment_failed and remaining_amount >= invoice_amount:
-            # covered
-            remaining_amount -= invoice_amount
-            log.payment_pending = False
-        else:
-            # once failed, everything is overdue
-            if not first_overdue_found:
-                first_overdue_found = True
-                first_overdue_id = log.id
-            payment_failed = True
-            log.remaining_amount = remaining_amount
-            log.balance_after = abs(remaining_amount - invoice_amount)
-            log.payment_pending = True
-
+    for log in logs:
+        if log.payment_pending and first_overdue_id is None:
+            first_overdue_id = log.id
         result.append({
             'id': log.id,
             'date': log.date.strftime('%d-%m-%Y') if log.date else '',
             'category': log.category,
             'reference': log.reference,
-            'amount': invoice_amount,
+            'amount': log.amount_positive,
             'overdue_days': log.overdue_days,
             'payment_pending': log.payment_pending,
             'remaining_amount': log.remaining_amount if log.payment_pending else 0,
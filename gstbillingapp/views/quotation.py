@@ -1,6 +1,6 @@
 # Django imports
 from django.contrib import messages
-from django.db.models import Max
+from django.db.models import Sum
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render, redirect, get_object_or_404
@@ -16,8 +16,11 @@ from ..utils import (
     invoice_data_processor,
     update_products_from_invoice,
     update_inventory,
-    auto_deduct_book_from_invoice
+    auto_deduct_book_from_invoice,
+    peek_document_number,
+    allocate_document_number
 )
+from ..datatables import cached_count, filtered_count, datatables_page
 
 # Third-party libraries
 import json
@@ -42,29 +45,9 @@ def quotation_create(request):
 
     context = {}
     
-    # Get next quotation numbers
-    context['non_gst_quotation_number'] = Quotation.objects.filter(
-        user=request.user, is_gst=False
-    ).aggregate(Max('quotation_number'))['quotation_number__max']
-    if not context['non_gst_quotation_number']:
-        context['non_gst_quotation_number'] = 1
-    else:
-        context['non_gst_quotation_number'] += 1
-
-    # GST quotation numbers (shared across same GST)
-    max_quotation_number = []
-    user_profiles = UserProfile.objects.filter(business_gst=user_profile.business_gst)
-    for profile in user_profiles:
-        max_num = Quotation.objects.filter(
-            user=profile.user, is_gst=True
-        ).aggregate(Max('quotation_number'))['quotation_number__max']
-        max_quotation_number.append(max_num)
-    max_quotation_number = [num for num in max_quotation_number if num is not None]
-
-    if max_quotation_number:
-        context['default_quotation_number'] = max(max_quotation_number) + 1
-    else:
-        context['default_quotation_number'] = 1
+    # Get next quotation numbers (GST quotation numbers are shared across same GST)
+    context['non_gst_quotation_number'] = peek_document_number('QUOTATION', request.user, is_gst=False)
+    context['default_quotation_number'] = peek_document_number('QUOTATION', request.user, is_gst=True)
 
     # Add template-compatible variable names
     context['default_invoice_number'] = context['default_quotation_number']
@@ -153,19 +136,22 @@ def quotation_create(request):
         else:
             valid_until_date = None
         
-        new_quotation = Quotation(
-            user=request.user,
-            quotation_number=int(quotation_data['invoice-number']),  # Reusing form field name
-            quotation_date=datetime.datetime.strptime(quotation_data['invoice-date'], '%Y-%m-%d'),
-            valid_until=valid_until_date,
-            quotation_customer=customer,
-            quotation_json=quotation_data_processed_json,
-            is_gst=is_gst,
-            status='DRAFT',
-            created_by_customer=False,
-            customer_details_modified=is_modified_customer
-        )
-        new_quotation.save()
+        with transaction.atomic():
+            quotation_number = allocate_document_number('QUOTATION', request.user, is_gst,
+                                                        requested=int(quotation_data['invoice-number']))  # Reusing form field name
+            new_quotation = Quotation(
+                user=request.user,
+                quotation_number=quotation_number,
+                quotation_date=datetime.datetime.strptime(quotation_data['invoice-date'], '%Y-%m-%d'),
+                valid_until=valid_until_date,
+                quotation_customer=customer,
+                quotation_json=quotation_data_processed_json,
+                is_gst=is_gst,
+                status='DRAFT',
+                created_by_customer=False,
+                customer_details_modified=is_modified_customer
+            )
+            new_quotation.save()
 
         messages.success(request, f'Quotation #{new_quotation.quotation_number} created successfully')
         return redirect('quotation_viewer', quotation_id=new_quotation.id)
@@ -261,11 +247,10 @@ def quotations_ajax(request):
                 Q(quotation_customer__customer_name__icontains=search_value)
             )
         
-        # Total records
-        total_records = Quotation.objects.filter(user=request.user).count()
-        
-        # Filtered records count
-        filtered_records = queryset.count()
+        # Total records (cached, approximate) and filtered records count
+        base_queryset = Quotation.objects.filter(user=request.user)
+        total_records = cached_count(base_queryset)
+        filtered_records = filtered_count(queryset, base_queryset, total_records)
         
         # Ordering
         order_columns = ['quotation_number', 'quotation_date', 'quotation_customer__customer_name', 'status']
@@ -273,23 +258,16 @@ def quotations_ajax(request):
             order_by = order_columns[order_column_index]
             if order_direction == 'desc':
                 order_by = '-' + order_by
-            queryset = queryset.order_by(order_by)
+            ordering = [order_by, '-id']
         else:
-            queryset = queryset.order_by('-id')
+            ordering = ['-id']
         
-        # Calculate total amount
-        total_quotation_amount = 0.0
-        quotation_jsons = queryset.values_list('quotation_json', flat=True)
-        for quotation_json_str in quotation_jsons:
-            try:
-                quotation_json = json.loads(quotation_json_str)
-                quotation_amount = float(quotation_json.get('invoice_total_amt_with_gst', 0))
-                total_quotation_amount += quotation_amount
-            except Exception:
-                pass
+        # Calculate total amount in SQL from the materialized total column
+        total_quotation_amount = queryset.aggregate(
+            total=Sum('quotation_total_amt_with_gst'))['total'] or 0.0
         
-        # Pagination
-        queryset = queryset[start:start + length]
+        # Pagination (keyset when possible)
+        queryset, next_cursor = datatables_page(request, queryset.defer('quotation_json'), ordering, start, length)
         
         # Prepare data
         data = []
@@ -307,11 +285,7 @@ def quotations_ajax(request):
                 customer_html = '<span class="text-danger">N/A</span>'
 
             # Quotation Amount
-            try:
-                quotation_json = json.loads(quotation.quotation_json)
-                quotation_amount = float(quotation_json.get('invoice_total_amt_with_gst', 0))
-            except Exception:
-                quotation_amount = 0.0
+            quotation_amount = quotation.quotation_total_amt_with_gst
 
             # Status badge
             status_badges = {
@@ -358,6 +332,7 @@ def quotations_ajax(request):
             'recordsTotal': total_records,
             'recordsFiltered': filtered_records,
             'data': data,
+            'next_cursor': next_cursor,
             'total_quotation_amount': total_quotation_amount
         })
     except Exception as e:
@@ -508,33 +483,8 @@ def quotation_convert_to_invoice(request, quotation_id):
         # Parse quotation data
         quotation_data = json.loads(quotation.quotation_json)
         
-        # Get next invoice number
-        user_profile = get_object_or_404(UserProfile, user=request.user)
-        
-        if quotation.is_gst:
-            # Get max invoice number across same GST
-            max_invoice_number = []
-            user_profiles = UserProfile.objects.filter(business_gst=user_profile.business_gst)
-            for profile in user_profiles:
-                max_num = Invoice.objects.filter(
-                    user=profile.user, is_gst=True
-                ).aggregate(Max('invoice_number'))['invoice_number__max']
-                max_invoice_number.append(max_num)
-            max_invoice_number = [num for num in max_invoice_number if num is not None]
-            
-            if max_invoice_number:
-                next_invoice_number = max(max_invoice_number) + 1
-            else:
-                next_invoice_number = 1
-        else:
-            # Non-GST invoice
-            next_invoice_number = Invoice.objects.filter(
-                user=request.user, is_gst=False
-            ).aggregate(Max('invoice_number'))['invoice_number__max']
-            if not next_invoice_number:
-                next_invoice_number = 1
-            else:
-                next_invoice_number += 1
+        # Get next invoice number (GST invoices are shared across same GST)
+        next_invoice_number = allocate_document_number('INVOICE', request.user, quotation.is_gst)
         
         # Create invoice
         new_invoice = Invoice(
@@ -612,33 +562,8 @@ def quotation_reconvert_to_invoice(request, quotation_id):
         # Parse quotation data
         quotation_data = json.loads(quotation.quotation_json)
         
-        # Get next invoice number
-        user_profile = get_object_or_404(UserProfile, user=request.user)
-        
-        if quotation.is_gst:
-            # Get max invoice number across same GST
-            max_invoice_number = []
-            user_profiles = UserProfile.objects.filter(business_gst=user_profile.business_gst)
-            for profile in user_profiles:
-                max_num = Invoice.objects.filter(
-                    user=profile.user, is_gst=True
-                ).aggregate(Max('invoice_number'))['invoice_number__max']
-                max_invoice_number.append(max_num)
-            max_invoice_number = [num for num in max_invoice_number if num is not None]
-            
-            if max_invoice_number:
-                next_invoice_number = max(max_invoice_number) + 1
-            else:
-                next_invoice_number = 1
-        else:
-            # Non-GST invoice
-            next_invoice_number = Invoice.objects.filter(
-                user=request.user, is_gst=False
-            ).aggregate(Max('invoice_number'))['invoice_number__max']
-            if not next_invoice_number:
-                next_invoice_number = 1
-            else:
-                next_invoice_number += 1
+        # Get next invoice number (GST invoices are shared across same GST)
+        next_invoice_number = allocate_document_number('INVOICE', request.user, quotation.is_gst)
         
         # Create invoice
         new_invoice = Invoice(
@@ -5,8 +5,11 @@ from reportlab.lib.units import mm
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from datetime import date, timedelta
+import datetime
 import json
 import calendar
+import csv
+import io
 
 from ..models import UserProfile, Customer, Invoice
 
@@ -21,15 +24,35 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import mm
 
-from ..models import Book, BookLog, Customer, UserProfile
+from ..models import Book, Customer, UserProfile
+from ..gst_reports import gstr1_report, gstr1_section_csv, GSTR1_SECTIONS
+from ..aging import customer_aging, vendor_aging, receivables_aging, payables_aging
+from ..models import VendorPurchase
+from ..utils import book_balances_as_of, stock_valuation
+
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.contrib.auth.decorators import login_required
 
 
 def sales_report_pdf(request):
+    """Per customer ledger totals, till now or as on ?as_of=YYYY-MM-DD (end of that day)"""
     user = request.user
     user_profile = UserProfile.objects.get(user=user)
 
     customers = Customer.objects.filter(user=user).order_by("customer_name")
 
+    try:
+        as_of = datetime.datetime.strptime(request.GET.get('as_of', ''), '%Y-%m-%d').date()
+    except ValueError:
+        as_of = None
+    # First book of every customer; totals come from the balance checkpoints in a few queries
+    books = {}
+    for book_id, customer_id in Book.objects.filter(user=user).order_by('-id').values_list('id', 'customer_id'):
+        books[customer_id] = book_id
+    moment = datetime.datetime.combine(as_of + timedelta(days=1), datetime.time.min) if as_of else None
+    book_totals = book_balances_as_of(books.values(), moment)
+
     elements = []
     styles = getSampleStyleSheet()
 
@@ -45,7 +68,8 @@ def sales_report_pdf(request):
 
     # ---------------- RESPONSE ---------------- #
     response = HttpResponse(content_type="application/pdf")
-    response["Content-Disposition"] = 'attachment; filename="sales_report_till_now.pdf"'
+    report_name = f"sales_report_as_on_{as_of}" if as_of else "sales_report_till_now"
+    response["Content-Disposition"] = f'attachment; filename="{report_name}.pdf"'
 
     doc = SimpleDocTemplate(
         response,
@@ -66,7 +90,10 @@ def sales_report_pdf(request):
         )
     )
     elements.append(Spacer(1, 8))
-    elements.append(Paragraph("Sales Report (Till Now)", subtitle_style))
+    if as_of:
+        elements.append(Paragraph(f"Sales Report (As on {as_of.strftime('%d-%m-%Y')})", subtitle_style))
+    else:
+        elements.append(Paragraph("Sales Report (Till Now)", subtitle_style))
     elements.append(Spacer(1, 15))
 
     # ---------------- TOTALS ---------------- #
@@ -77,23 +104,14 @@ def sales_report_pdf(request):
 
     # ---------------- PER CUSTOMER ---------------- #
     for customer in customers:
-        book = Book.objects.filter(user=user, customer=customer).first()
-        if not book:
+        if customer.id not in books:
             continue
 
-        logs = BookLog.objects.filter(parent_book=book, is_active=True)
-
-        paid = purchased = returned = other = 0.0
-
-        for log in logs:
-            if log.change_type == 0:
-                paid += log.change
-            elif log.change_type == 1:
-                purchased += log.change
-            elif log.change_type == 2:
-                returned += log.change
-            elif log.change_type == 3:
-                other += log.change
+        totals = book_totals[books[customer.id]]
+        paid = totals['total_paid']
+        purchased = totals['total_purchased']
+        returned = totals['total_returned']
+        other = totals['total_others']
 
         balance = abs(purchased) - (abs(paid) + abs(returned) + abs(other))
 
@@ -179,3 +197,86 @@ def sales_report_pdf(request):
 
     return response
 
+
+
+@login_required
+def gstr1_report_view(request):
+    """GSTR-1 sections for ?month=YYYY-MM (required) as JSON, or one section as CSV (?format=csv&section=hsn)"""
+    try:
+        period = datetime.datetime.strptime(request.GET.get('month', ''), '%Y-%m')
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'month must be YYYY-MM'}, status=400)
+    export_format = request.GET.get('format', 'json')
+    section = request.GET.get('section', 'hsn')
+
+    report = gstr1_report(request.user, period.year, period.month)
+
+    if export_format == 'csv':
+        if section not in GSTR1_SECTIONS:
+            return JsonResponse({'status': 'error', 'message': f'section must be one of {", ".join(GSTR1_SECTIONS)}'}, status=400)
+        response = HttpResponse(gstr1_section_csv(report, section), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="gstr1_{section}_{report["period"]}.csv"'
+        return response
+    return JsonResponse(report)
+
+
+@login_required
+def aging_report_view(request):
+    """
+    FIFO aging buckets (0-30 / 31-60 / 61-90 / 90+ days) as JSON.
+    ?party=customers (receivables, default) or vendors (payables); &id= for a single customer or vendor.
+    """
+    party = request.GET.get('party', 'customers')
+    party_id = request.GET.get('id', '')
+
+    if party == 'customers':
+        if party_id:
+            customer = get_object_or_404(Customer, user=request.user, id=party_id)
+            return JsonResponse({'customer': customer.customer_name, **customer_aging(request.user, customer)})
+        report = receivables_aging(request.user)
+        names = dict(Book.objects.filter(user=request.user).values_list('id', 'customer__customer_name'))
+        report['partitions'] = [{'book_id': key, 'customer': names.get(key), **value}
+                                for key, value in report['partitions'].items()]
+        return JsonResponse(report)
+
+    if party == 'vendors':
+        if party_id:
+            vendor = get_object_or_404(VendorPurchase, user=request.user, id=party_id)
+            return JsonResponse({'vendor': vendor.vendor_name, **vendor_aging(request.user, vendor)})
+        report = payables_aging(request.user)
+        names = dict(VendorPurchase.objects.filter(user=request.user).values_list('id', 'vendor_name'))
+        report['partitions'] = [{'vendor_id': key, 'vendor': names.get(key), **value}
+                                for key, value in report['partitions'].items()]
+        return JsonResponse(report)
+
+    return JsonResponse({'status': 'error', 'message': 'party must be customers or vendors'}, status=400)
+
+
+INVENTORY_VALUATION_CSV_COLUMNS = ['model_no', 'product_name', 'category', 'stock', 'product_rate_with_gst', 'value']
+
+
+@login_required
+def inventory_valuation_report_view(request):
+    """
+    Stock and value (stock x rate with GST) of every product with category subtotals,
+    now or as on ?as_of=YYYY-MM-DD (end of that day). JSON, or CSV with ?format=csv.
+    """
+    as_of = None
+    if request.GET.get('as_of'):
+        try:
+            as_of = datetime.datetime.strptime(request.GET['as_of'], '%Y-%m-%d').date()
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'as_of must be YYYY-MM-DD'}, status=400)
+    moment = datetime.datetime.combine(as_of + timedelta(days=1), datetime.time.min) if as_of else datetime.datetime.now()
+    report = {'as_of': str(as_of or date.today()), **stock_valuation(request.user, moment)}
+
+    if request.GET.get('format', 'json') == 'csv':
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=INVENTORY_VALUATION_CSV_COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(report['products'])
+        writer.writerow({'model_no': 'TOTAL', 'stock': report['total_stock'], 'value': report['total_value']})
+        response = HttpResponse(output.getvalue(), content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="inventory_valuation_{report["as_of"]}.csv"'
+        return response
+    return JsonResponse(report)